@@ -0,0 +1,62 @@
+"""
+Cold-start check for the headless command line.
+
+Times `python -m quickxrename preview` on an empty directory against a bare
+interpreter start, and checks that PySide6 never gets imported. Exits
+non-zero when the median overhead is above cli.STARTUP_BUDGET_MS.
+
+    python benchmarks/bench_cli_startup.py
+"""
+from __future__ import annotations
+
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from quickxrename.cli import STARTUP_BUDGET_MS  # noqa: E402
+
+RUNS = 15
+
+
+def median_ms(command: list, env: dict) -> float:
+    samples = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        subprocess.run(command, env=env, check=False, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    env = dict(os.environ, PYTHONPATH=SRC, PYTHONDONTWRITEBYTECODE="1")
+    probe = subprocess.run(
+        [sys.executable, "-c", "import sys, quickxrename.__main__, quickxrename.cli; print('PySide6' in sys.modules)"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    if probe.stdout.strip() != "False":
+        print("FAIL: the headless import path loads PySide6")
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        bare = median_ms([sys.executable, "-c", "pass"], env)
+        cli = median_ms([sys.executable, "-m", "quickxrename", "preview", directory, "-p", "x"], env)
+    overhead = cli - bare
+    print(f"interpreter: {bare:.1f} ms  cli preview: {cli:.1f} ms  overhead: {overhead:.1f} ms")
+    print(f"budget: {STARTUP_BUDGET_MS} ms")
+    if overhead > STARTUP_BUDGET_MS:
+        print("FAIL: over budget")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""
+Scaling benchmark for folder-rename path resolution.
+
+Compares the previous linear `startswith` scan over every folder mapping with
+the `FolderMapping` trie on synthetic trees of growing size. Nothing touches
+the filesystem.
+
+    python benchmarks/bench_folder_mapping.py
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from quickxrename.pathmap import FolderMapping  # noqa: E402
+
+LINEAR_LIMIT = 2_000  # the linear scan gets too slow to time beyond this many folders
+
+
+def linear_resolve(path: str, mappings: List[Tuple[str, str]]) -> str:
+    updated = path
+    for old_folder, new_folder in mappings:
+        if updated == old_folder or updated.startswith(old_folder + os.sep):
+            updated = new_folder + updated[len(old_folder):]
+    return updated
+
+
+def synthetic_tree(folders: int, files_per_folder: int, fanout: int = 8) -> Tuple[List[Tuple[str, str]], List[str]]:
+    root = os.sep + "bench"
+    paths = [root]
+    renames: List[Tuple[str, str]] = []
+    for index in range(folders):
+        parent = paths[index // fanout]
+        old = os.path.join(parent, f"dir_{index}")
+        paths.append(old)
+        if index % 2 == 0:
+            renames.append((old, os.path.join(parent, f"DIR_{index}")))
+    files = [os.path.join(folder, f"file_{n}.txt") for folder in paths[1:] for n in range(files_per_folder)]
+    return renames, files
+
+
+def time_linear(renames: List[Tuple[str, str]], files: List[str]) -> float:
+    mappings = sorted(renames, key=lambda x: len(x[0]), reverse=True)
+    start = time.perf_counter()
+    for path in files:
+        linear_resolve(path, mappings)
+    return time.perf_counter() - start
+
+
+def time_trie(renames: List[Tuple[str, str]], files: List[str]) -> float:
+    start = time.perf_counter()
+    mapping = FolderMapping(renames)
+    for path in files:
+        mapping.resolve_parent(path)
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'folders':>8} {'files':>9} {'linear (s)':>11} {'trie (s)':>9} {'speedup':>8}")
+    for folders in (250, 1_000, 2_000, 10_000, 50_000):
+        renames, files = synthetic_tree(folders, files_per_folder=6)
+        trie = time_trie(renames, files)
+        if folders <= LINEAR_LIMIT:
+            linear = time_linear(renames, files)
+            print(f"{folders:>8} {len(files):>9} {linear:>11.3f} {trie:>9.3f} {linear / trie:>7.1f}x")
+        else:
+            print(f"{folders:>8} {len(files):>9} {'-':>11} {trie:>9.3f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
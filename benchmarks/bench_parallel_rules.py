@@ -0,0 +1,59 @@
+"""
+When does the process pool pay off for rule evaluation?
+
+Runs `iter_evaluated` over synthetic names in-process and with the pool
+forced on, for a cheap literal rule and a lookaround-heavy regex. The
+crossover point is what PARALLEL_THRESHOLD should sit above.
+
+    python benchmarks/bench_parallel_rules.py
+"""
+from __future__ import annotations
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from quickxrename.parallel import iter_evaluated  # noqa: E402
+
+RULES = [
+    ("Replace", "_", "-"),
+    ("Regex", r"(?<=\d{2})(?=(?:[a-z]{3}|IMG|DSC)[_-]?)(?!.*backup)", "_"),
+    ("Regex", r"(?i)(?:^|_)(?:img|dsc|pxl|vid|mov|scan)[_-]?(\d{4})(\d{2})(\d{2})(?=.*\.(?:jpe?g|png|mp4)$)", r"\1-\2-\3"),
+]
+
+
+def synthetic_names(count: int) -> list:
+    rng = random.Random(1234)
+    prefixes = ["IMG", "DSC", "PXL", "scan", "notes", "report", "vid"]
+    exts = [".jpg", ".png", ".mp4", ".txt", ".pdf"]
+    return [
+        f"/bench/{rng.choice(prefixes)}_{rng.randint(2000, 2030)}{rng.randint(1, 12):02}{rng.randint(1, 28):02}"
+        f"_{rng.randint(0, 99999):05}{rng.choice(exts)}"
+        for _ in range(count)
+    ]
+
+
+def run(mode: str, pattern: str, replacement: str, paths: list, threshold: int) -> float:
+    items = ((path, False) for path in paths)
+    start = time.perf_counter()
+    for _ in iter_evaluated(mode, pattern, replacement, items, lambda: False, threshold=threshold):
+        pass
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"workers: {os.cpu_count()}")
+    print(f"{'rule':<8} {'names':>9} {'serial (s)':>11} {'pool (s)':>9} {'speedup':>8}")
+    for mode, pattern, replacement in RULES:
+        for count in (20_000, 100_000, 400_000, 1_000_000):
+            paths = synthetic_names(count)
+            serial = run(mode, pattern, replacement, paths, threshold=sys.maxsize)
+            pooled = run(mode, pattern, replacement, paths, threshold=0)
+            print(f"{mode:<8} {count:>9} {serial:>11.3f} {pooled:>9.3f} {serial / pooled:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
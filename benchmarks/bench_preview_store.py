@@ -0,0 +1,96 @@
+"""
+Memory of a preview result: list of PreviewEntry versus PreviewStore.
+
+Builds the same synthetic preview both ways and reports the bytes still
+allocated afterwards as measured by tracemalloc, plus (untraced) the time
+to fill each and to read every row back.
+
+    python benchmarks/bench_preview_store.py
+"""
+from __future__ import annotations
+
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from quickxrename.models import PreviewEntry  # noqa: E402
+from quickxrename.store import PreviewStore  # noqa: E402
+
+Row = Tuple[str, str, str, str, str, str]
+
+
+def synthetic_rows(count: int, files_per_folder: int = 40) -> List[Row]:
+    # Build paths the way build_preview does, as fresh strings per row.
+    rng = random.Random(7)
+    rows = []
+    folder = ""
+    for index in range(count):
+        if index % files_per_folder == 0:
+            folder = os.path.join(os.sep, "data", "projects", f"client_{rng.randint(0, 999)}", f"shoot_{index}")
+        name = f"IMG_{rng.randint(0, 99999):05}_{index}.jpg"
+        new_name = name.replace("IMG_", "photo_")
+        old_path = os.path.join(folder, name)
+        new_path = os.path.join(folder, new_name)
+        final_path = os.path.join(folder, new_name)
+        status, message = ("conflict", "target already exists") if index % 50 == 0 else ("ready", "")
+        rows.append(("file", old_path, new_path, final_path, status, message))
+    return rows
+
+
+def measure(build: Callable[[], object]) -> int:
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def timed(build: Callable[[], object]) -> Tuple[object, float]:
+    start = time.perf_counter()
+    result = build()
+    return result, time.perf_counter() - start
+
+
+def read_all(entries) -> float:
+    start = time.perf_counter()
+    for entry in entries:
+        entry.final_new_path
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    print(f"{'rows':>9} {'list (MB)':>10} {'store (MB)':>11} {'ratio':>6} {'fill list/store (s)':>20} {'read list/store (s)':>20}")
+    for count in (100_000, 1_000_000):
+        # Rows are generated inside the traced call, so each side is charged
+        # for exactly the strings it keeps.
+        list_bytes = measure(lambda: [PreviewEntry(*row) for row in synthetic_rows(count)])
+        store_bytes = measure(lambda: _fill_store(synthetic_rows(count)))
+        rows = synthetic_rows(count)
+        entries, list_fill = timed(lambda: [PreviewEntry(*row) for row in rows])
+        store, store_fill = timed(lambda: _fill_store(rows))
+        list_read = read_all(entries)
+        store_read = read_all(store)
+        print(
+            f"{count:>9} {list_bytes / 1e6:>10.1f} {store_bytes / 1e6:>11.1f} {list_bytes / store_bytes:>5.1f}x"
+            f" {list_fill:>9.2f} / {store_fill:<8.2f} {list_read:>9.2f} / {store_read:<8.2f}"
+        )
+        del entries, store
+
+
+def _fill_store(rows: List[Row]) -> PreviewStore:
+    store = PreviewStore()
+    for row in rows:
+        store.add(*row)
+    return store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Rename throughput of the planned executor, serial versus threaded.
+
+Builds a scratch tree of files (plus swap pairs, which need temporary names),
+renames it with `apply_renames` at several worker counts and renames it back.
+A local disk answers renames in microseconds, so `--latency` adds a fixed
+delay to every os.rename to stand in for a network filesystem.
+
+    python benchmarks/bench_rename_executor.py --files 2000 --latency 2
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from quickxrename.models import PreviewEntry  # noqa: E402
+from quickxrename.renamer import apply_renames, undo_renames  # noqa: E402
+
+
+def make_tree(root: str, files: int, swaps: int) -> List[PreviewEntry]:
+    entries = []
+    for index in range(files):
+        old = os.path.join(root, f"file_{index}.txt")
+        open(old, "w").close()
+        new = os.path.join(root, f"renamed_{index}.txt")
+        entries.append(PreviewEntry("file", old, new, new, "ready", ""))
+    for index in range(swaps):
+        left = os.path.join(root, f"left_{index}")
+        right = os.path.join(root, f"right_{index}")
+        open(left, "w").close()
+        open(right, "w").close()
+        entries.append(PreviewEntry("file", left, right, right, "ready", ""))
+        entries.append(PreviewEntry("file", right, left, left, "ready", ""))
+    return entries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=2000)
+    parser.add_argument("--swaps", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.0, help="milliseconds added to each rename")
+    args = parser.parse_args()
+
+    if args.latency:
+        real_rename = os.rename
+        delay = args.latency / 1000
+
+        def slow_rename(source: str, target: str) -> None:
+            time.sleep(delay)
+            real_rename(source, target)
+
+        os.rename = slow_rename
+
+    root = tempfile.mkdtemp(prefix="qx-bench-")
+    try:
+        entries = make_tree(root, args.files, args.swaps)
+        print(f"{'workers':>8} {'renames':>8} {'apply (s)':>10} {'ops/s':>9} {'undo (s)':>9}")
+        for workers in (1, 2, 4, 8, 16):
+            start = time.perf_counter()
+            operations = apply_renames(entries, lambda _message: None, workers=workers)
+            applied = time.perf_counter() - start
+            start = time.perf_counter()
+            undo_renames(operations, lambda _message: None, workers=workers)
+            undone = time.perf_counter() - start
+            print(f"{workers:>8} {len(operations):>8} {applied:>10.3f} {len(operations) / applied:>9.0f} {undone:>9.3f}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
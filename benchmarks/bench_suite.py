@@ -0,0 +1,229 @@
+"""
+Stage timings of a full preview/apply/undo cycle, with regression tracking.
+
+For each rule mode a synthetic tree (see treegen.py) is generated in a
+scratch folder and taken through the pipeline the way build_preview and
+apply_renames do it, timing every stage on its own:
+
+    walk      listing the tree
+    rule      evaluating the rule on every name (match memos cleared first)
+    mapping   folder mapping of renamed folders and final paths
+    conflict  duplicate targets and existing-path checks
+    preview   build_preview end to end
+    apply     apply_renames on the ready entries
+    undo      undo_renames, which must restore the tree exactly
+
+Each stage reports the median of --repeat runs. --output saves the results
+as JSON; --baseline compares against a saved run and exits 1 when a stage
+is more than --threshold slower (and by more than --min-delta seconds).
+Nothing here imports Qt. Point --root at a tmpfs such as /dev/shm to leave
+disk speed out of the numbers.
+
+    python benchmarks/bench_suite.py --preset medium --output base.json
+    python benchmarks/bench_suite.py --preset medium --baseline base.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from dataclasses import asdict
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from treegen import MATCH_TOKEN, add_spec_arguments, generate, spec_from_args  # noqa: E402
+
+from quickxrename.existence import ExistenceOracle  # noqa: E402
+from quickxrename.models import PreviewRequest  # noqa: E402
+from quickxrename.pathmap import FolderMapping  # noqa: E402
+from quickxrename.renamer import apply_renames, build_preview, iter_items, undo_renames  # noqa: E402
+from quickxrename.rules import compile_rule, reset_memos  # noqa: E402
+
+RESULTS_VERSION = 1
+STAGES = ("walk", "rule", "mapping", "conflict", "preview", "apply", "undo")
+RULES: Dict[str, Tuple[str, str]] = {
+    "Replace": (MATCH_TOKEN, "photo_"),
+    "Wildcard": (MATCH_TOKEN + "*", "photo_*"),
+    "Regex": (MATCH_TOKEN + r"(\d*)", r"photo_\1"),
+}
+
+Timings = Dict[str, float]
+
+
+def _discard(message: str) -> None:
+    pass
+
+
+def run_cycle(request: PreviewRequest) -> Tuple[Timings, Dict[str, int]]:
+    seconds: Timings = {}
+    root = request.directory
+
+    start = time.perf_counter()
+    items = list(iter_items(root, True, True, True))
+    seconds["walk"] = time.perf_counter() - start
+
+    reset_memos()
+    start = time.perf_counter()
+    rule = compile_rule(request.mode, request.pattern, request.replacement)
+    candidates = []
+    for path, is_dir in items:
+        parent, name = os.path.split(path)
+        new_name = rule.apply(name)
+        if new_name is not None and new_name != name:
+            candidates.append((path, os.path.join(parent, new_name), is_dir))
+    seconds["rule"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mapping = FolderMapping((old, new) for old, new, is_dir in candidates if is_dir)
+    finals = [mapping.resolve_parent(new) for _old, new, _is_dir in candidates]
+    seconds["mapping"] = time.perf_counter() - start
+
+    listings: Dict[str, List[str]] = defaultdict(list)
+    for path, _is_dir in items:
+        parent, name = os.path.split(path)
+        listings[parent].append(name)
+    start = time.perf_counter()
+    oracle = ExistenceOracle(request.case_insensitive)
+    for parent, names in listings.items():
+        oracle.add_listing(parent, names)
+    targets = Counter(finals)
+    sources = {old for old, _new, _is_dir in candidates}
+    conflicts = sum(
+        1
+        for (_old, new, _is_dir), final in zip(candidates, finals)
+        if targets[final] > 1 or (new not in sources and oracle.exists(new))
+    )
+    seconds["conflict"] = time.perf_counter() - start
+
+    reset_memos()
+    start = time.perf_counter()
+    entries, stats = build_preview(request, lambda: False)
+    seconds["preview"] = time.perf_counter() - start
+
+    ready = entries.select("ready")
+    start = time.perf_counter()
+    operations = apply_renames(ready, _discard)
+    seconds["apply"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    undo_renames(operations, _discard)
+    seconds["undo"] = time.perf_counter() - start
+
+    if sorted(iter_items(root, True, True, True)) != sorted(items):
+        raise SystemExit("undo did not restore the tree; timings are meaningless")
+    counts = {
+        "items": len(items),
+        "candidates": len(candidates),
+        "conflicts": conflicts,
+        "ready": stats.ready,
+        "renamed": len(operations),
+    }
+    return seconds, counts
+
+
+def run_mode(mode: str, spec, repeat: int, scratch: str) -> Dict[str, object]:
+    pattern, replacement = RULES[mode]
+    root = tempfile.mkdtemp(prefix="qx-suite-", dir=scratch)
+    try:
+        generate(root, spec, compile_rule(mode, pattern, replacement).apply)
+        request = PreviewRequest(root, True, True, True, mode, pattern, replacement)
+        run_cycle(request)  # warm-up: dentry cache, imports, first pool start
+        samples: Dict[str, List[float]] = defaultdict(list)
+        for _ in range(repeat):
+            seconds, counts = run_cycle(request)
+            for stage, value in seconds.items():
+                samples[stage].append(value)
+    finally:
+        shutil.rmtree(root)
+    return {"counts": counts, "seconds": {stage: statistics.median(samples[stage]) for stage in STAGES}}
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta: float) -> List[str]:
+    regressions = []
+    print(f"\n{'mode':<9} {'stage':<9} {'baseline':>9} {'current':>9} {'change':>8}")
+    for mode, result in current["results"].items():
+        previous = baseline["results"].get(mode)
+        if previous is None:
+            continue
+        for stage, value in result["seconds"].items():
+            before = previous["seconds"].get(stage)
+            if before is None:
+                continue
+            change = (value - before) / before if before > 0 else 0.0
+            slower = value > before * (1 + threshold) and value - before > min_delta
+            mark = "  REGRESSION" if slower else ""
+            print(f"{mode:<9} {stage:<9} {before:>9.4f} {value:>9.4f} {change:>+7.0%}{mark}")
+            if slower:
+                regressions.append(f"{mode}/{stage}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    add_spec_arguments(parser)
+    parser.add_argument("--modes", default=",".join(RULES), help="comma-separated rule modes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--root", help="folder for the scratch trees (default: system temp)")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="ignore slowdowns under this many seconds")
+    args = parser.parse_args()
+
+    spec = spec_from_args(args)
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = [mode for mode in modes if mode not in RULES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as handle:
+            baseline = json.load(handle)
+        if baseline.get("version") != RESULTS_VERSION or baseline.get("spec") != asdict(spec):
+            print("FAIL: the baseline was recorded with a different tree or format", file=sys.stderr)
+            return 2
+
+    results = {}
+    print(f"{'mode':<9} {'items':>7} {'renamed':>8} " + " ".join(f"{stage:>9}" for stage in STAGES))
+    for mode in modes:
+        result = run_mode(mode, spec, max(1, args.repeat), args.root)
+        results[mode] = result
+        counts, seconds = result["counts"], result["seconds"]
+        print(
+            f"{mode:<9} {counts['items']:>7} {counts['renamed']:>8} "
+            + " ".join(f"{seconds[stage]:>9.4f}" for stage in STAGES)
+        )
+
+    current = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "spec": asdict(spec),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(current, handle, indent=2)
+            handle.write("\n")
+
+    if baseline is not None:
+        regressions = compare(current, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"FAIL: slower than the baseline in {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Walk time with and without pruning on a monorepo-shaped tree.
+
+Most entries live under node_modules/ and build/, as in a JavaScript
+monorepo. Excluding those folders should cut the walk to roughly the
+share of entries that remain, since pruned folders are never listed.
+
+    python benchmarks/bench_walk_filters.py
+"""
+from __future__ import annotations
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from quickxrename.models import PreviewRequest  # noqa: E402
+from quickxrename.renamer import iter_items, walk_filter_for  # noqa: E402
+
+PACKAGES = 20
+SOURCE_FILES = 50
+VENDORED_FOLDERS = 60
+VENDORED_FILES = 8
+
+
+def make_tree(root: str) -> None:
+    with open(os.path.join(root, ".gitignore"), "w") as handle:
+        handle.write("node_modules/\nbuild/\n")
+    for package in range(PACKAGES):
+        base = os.path.join(root, f"pkg_{package}")
+        os.makedirs(os.path.join(base, "src"))
+        for index in range(SOURCE_FILES):
+            open(os.path.join(base, "src", f"module_{index}.ts"), "w").close()
+        for kind in ("node_modules", "build"):
+            for folder in range(VENDORED_FOLDERS // 2):
+                path = os.path.join(base, kind, f"dep_{folder}", "lib")
+                os.makedirs(path)
+                for index in range(VENDORED_FILES):
+                    open(os.path.join(path, f"file_{index}.js"), "w").close()
+
+
+def walk(request: PreviewRequest) -> tuple:
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_items(request.directory, True, True, True, walk_filter_for(request)))
+    return count, time.perf_counter() - start
+
+
+def main() -> None:
+    root = tempfile.mkdtemp(prefix="qx-bench-")
+    try:
+        make_tree(root)
+        base = dict(directory=root, recursive=True, include_files=True, include_folders=True,
+                    mode="Replace", pattern="x", replacement="y")
+        cases = [
+            ("no filters", PreviewRequest(**base)),
+            ("--exclude", PreviewRequest(**base, exclude=("node_modules", "build"))),
+            ("--gitignore", PreviewRequest(**base, use_gitignore=True)),
+        ]
+        print(f"{'filters':<12} {'items':>8} {'walk (s)':>9}")
+        for label, request in cases:
+            walk(request)  # warm the dentry cache
+            count, elapsed = walk(request)
+            print(f"{label:<12} {count:>8} {elapsed:>9.3f}")
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
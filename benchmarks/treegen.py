@@ -0,0 +1,134 @@
+"""
+Synthetic directory trees for the benchmarks.
+
+A TreeSpec describes the shape (width, depth, files per folder), how names
+look and how many of them a rule should rename or collide on. `generate`
+builds it under a root folder with empty files; the same spec and seed
+always give the same tree.
+
+    python benchmarks/treegen.py /tmp/tree --width 4 --depth 3 --files 50
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import string
+from dataclasses import asdict, dataclass
+from typing import Callable, Dict, Optional
+
+MATCH_TOKEN = "IMG_"  # rules in the suite rename names carrying this token
+
+NAME_STYLES = ("camera", "short", "long", "unicode")
+_UNICODE_LETTERS = "äöüßéèçñåøæłśžčřğışЖзыкλόγοςקשר日本語ファイル"
+
+
+@dataclass(frozen=True)
+class TreeSpec:
+    width: int = 4  # subfolders per folder
+    depth: int = 3  # folder levels below the root
+    files: int = 40  # files per folder
+    names: str = "camera"  # one of NAME_STYLES
+    match_rate: float = 0.5  # share of files and folders carrying MATCH_TOKEN
+    collision_rate: float = 0.05  # share of matches whose target already exists
+    seed: int = 7
+
+
+PRESETS: Dict[str, TreeSpec] = {
+    "small": TreeSpec(width=3, depth=3, files=30),
+    "medium": TreeSpec(width=4, depth=4, files=40),
+    "large": TreeSpec(width=6, depth=4, files=60),
+}
+
+
+def _stem(rng: random.Random, style: str, index: int) -> str:
+    if style == "camera":
+        return f"{rng.randint(0, 99999):05}_{index}"
+    if style == "short":
+        return "".join(rng.choices(string.ascii_lowercase + string.digits, k=8)) + f"_{index}"
+    if style == "long":
+        length = min(200, int(rng.lognormvariate(3.5, 0.6)))
+        return "".join(rng.choices(string.ascii_letters + string.digits + " -_", k=length)).strip() + f"_{index}"
+    if style == "unicode":
+        return "".join(rng.choices(_UNICODE_LETTERS + string.ascii_lowercase, k=12)) + f"_{index}"
+    raise ValueError(f"unknown name style: {style}")
+
+
+def _name(rng: random.Random, spec: TreeSpec, index: int, extension: str) -> str:
+    stem = _stem(rng, spec.names, index)
+    if rng.random() < spec.match_rate:
+        stem = MATCH_TOKEN + stem
+    return stem + extension
+
+
+def generate(root: str, spec: TreeSpec, rename: Optional[Callable[[str], Optional[str]]] = None) -> int:
+    """
+    Builds the tree under `root` and returns the number of items created.
+
+    `rename` is the rule under test: for a `collision_rate` share of the
+    files it renames, a file with the new name is created next to them, so
+    the preview reports those as conflicts.
+    """
+    rng = random.Random(spec.seed)
+    extensions = (".jpg", ".png", ".txt", ".raw", "")
+    created = 0
+    counter = 0
+    pending = [(root, 0)]
+    while pending:
+        folder, level = pending.pop()
+        names = set()
+        for _ in range(spec.files):
+            counter += 1
+            name = _name(rng, spec, counter, rng.choice(extensions))
+            names.add(name)
+            if rename is not None and rng.random() < spec.collision_rate:
+                target = rename(name)
+                if target and target != name and os.sep not in target:
+                    names.add(target)
+        for name in names:
+            open(os.path.join(folder, name), "w").close()
+        created += len(names)
+        if level < spec.depth:
+            for _ in range(spec.width):
+                counter += 1
+                path = os.path.join(folder, _name(rng, spec, counter, ""))
+                os.mkdir(path)
+                created += 1
+                pending.append((path, level + 1))
+    return created
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Create a synthetic tree for benchmarking.")
+    parser.add_argument("root")
+    add_spec_arguments(parser)
+    args = parser.parse_args()
+    os.makedirs(args.root, exist_ok=True)
+    spec = spec_from_args(args)
+    print(f"{generate(args.root, spec)} items created in {args.root}")
+
+
+def add_spec_arguments(parser: argparse.ArgumentParser) -> None:
+    group = parser.add_argument_group("tree")
+    group.add_argument("--preset", choices=sorted(PRESETS), default="small")
+    group.add_argument("--width", type=int)
+    group.add_argument("--depth", type=int)
+    group.add_argument("--files", type=int, help="files per folder")
+    group.add_argument("--names", choices=NAME_STYLES)
+    group.add_argument("--match-rate", type=float)
+    group.add_argument("--collision-rate", type=float)
+    group.add_argument("--seed", type=int)
+
+
+def spec_from_args(args: argparse.Namespace) -> TreeSpec:
+    # A preset with any of the shape options given on the command line overriding it.
+    fields = asdict(PRESETS[args.preset])
+    for field in fields:
+        value = getattr(args, field, None)
+        if value is not None:
+            fields[field] = value
+    return TreeSpec(**fields)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import multiprocessing
+
 from quickxrename.app import run
 
 
 if __name__ == "__main__":
+    # Needed by frozen builds: the rule-evaluation pool spawns this executable.
+    multiprocessing.freeze_support()
     run()
@@ -1 +1 @@
-__all__ = ["app", "ui", "renamer", "workers", "models", "styles"]
+__all__ = ["app", "ui", "renamer", "workers", "models", "styles", "pathmap", "preview_model", "snapshot", "watcher", "live_preview", "existence", "rules", "parallel", "cli", "journal", "planner", "filters", "store", "metrics", "logfile", "control", "index", "tokens", "hashing", "walker", "pipeline", "plans", "incremental"]
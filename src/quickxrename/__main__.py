@@ -1,5 +1,19 @@
-from .app import run
+import sys
 
+from .cli import COMMANDS
+
+
+def main() -> None:
+    # Subcommands stay headless; anything else opens the desktop app.
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS + ("-h", "--help"):
+        from .cli import main as cli_main
+
+        sys.exit(cli_main())
+
+    from .app import run
 
-if __name__ == "__main__":
     run()
+
+
+if __name__ == "__main__":
+    main()
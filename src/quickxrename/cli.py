@@ -0,0 +1,450 @@
+"""
+Headless command line for QuickXRename.
+
+Nothing on this import path may load PySide6: batch jobs and servers run the
+renamer without a display, and start-up has to stay within STARTUP_BUDGET_MS
+(see benchmarks/bench_cli_startup.py).
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import signal
+import sys
+from contextlib import contextmanager
+from dataclasses import asdict
+from typing import IO, Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .control import TaskControl
+from .filters import split_globs
+from .journal import RenameJournal
+from .metrics import NULL_METRICS, Metrics
+from .models import PreviewEntry, PreviewRequest, PreviewStats, RenameOperation
+from .pipeline import load_preset, split_steps
+from .planner import default_rename_workers
+from .plans import load_plan, plan_format
+from .renamer import apply_renames, build_preview, undo_renames, walk_filter_for
+from .rules import MODES, RuleError
+from .store import PreviewStore
+from .walker import default_walk_workers
+
+STARTUP_BUDGET_MS = 150
+
+COMMANDS = ("preview", "apply", "apply-plan", "undo", "redo", "history", "recover")
+
+ENTRY_FIELDS = ["item_type", "old_path", "raw_new_path", "final_new_path", "status", "message"]
+OPERATION_FIELDS = ["old_path", "new_path"]
+
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_CONFLICTS = 2
+EXIT_STOPPED = 130  # Ctrl-C; a journalled run is left resumable
+
+
+def _add_rule_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("directory")
+    parser.add_argument("--mode", choices=MODES, default="Replace")
+    parser.add_argument("--pattern", "-p", help="required unless --preset is given")
+    parser.add_argument(
+        "--replacement",
+        "-r",
+        default="",
+        help="may hold tokens: {n:04}, {mtime:%%Y%%m%%d}, {size}, {parent}, {sha256:12}, {blake2b}; "
+        "{{ and }} are literal braces",
+    )
+    parser.add_argument(
+        "--preset",
+        metavar="FILE",
+        help="JSON rule pipeline (Replace, Wildcard, Regex, Lowercase, Uppercase, Titlecase and Trim steps) "
+        "applied in one pass; runs after --pattern when both are given",
+    )
+    parser.add_argument("--recursive", "-R", action="store_true")
+    parser.add_argument("--no-files", dest="include_files", action="store_false")
+    parser.add_argument("--no-folders", dest="include_folders", action="store_false")
+    walk = parser.add_argument_group("walk filters")
+    walk.add_argument("--include", action="append", default=[], metavar="GLOB", help="only list matching items")
+    walk.add_argument("--exclude", action="append", default=[], metavar="GLOB", help="skip matching items and folders")
+    walk.add_argument("--max-depth", type=int, metavar="N", help="1 lists only the directory's own items")
+    walk.add_argument("--no-hidden", dest="include_hidden", action="store_false", help="skip dot-files and dot-folders")
+    walk.add_argument("--gitignore", dest="use_gitignore", action="store_true", help="skip what git ignores")
+    walk.add_argument(
+        "--index",
+        action="store_true",
+        help="read the tree from the on-disk index, re-listing only folders that changed",
+    )
+    walk.add_argument(
+        "--walk-workers",
+        type=int,
+        default=default_walk_workers(),
+        metavar="N",
+        help="list folders of a recursive walk on N threads, for network shares (default: QUICKXRENAME_WALK_WORKERS or 0)",
+    )
+
+
+def _add_rename_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--rename-workers",
+        type=int,
+        default=default_rename_workers(),
+        metavar="N",
+        help="run independent renames on N threads, for network shares (default: QUICKXRENAME_RENAME_WORKERS or 0)",
+    )
+
+
+def _add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--format", choices=["json", "jsonl", "csv"], default="json")
+    parser.add_argument("--output", "-o", help="write results to this file instead of stdout")
+    parser.add_argument(
+        "--metrics", metavar="FILE", help="write stage timings and counters as JSON to FILE ('-' for stderr)"
+    )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="quickxrename", description="Batch rename files and folders.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    preview = commands.add_parser("preview", help="show what would be renamed")
+    _add_rule_arguments(preview)
+    _add_output_arguments(preview)
+
+    apply = commands.add_parser("apply", help="rename every ready entry; refuses if there are conflicts")
+    _add_rule_arguments(apply)
+    _add_output_arguments(apply)
+    _add_rename_arguments(apply)
+    apply.add_argument("--quiet", "-q", action="store_true", help="don't log each rename to stderr")
+    apply.add_argument("--no-journal", dest="journal", action="store_false", help="don't record the run for undo/recovery")
+
+    apply_plan = commands.add_parser(
+        "apply-plan", help="check an old -> new mapping like a preview, then rename; refuses if there are conflicts"
+    )
+    apply_plan.add_argument("plan", help="JSON Lines or CSV file of old_path/new_path rows ('-' for stdin)")
+    apply_plan.add_argument(
+        "--plan-format", choices=["jsonl", "csv"], help="format of the plan (default: from the file name, else jsonl)"
+    )
+    apply_plan.add_argument("--check", action="store_true", help="only write the checked entries, rename nothing")
+    _add_output_arguments(apply_plan)
+    _add_rename_arguments(apply_plan)
+    apply_plan.add_argument("--quiet", "-q", action="store_true", help="don't log each rename to stderr")
+    apply_plan.add_argument(
+        "--no-journal", dest="journal", action="store_false", help="don't record the run for undo/recovery"
+    )
+
+    undo = commands.add_parser("undo", help="revert the last journalled run, or operations written by 'apply'")
+    undo.add_argument("operations", nargs="?", help="JSON, JSON Lines or CSV file produced by 'apply'")
+    undo.add_argument("--quiet", "-q", action="store_true")
+    _add_rename_arguments(undo)
+
+    redo = commands.add_parser("redo", help="re-apply the last undone run")
+    redo.add_argument("--quiet", "-q", action="store_true")
+
+    commands.add_parser("history", help="list journalled runs")
+
+    recover = commands.add_parser("recover", help="settle a run that was interrupted")
+    recover.add_argument("run", help="run id, as shown by 'history'")
+    action = recover.add_mutually_exclusive_group(required=True)
+    action.add_argument("--rollback", action="store_true", help="revert the renames that completed")
+    action.add_argument("--replay", action="store_true", help="perform the renames that remain")
+    recover.add_argument("--quiet", "-q", action="store_true")
+    return parser
+
+
+def _request_from_args(args: argparse.Namespace) -> PreviewRequest:
+    if not os.path.isdir(args.directory):
+        raise ValueError(f"not a directory: {args.directory}")
+    steps = load_preset(args.preset) if args.preset else ()
+    if args.pattern is not None:
+        mode, pattern, replacement = args.mode, args.pattern, args.replacement
+    elif steps:
+        mode, pattern, replacement, steps = split_steps(steps)
+    else:
+        raise ValueError("--pattern or --preset is required")
+    return PreviewRequest(
+        # Journalled paths must not depend on where undo is run from.
+        directory=os.path.abspath(args.directory),
+        recursive=args.recursive,
+        include_files=args.include_files,
+        include_folders=args.include_folders,
+        mode=mode,
+        pattern=pattern,
+        replacement=replacement,
+        # Each flag may be repeated or hold a comma-separated list.
+        include=tuple(glob for value in args.include for glob in split_globs(value)),
+        exclude=tuple(glob for value in args.exclude for glob in split_globs(value)),
+        max_depth=args.max_depth,
+        include_hidden=args.include_hidden,
+        use_gitignore=args.use_gitignore,
+        walk_workers=args.walk_workers,
+        steps=steps,
+    )
+
+
+def write_entries(stream: IO[str], entries: Iterable[PreviewEntry], stats: PreviewStats, fmt: str) -> None:
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(ENTRY_FIELDS)
+        for entry in entries:
+            writer.writerow([getattr(entry, field) for field in ENTRY_FIELDS])
+        return
+    if fmt == "jsonl":
+        # One entry per line, which 'apply-plan' reads back.
+        for entry in entries:
+            stream.write(json.dumps(vars(entry)) + "\n")
+        return
+    # Entries are written one by one so large previews never build one big string.
+    stream.write('{"stats": ' + json.dumps(asdict(stats)) + ', "entries": [')
+    for index, entry in enumerate(entries):
+        stream.write(("\n  " if index == 0 else ",\n  ") + json.dumps(asdict(entry)))
+    stream.write("\n]}\n")
+
+
+def write_operations(stream: IO[str], operations: Sequence[RenameOperation], fmt: str) -> None:
+    if fmt == "csv":
+        writer = csv.writer(stream)
+        writer.writerow(OPERATION_FIELDS)
+        for op in operations:
+            writer.writerow([op.old_path, op.new_path])
+        return
+    if fmt == "jsonl":
+        for op in operations:
+            stream.write(json.dumps({"old_path": op.old_path, "new_path": op.new_path}) + "\n")
+        return
+    json.dump([{"old_path": op.old_path, "new_path": op.new_path} for op in operations], stream, indent=1)
+    stream.write("\n")
+
+
+def read_operations(path: str) -> List[RenameOperation]:
+    with open(path, newline="", encoding="utf-8") as handle:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(handle))
+        elif path.lower().endswith(".jsonl"):
+            rows = [json.loads(line) for line in handle if line.strip()]
+        else:
+            rows = json.load(handle)
+    return [RenameOperation(new_path=row["new_path"], old_path=row["old_path"]) for row in rows]
+
+
+def _open_output(path: Optional[str]) -> IO[str]:
+    if path:
+        return open(path, "w", newline="", encoding="utf-8")
+    return sys.stdout
+
+
+def _log_to_stderr(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+def _log_fn(args: argparse.Namespace):
+    return (lambda _message: None) if args.quiet else _log_to_stderr
+
+
+def _metrics_for(args: argparse.Namespace) -> Metrics:
+    return Metrics() if args.metrics else NULL_METRICS
+
+
+def write_metrics(path: str, command: str, metrics: Metrics) -> None:
+    document = json.dumps({"command": command, **metrics.as_dict()}, indent=2)
+    if path == "-":
+        print(document, file=sys.stderr)
+        return
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(document + "\n")
+
+
+def _build_preview(
+    args: argparse.Namespace, cancel_check: Callable[[], bool], metrics: Metrics
+) -> Tuple[PreviewStore, PreviewStats]:
+    request = _request_from_args(args)
+    if not args.index:
+        return build_preview(request, cancel_check, metrics=metrics)
+    from .index import TreeIndex  # sqlite3 is only loaded when asked for
+
+    index = TreeIndex()
+    try:
+        items = index.preview_items(request, walk_filter_for(request), cancel_check=cancel_check)
+        result = build_preview(request, cancel_check, items=items, metrics=metrics, prefiltered=True)
+        metrics.count("dirs_listed", index.last_refresh.listed)
+        metrics.count("dirs_reused", index.last_refresh.reused)
+        return result
+    finally:
+        index.close()
+
+
+def run_preview(args: argparse.Namespace) -> int:
+    metrics = _metrics_for(args)
+    entries, stats = _build_preview(args, lambda: False, metrics)
+    stream = _open_output(args.output)
+    try:
+        with metrics.stage("output"):
+            write_entries(stream, entries, stats, args.format)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    if args.metrics:
+        write_metrics(args.metrics, "preview", metrics)
+    return EXIT_CONFLICTS if stats.conflicts else EXIT_OK
+
+
+@contextmanager
+def _stoppable() -> Iterator[TaskControl]:
+    # The first Ctrl-C stops between batches, a second one kills as usual.
+    control = TaskControl()
+
+    def on_interrupt(signum, frame) -> None:
+        signal.signal(signal.SIGINT, previous)
+        print("Stopping after the current batch...", file=sys.stderr)
+        control.cancel()
+
+    previous = signal.signal(signal.SIGINT, on_interrupt)
+    try:
+        yield control
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+
+def _report_stopped(run_id: Optional[str] = None) -> int:
+    if run_id is None:
+        print("Stopped. See 'history' for the run to resume or roll back.", file=sys.stderr)
+    else:
+        print(
+            f"Stopped. Resume with 'recover {run_id} --replay' or undo with 'recover {run_id} --rollback'.",
+            file=sys.stderr,
+        )
+    return EXIT_STOPPED
+
+
+def run_apply(args: argparse.Namespace) -> int:
+    with _stoppable() as control:
+        return _apply(args, control)
+
+
+def _apply(args: argparse.Namespace, control: TaskControl) -> int:
+    metrics = _metrics_for(args)
+    entries, stats = _build_preview(args, control.check, metrics)
+    return _apply_entries(args, control, entries, stats, metrics, "apply", "preview")
+
+
+def _apply_entries(
+    args: argparse.Namespace,
+    control: TaskControl,
+    entries: PreviewStore,
+    stats: PreviewStats,
+    metrics: Metrics,
+    command: str,
+    inspect: str,
+) -> int:
+    if control.cancelled:
+        print("Stopped before renaming anything.", file=sys.stderr)
+        return EXIT_STOPPED
+    if stats.conflicts:
+        print(f"Refusing to rename: {stats.conflicts} conflict(s). Run '{inspect}' to inspect them.", file=sys.stderr)
+        if args.metrics:
+            write_metrics(args.metrics, command, metrics)
+        return EXIT_CONFLICTS
+    ready = entries.select("ready")
+    run = RenameJournal().begin("rename") if args.journal else None
+    operations = apply_renames(
+        ready, _log_fn(args), journal=run, workers=args.rename_workers, metrics=metrics, cancel_check=control.check
+    )
+    if run is not None:
+        run.close()
+    stream = _open_output(args.output)
+    try:
+        with metrics.stage("output"):
+            write_operations(stream, operations, args.format)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+    if args.metrics:
+        write_metrics(args.metrics, command, metrics)
+    if control.cancelled:
+        return _report_stopped(run.run_id if run is not None else None)
+    return EXIT_OK if len(operations) == len(ready) else EXIT_ERROR
+
+
+def run_apply_plan(args: argparse.Namespace) -> int:
+    metrics = _metrics_for(args)
+    fmt = args.plan_format or plan_format(args.plan)
+    with _stoppable() as control:
+        if args.plan == "-":
+            entries, stats = load_plan(sys.stdin, fmt, control.check, metrics=metrics)
+        else:
+            with open(args.plan, newline="", encoding="utf-8") as handle:
+                entries, stats = load_plan(handle, fmt, control.check, metrics=metrics)
+        if args.check:
+            if control.cancelled:
+                return EXIT_STOPPED
+            stream = _open_output(args.output)
+            try:
+                with metrics.stage("output"):
+                    write_entries(stream, entries, stats, args.format)
+            finally:
+                if stream is not sys.stdout:
+                    stream.close()
+            if args.metrics:
+                write_metrics(args.metrics, "apply-plan", metrics)
+            return EXIT_CONFLICTS if stats.conflicts else EXIT_OK
+        return _apply_entries(args, control, entries, stats, metrics, "apply-plan", "apply-plan --check")
+
+
+def run_undo(args: argparse.Namespace) -> int:
+    with _stoppable() as control:
+        if args.operations:
+            failures = undo_renames(
+                read_operations(args.operations), _log_fn(args), args.rename_workers, cancel_check=control.check
+            )
+            if control.cancelled:
+                return EXIT_STOPPED
+            if failures:
+                print(f"Error: {failures} rename(s) skipped or failed.", file=sys.stderr)
+                return EXIT_ERROR
+            return EXIT_OK
+        if RenameJournal().undo(_log_fn(args), cancel_check=control.check) is None:
+            print("Nothing to undo.", file=sys.stderr)
+            return EXIT_ERROR
+    return _report_stopped() if control.cancelled else EXIT_OK
+
+
+def run_redo(args: argparse.Namespace) -> int:
+    with _stoppable() as control:
+        if RenameJournal().redo(_log_fn(args), cancel_check=control.check) is None:
+            print("Nothing to redo.", file=sys.stderr)
+            return EXIT_ERROR
+    return _report_stopped() if control.cancelled else EXIT_OK
+
+
+def run_history(args: argparse.Namespace) -> int:
+    for record in RenameJournal().runs().values():
+        if not record.complete:
+            state = "stopped" if record.stopped else "interrupted"
+        elif record.kind == "rename":
+            state = record.state
+        else:
+            state = f"of {record.target}"
+        print(f"{record.run_id}  {record.kind:<6}  {state}")
+    return EXIT_OK
+
+
+def run_recover(args: argparse.Namespace) -> int:
+    journal = RenameJournal()
+    if not os.path.exists(journal.run_path(args.run)):
+        raise ValueError(f"no such run: {args.run}")
+    with _stoppable() as control:
+        journal.recover(args.run, args.rollback, _log_fn(args), cancel_check=control.check)
+    if control.cancelled:
+        # A stopped rollback is a run of its own, listed in 'history'.
+        return _report_stopped(None if args.rollback else args.run)
+    return EXIT_OK
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    handlers = dict(
+        zip(COMMANDS, (run_preview, run_apply, run_apply_plan, run_undo, run_redo, run_history, run_recover))
+    )
+    try:
+        return handlers[args.command](args)
+    except (RuleError, OSError, ValueError, KeyError) as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return EXIT_ERROR
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import threading
+
+
+class TaskControl:
+    """
+    Cooperative cancel and pause, shared by the UI and one running task.
+
+    The task calls check() at points where stopping is safe (between
+    directories, between rename batches). It blocks there while the task
+    is paused and returns True once it has been cancelled, so check can
+    stand in wherever a cancel_check callable is expected.
+    """
+
+    def __init__(self) -> None:
+        self._cancelled = False
+        self._running = threading.Event()
+        self._running.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def cancel(self) -> None:
+        self._cancelled = True
+        self._running.set()  # a paused task has to wake up to stop
+
+    def pause(self) -> None:
+        if not self._cancelled:
+            self._running.clear()
+
+    def resume(self) -> None:
+        self._running.set()
+
+    def check(self) -> bool:
+        if not self._running.is_set():
+            self._running.wait()
+        return self._cancelled
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import os
+import sys
+from typing import Dict, FrozenSet, Iterable, Optional
+
+
+def default_case_insensitive() -> bool:
+    # Default filesystems on Windows and macOS ignore case.
+    return os.name == "nt" or sys.platform == "darwin"
+
+
+class ExistenceOracle:
+    """
+    Answers "does this path exist?" from one listing per parent directory.
+
+    Each distinct parent is listed at most once and kept as a set of names,
+    so checking many targets in the same folder costs a single scandir
+    instead of one stat each. Listings can also be seeded from data the walk
+    already produced.
+    """
+
+    def __init__(self, case_insensitive: Optional[bool] = None) -> None:
+        if case_insensitive is None:
+            case_insensitive = default_case_insensitive()
+        self.case_insensitive = case_insensitive
+        self._listings: Dict[str, FrozenSet[str]] = {}
+        self.listings_read = 0  # directories listed here rather than seeded
+
+    def _key(self, name: str) -> str:
+        return name.casefold() if self.case_insensitive else name
+
+    def add_listing(self, directory: str, names: Iterable[str]) -> None:
+        self._listings[directory] = frozenset(self._key(name) for name in names)
+
+    def _listing(self, directory: str) -> FrozenSet[str]:
+        names = self._listings.get(directory)
+        if names is None:
+            try:
+                with os.scandir(directory) as it:
+                    names = frozenset(self._key(entry.name) for entry in it)
+            except OSError:
+                names = frozenset()
+            self._listings[directory] = names
+            self.listings_read += 1
+        return names
+
+    def exists(self, path: str) -> bool:
+        directory, name = os.path.split(path)
+        return self._key(name) in self._listing(directory)
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+from .models import PreviewRequest
+
+GITIGNORE = ".gitignore"
+
+FilterKey = Tuple[Tuple[str, ...], Tuple[str, ...], Optional[int], bool, bool]
+# A .gitignore in effect: strip `strip` from, then prepend `prepend` to, the
+# root-relative path to get the path relative to the .gitignore's folder.
+IgnoreLayer = Tuple[str, str, "GitignoreRules"]
+
+T = TypeVar("T")
+
+
+def split_globs(text: str) -> Tuple[str, ...]:
+    # "node_modules, *.tmp,build" -> ("node_modules", "*.tmp", "build")
+    return tuple(part.strip() for part in text.split(",") if part.strip())
+
+
+def _compile_globs(patterns: Sequence[str]) -> Tuple[Optional[re.Pattern], Optional[re.Pattern]]:
+    # Patterns without a separator match the name, others the path relative
+    # to the root (with "/" separators). Each group becomes one regex.
+    by_name = [fnmatch.translate(os.path.normcase(p)) for p in patterns if "/" not in p]
+    by_path = [fnmatch.translate(os.path.normcase(p.strip("/"))) for p in patterns if "/" in p]
+    return (
+        re.compile("|".join(by_name)) if by_name else None,
+        re.compile("|".join(by_path)) if by_path else None,
+    )
+
+
+def _gitignore_regex(pattern: str) -> str:
+    out = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**/", index):
+            out.append("(?:.*/)?")
+            index += 3
+            continue
+        if pattern.startswith("**", index):
+            out.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            out.append("[^/]*")
+        elif char == "?":
+            out.append("[^/]")
+        elif char == "[":
+            end = pattern.find("]", index + 2)
+            if end < 0:
+                out.append("\\[")
+            else:
+                body = pattern[index + 1:end]
+                if body.startswith("!"):
+                    body = "^" + body[1:]
+                out.append("[" + body.replace("\\", "\\\\") + "]")
+                index = end
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            out.append(re.escape(pattern[index]))
+        else:
+            out.append(re.escape(char))
+        index += 1
+    return "".join(out)
+
+
+class GitignoreRules:
+    """
+    Patterns of one .gitignore file, matched against paths relative to it.
+
+    Later patterns win, "!" re-includes and a trailing "/" only matches
+    directories, as in git. Without negations all patterns are folded into
+    one regex per kind.
+    """
+
+    __slots__ = ("rules", "any_negated", "file_regex", "dir_regex")
+
+    def __init__(self, lines: Iterable[str]) -> None:
+        self.rules: List[Tuple[re.Pattern, bool, bool]] = []  # (regex, negated, dir_only)
+        for line in lines:
+            line = line.rstrip("\n")
+            if not line.endswith("\\ "):
+                line = line.rstrip()
+            if not line or line.startswith("#"):
+                continue
+            negated = line.startswith("!")
+            if negated:
+                line = line[1:]
+            elif line.startswith("\\!") or line.startswith("\\#"):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            anchored = "/" in line
+            body = _gitignore_regex(line.lstrip("/"))
+            regex = body if anchored else "(?:.*/)?" + body
+            self.rules.append((re.compile(regex + r"\Z", re.DOTALL), negated, dir_only))
+        self.any_negated = any(negated for _regex, negated, _dir_only in self.rules)
+        self.file_regex = self.dir_regex = None
+        if self.rules and not self.any_negated:
+            files = [r.pattern for r, _n, dir_only in self.rules if not dir_only]
+            self.file_regex = re.compile("|".join(files), re.DOTALL) if files else None
+            self.dir_regex = re.compile("|".join(r.pattern for r, _n, _d in self.rules), re.DOTALL)
+
+    def match(self, relative: str, is_dir: bool) -> Optional[bool]:
+        # True: ignored, False: re-included, None: no pattern applies.
+        if not self.any_negated:
+            regex = self.dir_regex if is_dir else self.file_regex
+            return True if regex is not None and regex.match(relative) else None
+        for regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relative):
+                return not negated
+        return None
+
+
+class _Scope:
+    # Filter state inside one directory: depth below the root, path relative
+    # to the root, and the .gitignore files in effect, outermost first.
+    __slots__ = ("depth", "relative", "ignores")
+
+    def __init__(self, depth: int, relative: str, ignores: Tuple[IgnoreLayer, ...]) -> None:
+        self.depth = depth
+        self.relative = relative
+        self.ignores = ignores
+
+
+class WalkFilter:
+    """
+    Include/exclude rules applied while walking, so excluded subtrees are
+    never listed.
+
+    - exclude: globs; a matching folder is skipped together with its contents.
+    - include: globs; only matching items are reported, but folders are
+      still descended into.
+    - max_depth: 1 lists only the root's children (like find -maxdepth).
+    - include_hidden: False skips dot-names, folders with their contents.
+    - use_gitignore: honors .gitignore files from the enclosing repository
+      down, and always skips .git.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        max_depth: Optional[int] = None,
+        include_hidden: bool = True,
+        use_gitignore: bool = False,
+    ) -> None:
+        self.root = root
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.max_depth = max_depth
+        self.include_hidden = include_hidden
+        self.use_gitignore = use_gitignore
+        self._include_name, self._include_path = _compile_globs(self.include)
+        self._exclude_name, self._exclude_path = _compile_globs(self.exclude)
+        self._scopes: Dict[str, _Scope] = {}
+        self.loaded: List[Tuple[str, int]] = []  # (.gitignore path, mtime_ns) read so far
+        self._scopes[root] = self._root_scope()
+
+    @classmethod
+    def from_request(cls, request: PreviewRequest) -> "WalkFilter":
+        return cls(
+            request.directory,
+            request.include,
+            request.exclude,
+            request.max_depth,
+            request.include_hidden,
+            request.use_gitignore,
+        )
+
+    @property
+    def key(self) -> FilterKey:
+        return (self.include, self.exclude, self.max_depth, self.include_hidden, self.use_gitignore)
+
+    @property
+    def active(self) -> bool:
+        return bool(
+            self.include or self.exclude or self.max_depth is not None
+            or not self.include_hidden or self.use_gitignore
+        )
+
+    def _load(self, directory: str, strip: str, prepend: str = "") -> Tuple[IgnoreLayer, ...]:
+        path = os.path.join(directory, GITIGNORE)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+            with open(path, encoding="utf-8", errors="replace") as handle:
+                rules = GitignoreRules(handle)
+        except OSError:
+            return ()
+        self.loaded.append((path, mtime_ns))
+        return ((strip, prepend, rules),) if rules.rules else ()
+
+    def _root_scope(self) -> _Scope:
+        ignores: Tuple[IgnoreLayer, ...] = ()
+        if self.use_gitignore:
+            # .gitignore files between the repository top and the root apply too.
+            ancestors = []
+            current = os.path.abspath(self.root)
+            while True:
+                ancestors.append(current)
+                if os.path.isdir(os.path.join(current, ".git")):
+                    break
+                parent = os.path.dirname(current)
+                if parent == current:
+                    ancestors = ancestors[:1]
+                    break
+                current = parent
+            for directory in reversed(ancestors):
+                relative = os.path.relpath(os.path.abspath(self.root), directory)
+                prepend = "" if relative == os.curdir else relative.replace(os.sep, "/") + "/"
+                ignores += self._load(directory, "", prepend)
+        return _Scope(0, "", ignores)
+
+    def scope(self, directory: str) -> _Scope:
+        scope = self._scopes.get(directory)
+        if scope is not None:
+            return scope
+        parent = self.scope(os.path.dirname(directory))
+        name = os.path.basename(directory)
+        relative = parent.relative + name + "/"
+        ignores = parent.ignores
+        if self.use_gitignore:
+            ignores += self._load(directory, relative)
+        scope = _Scope(parent.depth + 1, relative, ignores)
+        self._scopes[directory] = scope
+        return scope
+
+    def _ignored(self, scope: _Scope, relative: str, is_dir: bool) -> bool:
+        for strip, prepend, rules in reversed(scope.ignores):
+            result = rules.match(prepend + relative[len(strip):], is_dir)
+            if result is not None:
+                return result
+        return False
+
+    def keep(self, scope: _Scope, name: str, is_dir: bool) -> bool:
+        """Whether an item may be visited at all (and a folder descended into)."""
+        if not self.include_hidden and name.startswith("."):
+            return False
+        if self.use_gitignore and is_dir and name == ".git":
+            return False
+        if self.exclude:
+            folded = os.path.normcase(name)
+            if self._exclude_name is not None and self._exclude_name.match(folded):
+                return False
+            if self._exclude_path is not None and self._exclude_path.match(os.path.normcase(scope.relative + name)):
+                return False
+        if scope.ignores and self._ignored(scope, scope.relative + name, is_dir):
+            return False
+        return True
+
+    def report(self, scope: _Scope, name: str) -> bool:
+        """Whether a kept item matches the include globs."""
+        if not self.include:
+            return True
+        folded = os.path.normcase(name)
+        if self._include_name is not None and self._include_name.match(folded):
+            return True
+        return self._include_path is not None and bool(
+            self._include_path.match(os.path.normcase(scope.relative + name))
+        )
+
+    def descend(self, scope: _Scope) -> bool:
+        """Whether folders inside `scope` are walked into."""
+        return self.max_depth is None or scope.depth + 1 < self.max_depth
+
+    def admits(self, path: str, is_dir: bool) -> bool:
+        """Full check of one path below the root, for items found outside a walk."""
+        relative = os.path.relpath(path, self.root)
+        if relative.startswith(os.pardir):
+            return False
+        parts = relative.split(os.sep)
+        if self.max_depth is not None and len(parts) > self.max_depth:
+            return False
+        directory = self.root
+        for part in parts[:-1]:
+            if not self.keep(self.scope(directory), part, True):
+                return False
+            directory = os.path.join(directory, part)
+        scope = self.scope(directory)
+        return self.keep(scope, parts[-1], is_dir) and self.report(scope, parts[-1])
+
+    def enters(self, directory: str) -> bool:
+        """Whether a walk would list `directory`, a folder below the root."""
+        relative = os.path.relpath(directory, self.root)
+        if relative.startswith(os.pardir):
+            return False
+        if relative == os.curdir:
+            return True
+        parts = relative.split(os.sep)
+        if self.max_depth is not None and len(parts) >= self.max_depth:
+            return False
+        current = self.root
+        for part in parts:
+            if not self.keep(self.scope(current), part, True):
+                return False
+            current = os.path.join(current, part)
+        return True
+
+    def filter_names(
+        self,
+        directory: str,
+        dirs: List[T],
+        files: List[T],
+        name: Callable[[T], str] = str,
+    ) -> Tuple[List[T], List[T], List[T]]:
+        """
+        os.walk-style step: returns (dirs to descend, folders to report,
+        files to report). Callers assign the first to dirs[:] to prune.
+        `name` gets the name out of other item types, such as DirEntry.
+        """
+        scope = self.scope(directory)
+        kept_dirs = [d for d in dirs if self.keep(scope, name(d), True)]
+        kept_files = [f for f in files if self.keep(scope, name(f), False)]
+        report_dirs = [d for d in kept_dirs if self.report(scope, name(d))]
+        report_files = [f for f in kept_files if self.report(scope, name(f))]
+        return (kept_dirs if self.descend(scope) else []), report_dirs, report_files
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import stat as stat_module
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .journal import default_state_dir
+
+HASH_ALGORITHMS = ("sha256", "blake2b")
+READ_BUFFER = 1 << 20  # bytes per read (and per hash update)
+MMAP_MIN = 16 << 20  # files at least this big are mapped instead of read
+MAX_BYTES_IN_FLIGHT = 256 << 20  # file bytes being hashed at once, so few huge files don't thrash the disk
+HASH_WORKERS = min(8, os.cpu_count() or 1)
+POLL_INTERVAL = 0.1  # seconds between progress reports and cancel checks
+CACHE_QUERY_KEYS = 500  # inodes looked up per query
+CACHE_MAX_ROWS = 1_000_000  # digests kept; the oldest go first
+CACHE_PRUNE_TO = 0.9  # share of CACHE_MAX_ROWS left after pruning
+
+# (device, inode, size, mtime_ns): a file whose key is unchanged has the same content.
+FileKey = Tuple[int, int, int, int]
+BytesCallback = Callable[[int, int], None]
+
+
+def default_hash_cache_path() -> str:
+    return os.environ.get("QUICKXRENAME_HASH_CACHE") or os.path.join(default_state_dir(), "hashes.sqlite")
+
+
+def file_key(st: os.stat_result) -> FileKey:
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+class HashCache:
+    """
+    Digests of files already hashed, on disk, keyed by FileKey and algorithm.
+
+    A re-preview of the same tree looks everything up with indexed queries
+    per device and reads no file content. Shared by worker threads, behind a
+    lock. Once it holds more than `max_rows` digests, the ones stored
+    longest ago are dropped; entries of changed files are never hit again
+    and go that way too.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_rows: int = CACHE_MAX_ROWS) -> None:
+        self.path = path or default_hash_cache_path()
+        self.max_rows = max_rows
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, algorithm TEXT, digest TEXT, "
+            "PRIMARY KEY (dev, ino, size, mtime_ns, algorithm)) WITHOUT ROWID"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(digests)")}
+        if "added" not in columns:
+            # Caches written before pruning existed count as the oldest.
+            self._db.execute("ALTER TABLE digests ADD COLUMN added INTEGER NOT NULL DEFAULT 0")
+        self._db.execute("CREATE INDEX IF NOT EXISTS digests_added ON digests (added)")
+        self._db.commit()
+        self._rows: Optional[int] = None  # counted on the first write
+        self._lock = threading.Lock()
+
+    def get_many(self, keys: Iterable[FileKey], algorithm: str) -> Dict[FileKey, str]:
+        wanted = set(keys)
+        # The primary key starts with (dev, ino): one device per query keeps
+        # every lookup on the index.
+        by_device: Dict[int, List[int]] = {}
+        for dev, ino in sorted({key[:2] for key in wanted}):
+            by_device.setdefault(dev, []).append(ino)
+        found = {}
+        with self._lock:
+            for dev, inodes in by_device.items():
+                for start in range(0, len(inodes), CACHE_QUERY_KEYS):
+                    chunk = inodes[start:start + CACHE_QUERY_KEYS]
+                    rows = self._db.execute(
+                        "SELECT ino, size, mtime_ns, digest FROM digests "
+                        f"WHERE dev = ? AND ino IN ({', '.join('?' * len(chunk))}) AND algorithm = ?",
+                        (dev, *chunk, algorithm),
+                    )
+                    for ino, size, mtime_ns, digest in rows:
+                        key = (dev, ino, size, mtime_ns)
+                        if key in wanted:
+                            found[key] = digest
+        return found
+
+    def put_many(self, rows: Iterable[Tuple[FileKey, str, str]]) -> None:
+        added = time.time_ns()
+        values = [(*key, algorithm, digest, added) for key, algorithm, digest in rows]
+        with self._lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO digests (dev, ino, size, mtime_ns, algorithm, digest, added) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                values,
+            )
+            if self._rows is None:
+                self._rows = self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+            else:
+                self._rows += len(values)  # replaced rows overcount until the next prune
+            if self._rows > self.max_rows:
+                self._prune()
+
+    def _prune(self) -> None:
+        keep = int(self.max_rows * CACHE_PRUNE_TO)
+        self._rows = self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+        if self._rows <= keep:
+            return
+        # Everything stored before the newest `keep` rows goes.
+        cutoff = self._db.execute(
+            "SELECT added FROM digests ORDER BY added DESC LIMIT 1 OFFSET ?", (keep,)
+        ).fetchone()[0]
+        self._db.execute("DELETE FROM digests WHERE added <= ?", (cutoff,))
+        self._rows = self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+_default_cache: Optional[HashCache] = None
+_default_lock = threading.Lock()
+
+
+def default_hash_cache() -> HashCache:
+    # One cache per process; without a writable state folder it lives in memory.
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            try:
+                _default_cache = HashCache()
+            except (OSError, sqlite3.Error):
+                _default_cache = HashCache(":memory:")
+        return _default_cache
+
+
+class Hasher:
+    """
+    Content digests of files on a thread pool (hashlib drops the GIL).
+
+    Large files are memory-mapped, the rest read through a buffer of up to
+    READ_BUFFER bytes.
+    Files are started only while the bytes being hashed stay under
+    MAX_BYTES_IN_FLIGHT (one bigger file still runs alone). Progress is
+    reported by bytes, from the calling thread, at most every POLL_INTERVAL
+    and after each batch; cache hits count as done at once.
+    """
+
+    def __init__(
+        self,
+        algorithms: Sequence[str],
+        cache: Optional[HashCache] = None,
+        cancel_check: Optional[Callable[[], bool]] = None,
+        on_bytes: Optional[BytesCallback] = None,
+        workers: int = HASH_WORKERS,
+    ) -> None:
+        self.algorithms = tuple(algorithms)
+        self.cache = cache
+        self.cancel_check = cancel_check
+        self.on_bytes = on_bytes
+        self.pool = ThreadPoolExecutor(max_workers=workers)
+        self.bytes_total = 0
+        self.bytes_cached = 0
+        self._bytes_read = 0
+        self._read_lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self._next_report = 0.0
+
+    def close(self) -> None:
+        self._cancelled.set()
+        self.pool.shutdown(wait=True)
+
+    def _report(self, force: bool = False) -> None:
+        if self.on_bytes is None:
+            return
+        now = time.monotonic()
+        if force or now >= self._next_report:
+            self._next_report = now + POLL_INTERVAL
+            self.on_bytes(self.bytes_cached + self._bytes_read, self.bytes_total)
+
+    def _read(self, count: int) -> None:
+        with self._read_lock:
+            self._bytes_read += count
+
+    def _hash(self, path: str, size: int) -> Optional[Dict[str, str]]:
+        hashers = [hashlib.new(name) for name in self.algorithms]
+        try:
+            with open(path, "rb") as handle:
+                if size >= MMAP_MIN:
+                    with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                        view = memoryview(mapped)
+                        try:
+                            for start in range(0, len(view), READ_BUFFER):
+                                if self._cancelled.is_set():
+                                    return None
+                                with view[start:start + READ_BUFFER] as chunk:
+                                    for hasher in hashers:
+                                        hasher.update(chunk)
+                                    self._read(len(chunk))
+                        finally:
+                            view.release()
+                else:
+                    buffer = bytearray(min(READ_BUFFER, max(size, 1)))
+                    view = memoryview(buffer)
+                    while True:
+                        if self._cancelled.is_set():
+                            return None
+                        count = handle.readinto(buffer)
+                        if not count:
+                            break
+                        for hasher in hashers:
+                            hasher.update(view[:count])
+                        self._read(count)
+        except (OSError, ValueError):
+            return None
+        return {name: hasher.hexdigest() for name, hasher in zip(self.algorithms, hashers)}
+
+    def digests(self, files: Sequence[Tuple[str, os.stat_result]]) -> Dict[str, Dict[str, str]]:
+        """
+        {path: {algorithm: hex digest}} of regular files. Unreadable files,
+        and everything left when cancel_check() turns true, are missing.
+        """
+        results: Dict[str, Dict[str, str]] = {}
+        files = [(path, st) for path, st in files if stat_module.S_ISREG(st.st_mode)]
+        self.bytes_total += sum(st.st_size for _path, st in files)
+
+        todo: Deque[Tuple[str, os.stat_result]] = deque()
+        if self.cache is not None:
+            keys = {path: file_key(st) for path, st in files}
+            cached = {name: self.cache.get_many(keys.values(), name) for name in self.algorithms}
+            for path, st in files:
+                key = keys[path]
+                if all(key in cached[name] for name in self.algorithms):
+                    results[path] = {name: cached[name][key] for name in self.algorithms}
+                    self.bytes_cached += st.st_size
+                else:
+                    todo.append((path, st))
+        else:
+            todo.extend(files)
+
+        running: Dict[Future, Tuple[str, os.stat_result]] = {}
+        in_flight = 0
+        fresh: List[Tuple[FileKey, str, str]] = []
+        try:
+            while todo or running:
+                while todo and (not running or in_flight + todo[0][1].st_size <= MAX_BYTES_IN_FLIGHT):
+                    path, st = todo.popleft()
+                    running[self.pool.submit(self._hash, path, st.st_size)] = (path, st)
+                    in_flight += st.st_size
+                done, _pending = wait(running, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                self._report()
+                if self.cancel_check is not None and self.cancel_check():
+                    self._cancelled.set()
+                    break
+                for future in done:
+                    path, st = running.pop(future)
+                    in_flight -= st.st_size
+                    digests = future.result()
+                    if digests is None:
+                        continue
+                    results[path] = digests
+                    fresh.extend((file_key(st), name, digest) for name, digest in digests.items())
+        finally:
+            if fresh and self.cache is not None:
+                self.cache.put_many(fresh)
+        self._report(force=True)
+        return results
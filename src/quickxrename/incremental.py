@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import dataclasses
+from array import array
+from typing import TYPE_CHECKING, Set
+
+from .models import PreviewRequest
+from .tokens import parse_tokens
+
+if TYPE_CHECKING:
+    from .snapshot import DirectorySnapshot
+
+_WILDCARD_SPECIAL = frozenset("*?[]")
+
+
+def narrows(mode: str, old: str, new: str) -> bool:
+    """
+    True when every name `new` matches is also matched by `old`, as far as
+    the pattern text shows.
+
+    A Replace pattern that still contains the old one matches fewer names.
+    A Wildcard pattern narrows when literal text is typed next to one of its
+    `*`s ("IMG*" -> "IMG_*"); appending elsewhere ("*.jp" -> "*.jpg") does
+    not, and neither does typing next to a `*` inside [...], which is a
+    literal. For Regex only an unchanged pattern counts, since whether a
+    longer regex matches fewer names can't be told from its text.
+    """
+    if not old:
+        return False
+    if old == new:
+        return True
+    if mode == "Replace":
+        return old in new
+    if mode != "Wildcard" or len(new) <= len(old):
+        return False
+    extra = len(new) - len(old)
+    stars = _stars(old)
+    for split in range(len(old) + 1):
+        if not (new.startswith(old[:split]) and new.endswith(old[split:])):
+            continue
+        inserted = new[split:split + extra]
+        if (split - 1 in stars or split in stars) and not _WILDCARD_SPECIAL.intersection(inserted):
+            return True
+    return False
+
+
+def _stars(pattern: str) -> Set[int]:
+    # Positions of the `*`s that are wildcards, skipping those inside a
+    # [...] class ("[*]" is a literal star). Brackets are read as fnmatch
+    # reads them: "[!" and a "]" right after the "[" open the class, and a
+    # "[" that is never closed is a literal.
+    stars = set()
+    index, length = 0, len(pattern)
+    while index < length:
+        char = pattern[index]
+        index += 1
+        if char == "*":
+            stars.add(index - 1)
+        elif char == "[":
+            end = index
+            if end < length and pattern[end] == "!":
+                end += 1
+            if end < length and pattern[end] == "]":
+                end += 1
+            end = pattern.find("]", end)
+            if end >= 0:
+                index = end + 1
+    return stars
+
+
+@dataclasses.dataclass
+class MatchSet:
+    """
+    Names a finished preview's rule matched, as rows of the snapshot it read.
+
+    When the next request only refines the pattern (see narrows()), or just
+    changes the replacement, re-evaluating these rows gives the same preview
+    as walking the whole snapshot again.
+    """
+
+    request: PreviewRequest
+    snapshot: "DirectorySnapshot"
+    rows: array  # array("I"), in walk order
+
+    def serves(self, request: PreviewRequest) -> bool:
+        old = self.request
+        if request.mode not in ("Replace", "Wildcard") or request.steps:
+            return False
+        if dataclasses.replace(old, pattern=request.pattern, replacement=request.replacement) != request:
+            return False
+        # Replace and token results only show names that changed, which is
+        # every match unless the old rule could leave a matched name as it was.
+        if request.mode == "Replace" and old.replacement == old.pattern:
+            return False
+        if parse_tokens(old.replacement).active:
+            return False
+        return narrows(request.mode, old.pattern, request.pattern)
@@ -0,0 +1,321 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .filters import WalkFilter
+from .journal import default_state_dir
+from .models import PreviewRequest, RuleStep
+from .rules import MODES
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    parent INTEGER,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+CREATE TABLE IF NOT EXISTS entries (
+    parent INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    PRIMARY KEY (parent, name)
+) WITHOUT ROWID;
+"""
+
+_SUBTREE = """
+WITH RECURSIVE sub(id) AS (
+    SELECT id FROM dirs WHERE path = ?
+    UNION ALL SELECT dirs.id FROM dirs JOIN sub ON dirs.parent = sub.id
+)
+SELECT dirs.id, dirs.parent, dirs.path, dirs.mtime_ns FROM dirs JOIN sub USING (id)
+"""
+
+_UNLISTED = -1  # mtime_ns of a folder whose entries were never read
+
+# id, parent, path, mtime_ns
+_DirRow = Tuple[int, Optional[int], str, int]
+
+
+def default_index_path() -> str:
+    return os.environ.get("QUICKXRENAME_INDEX_FILE") or os.path.join(default_state_dir(), "index.sqlite")
+
+
+@lru_cache(maxsize=16)
+def _compiled(pattern: str, wildcard: bool) -> re.Pattern:
+    if wildcard:
+        return re.compile(fnmatch.translate(os.path.normcase(pattern)))
+    return re.compile(pattern)
+
+
+def _regexp(pattern: str, name: str) -> bool:
+    return _compiled(pattern, False).search(name) is not None
+
+
+def _wildcard(pattern: str, name: str) -> bool:
+    return _compiled(pattern, True).match(os.path.normcase(name)) is not None
+
+
+def name_clause(mode: str, pattern: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    SQL condition on `name` that keeps every name the rule could rename.
+
+    Replace is a plain instr(); Wildcard uses GLOB where it means the same as
+    fnmatch (case-sensitive paths, no character classes) and a registered
+    function otherwise; Regex goes through REGEXP.
+    """
+    if not pattern:
+        return "0", ()
+    if mode == "Replace":
+        return "instr(name, ?) > 0", (pattern,)
+    if mode == "Wildcard":
+        if os.path.normcase("A") == "A" and "[" not in pattern:
+            return "name GLOB ?", (pattern,)
+        return "wildcard(?, name)", (pattern,)
+    return "name REGEXP ?", (pattern,)
+
+
+def rule_clause(mode: str, pattern: str, steps: Tuple[RuleStep, ...] = ()) -> Tuple[str, Tuple[str, ...]]:
+    """
+    name_clause() of a rule pipeline: a name only changes once some step
+    matches it unchanged, so the steps' conditions are OR'ed. Case and trim
+    steps may change any name.
+    """
+    if any(step.kind not in MODES for step in steps):
+        return "1", ()
+    clauses = [name_clause(mode, pattern), *(name_clause(step.kind, step.pattern) for step in steps)]
+    clauses = [(sql, params) for sql, params in clauses if sql != "0"]
+    if not clauses:
+        return "0", ()
+    return " OR ".join(f"({sql})" for sql, _params in clauses), tuple(p for _sql, params in clauses for p in params)
+
+
+@dataclass
+class RefreshStats:
+    listed: int = 0  # folders read from disk
+    reused: int = 0  # folders whose mtime was unchanged
+    removed: int = 0  # folders dropped with their contents
+    complete: bool = True
+
+
+class TreeIndex:
+    """
+    On-disk index of scanned trees, for roots too big to walk every session.
+
+    Every folder is stored once with its path, parent and mtime, and every
+    item as (parent, name, is_dir). refresh() stats each known folder and
+    lists only those whose mtime changed, so an untouched subtree costs one
+    stat per folder. items() serves the same walk as renamer.iter_items
+    (filters included, names in sorted order) from the index, optionally
+    with a name condition evaluated in SQL so only candidate rows come back.
+
+    One connection is shared by the UI's worker threads, behind a lock.
+    Like SnapshotCache, a root refreshed within `revalidate_after` seconds
+    is not stat'ed again unless a refresh is forced.
+    """
+
+    def __init__(self, path: Optional[str] = None, revalidate_after: float = 2.0) -> None:
+        self.path = path or default_index_path()
+        self.revalidate_after = revalidate_after
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._db.create_function("regexp", 2, _regexp, deterministic=True)
+        self._db.create_function("wildcard", 2, _wildcard, deterministic=True)
+        self._lock = threading.Lock()
+        self._refreshed: Dict[str, float] = {}
+        self.last_refresh = RefreshStats()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _subtree(self, root: str) -> List[_DirRow]:
+        return self._db.execute(_SUBTREE, (root,)).fetchall()
+
+    def _delete(self, ids: List[int]) -> None:
+        rows = [(dir_id,) for dir_id in ids]
+        self._db.executemany("DELETE FROM entries WHERE parent = ?", rows)
+        self._db.executemany("DELETE FROM dirs WHERE id = ?", rows)
+
+    def refresh(
+        self,
+        root: str,
+        force: bool = False,
+        cancel_check: Optional[Callable[[], bool]] = None,
+    ) -> RefreshStats:
+        """Bring the index of `root` up to date with the disk."""
+        stats = RefreshStats()
+        if not force and time.monotonic() - self._refreshed.get(root, float("-inf")) < self.revalidate_after:
+            return stats
+        with self._lock, self._db:
+            rows = self._subtree(root)
+            if not rows:
+                cursor = self._db.execute("INSERT INTO dirs (path, mtime_ns) VALUES (?, ?)", (root, _UNLISTED))
+                rows = [(cursor.lastrowid, None, root, _UNLISTED)]
+            children: Dict[int, Dict[str, _DirRow]] = {}
+            for row in rows[1:]:
+                children.setdefault(row[1], {})[row[2]] = row
+
+            def subtree_ids(row: _DirRow) -> List[int]:
+                ids, stack = [], [row]
+                while stack:
+                    current = stack.pop()
+                    ids.append(current[0])
+                    stack.extend(children.pop(current[0], {}).values())
+                return ids
+
+            stack = [rows[0]]
+            while stack:
+                if cancel_check is not None and cancel_check():
+                    # Finished folders are committed; the rest is listed next time.
+                    stats.complete = False
+                    return stats
+                row = stack.pop()
+                dir_id, _parent, path, stored = row
+                try:
+                    # Stat'ed before listing, so a change racing the listing is caught next time.
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    removed = subtree_ids(row)
+                    self._delete(removed)
+                    stats.removed += len(removed)
+                    continue
+                known = children.get(dir_id, {})
+                if mtime_ns == stored:
+                    stats.reused += 1
+                    stack.extend(known.values())
+                    continue
+                try:
+                    with os.scandir(path) as it:
+                        listing = list(it)
+                except OSError:
+                    listing = []
+                    mtime_ns = _UNLISTED
+                names = []
+                subdirs = []
+                for entry in listing:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    names.append((dir_id, entry.name, is_dir))
+                    if is_dir and not entry.is_symlink():
+                        subdirs.append(entry.path)
+                self._db.execute("DELETE FROM entries WHERE parent = ?", (dir_id,))
+                self._db.executemany("INSERT INTO entries (parent, name, is_dir) VALUES (?, ?, ?)", names)
+                present = set(subdirs)
+                for gone in [child for child in known if child not in present]:
+                    removed = subtree_ids(known.pop(gone))
+                    self._delete(removed)
+                    stats.removed += len(removed)
+                pushed = []
+                for subdir in subdirs:
+                    child = known.get(subdir)
+                    if child is None:
+                        # A folder indexed before as a root of its own is read again from scratch.
+                        self._delete([old[0] for old in self._subtree(subdir)])
+                        cursor = self._db.execute(
+                            "INSERT INTO dirs (path, parent, mtime_ns) VALUES (?, ?, ?)", (subdir, dir_id, _UNLISTED)
+                        )
+                        child = (cursor.lastrowid, dir_id, subdir, _UNLISTED)
+                    pushed.append(child)
+                stack.extend(pushed)
+                self._db.execute("UPDATE dirs SET mtime_ns = ? WHERE id = ?", (mtime_ns, dir_id))
+                stats.listed += 1
+        self._refreshed[root] = time.monotonic()
+        return stats
+
+    def preview_items(
+        self,
+        request: PreviewRequest,
+        walk_filter: Optional[WalkFilter] = None,
+        force: bool = False,
+        cancel_check: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[Tuple[str, bool]]:
+        """Refreshes the request's root, then yields only the items its rule could rename."""
+        stats = self.refresh(request.directory, force, cancel_check)
+        self.last_refresh = stats
+        if not stats.complete:
+            return
+        yield from self.items(
+            request.directory,
+            request.recursive,
+            request.include_files,
+            request.include_folders,
+            walk_filter,
+            rule_clause(request.mode, request.pattern, request.steps),
+            cancel_check,
+        )
+
+    def items(
+        self,
+        root: str,
+        recursive: bool,
+        include_files: bool,
+        include_folders: bool,
+        walk_filter: Optional[WalkFilter] = None,
+        names: Optional[Tuple[str, Tuple[str, ...]]] = None,
+        cancel_check: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[Tuple[str, bool]]:
+        """
+        (path, is_dir) of an indexed root, as renamer.iter_items would walk it.
+
+        `names` is a (condition, params) pair from name_clause(); items it
+        rejects are left out, but their folders are still descended into.
+        Call refresh() first; folders it never listed are skipped.
+        """
+        clause, params = names if names is not None else ("1", ())
+        query = f"SELECT name, is_dir FROM entries WHERE parent = ? AND ({clause}) ORDER BY name"
+        with self._lock:
+            rows = self._subtree(root) if recursive else self._db.execute(
+                "SELECT id, parent, path, mtime_ns FROM dirs WHERE path = ?", (root,)
+            ).fetchall()
+        if not rows:
+            return
+        children: Dict[int, List[_DirRow]] = {}
+        for row in rows[1:]:
+            children.setdefault(row[1], []).append(row)
+
+        stack = [rows[0]]
+        while stack:
+            if cancel_check is not None and cancel_check():
+                return
+            dir_id, _parent, path, _mtime = stack.pop()
+            scope = walk_filter.scope(path) if walk_filter is not None else None
+            with self._lock:
+                listing = self._db.execute(query, (dir_id, *params)).fetchall()
+            folders = []
+            files = []
+            for name, is_dir in listing:
+                if scope is not None and not (
+                    walk_filter.keep(scope, name, bool(is_dir)) and walk_filter.report(scope, name)
+                ):
+                    continue
+                (folders if is_dir else files).append(name)
+            if include_folders:
+                for name in folders:
+                    yield os.path.join(path, name), True
+            if include_files:
+                for name in files:
+                    yield os.path.join(path, name), False
+            if not recursive or (scope is not None and not walk_filter.descend(scope)):
+                continue
+            subdirs = children.get(dir_id, [])
+            if scope is not None:
+                subdirs = [row for row in subdirs if walk_filter.keep(scope, os.path.basename(row[2]), True)]
+            stack.extend(sorted(subdirs, key=_row_path, reverse=True))
+
+
+def _row_path(row: _DirRow) -> str:
+    return row[2]
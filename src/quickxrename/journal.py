@@ -0,0 +1,509 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+JOURNAL_BATCH = 256  # renames covered by one fsync of their intents
+JOURNAL_HISTORY = 50  # finished runs kept on disk
+
+# One journalled step: os.rename(source, target); `final` is where the item
+# ends up once the whole run is done (it differs for files in renamed folders).
+JournalOp = Tuple[str, str, str]
+
+LogFn = Callable[[str], None]
+ProgressFn = Callable[[int, int], None]
+CancelFn = Callable[[], bool]
+
+
+class IncompleteRun(OSError):
+    """An undo or redo skipped or failed some of its renames; the run it acted on keeps its state."""
+
+
+def default_state_dir() -> str:
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    if os.name == "nt":
+        base = os.environ.get("LOCALAPPDATA") or base
+    return os.path.join(base, "quickxrename")
+
+
+def default_journal_dir() -> str:
+    override = os.environ.get("QUICKXRENAME_JOURNAL_DIR")
+    if override:
+        return override
+    return os.path.join(default_state_dir(), "journal")
+
+
+def _identity(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+
+def _fsync_dir(directory: str) -> None:
+    # Makes a newly created file's directory entry durable; not possible on Windows.
+    if os.name == "nt":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@dataclass
+class RunRecord:
+    run_id: str
+    kind: str  # "rename", "undo", "redo"
+    target: Optional[str] = None  # run that an undo/redo acts on
+    complete: bool = False
+    stopped: bool = False  # cancelled by the user; the rest is recorded as intents
+    state: str = "applied"  # rename runs only: "applied" or "undone"
+    ops: List[JournalOp] = field(default_factory=list)
+    status: List[str] = field(default_factory=list)  # per op: "intent", "done", "failed"
+    # op -> (st_dev, st_ino) of its source, for sources a later op renames onto
+    sources: Dict[int, Tuple[int, int]] = field(default_factory=dict)
+
+    def done_ops(self) -> List[JournalOp]:
+        return [op for op, status in zip(self.ops, self.status) if status == "done"]
+
+
+class JournalRun:
+    """
+    Append-only log of one batch of renames.
+
+    Intents are written and fsync'ed a batch at a time before any of those
+    renames run; completion records ride along with the next group commit.
+    After a crash, an intent without a completion record is settled by
+    looking at the filesystem.
+    """
+
+    def __init__(
+        self,
+        journal: "RenameJournal",
+        run_id: str,
+        kind: str,
+        target: Optional[str],
+        resume_count: Optional[int] = None,
+    ) -> None:
+        self.journal = journal
+        self.run_id = run_id
+        self.kind = kind
+        self.target = target
+        self.failures = 0
+        self.stopped = False
+        self._handle = open(journal.run_path(run_id), "a", encoding="utf-8")
+        if resume_count is None:
+            self._count = 0
+            _fsync_dir(journal.directory)
+            self._write({"t": "begin", "kind": kind, "target": target, "time": time.time()})
+            self.commit()
+        else:
+            # Reopened during recovery: intents already on disk keep their indices.
+            self._count = resume_count
+
+    def _write(self, record: dict) -> None:
+        self._handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def commit(self) -> None:
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+
+    def intend(self, ops: Sequence[JournalOp]) -> int:
+        # Returns the index of the first op; the batch is durable on return.
+        # A source that a later op of the batch renames onto gets its file
+        # identity recorded, so recovery can tell the original from its
+        # replacement (see _settle_intents).
+        first = self._count
+        refilled = set()
+        later_targets = set()
+        for offset in range(len(ops) - 1, -1, -1):
+            if ops[offset][0] in later_targets:
+                refilled.add(offset)
+            later_targets.add(ops[offset][1])
+        for offset, (source, target, final) in enumerate(ops):
+            record = {"t": "intent", "i": self._count, "src": source, "dst": target, "final": final}
+            identity = _identity(source) if offset in refilled else None
+            if identity is not None:
+                record["id"] = identity
+            self._write(record)
+            self._count += 1
+        self.commit()
+        return first
+
+    def done(self, index: int) -> None:
+        self._write({"t": "done", "i": index})
+
+    def failed(self, index: int, error: str) -> None:
+        self.failures += 1
+        self._write({"t": "failed", "i": index, "error": error})
+
+    def close(self, rolled_back: bool = False) -> None:
+        if self._handle.closed:
+            return
+        self._write({"t": "end", "rolled_back": rolled_back})
+        self.commit()
+        self._handle.close()
+        self.journal._finished(self, rolled_back)
+
+    def stop(self, remaining: Sequence[JournalOp] = ()) -> None:
+        """
+        Checkpoint a cancelled run: the ops that never ran are recorded as
+        intents and the run stays open, to be replayed or rolled back like an
+        interrupted one. A later close() does nothing.
+        """
+        if self._handle.closed:
+            return
+        if remaining:
+            self.intend(remaining)
+        self._write({"t": "stopped"})
+        self.commit()
+        self._handle.close()
+        self.stopped = True
+        self.journal._append_index({"run": self.run_id, "event": "stopped"})
+
+
+class RenameJournal:
+    """
+    Directory of run logs plus a small index of run events.
+
+    The index only holds begin/end/undone/redone events, so undo and redo
+    availability is known without reading the (possibly huge) run logs.
+    """
+
+    def __init__(self, directory: Optional[str] = None) -> None:
+        self.directory = directory or default_journal_dir()
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "index.jsonl")
+
+    def run_path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl")
+
+    def _append_index(self, record: dict) -> None:
+        with open(self.index_path, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(record) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def begin(self, kind: str, target: Optional[str] = None) -> JournalRun:
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{time.monotonic_ns() % 1_000_000:06d}"
+        run = JournalRun(self, run_id, kind, target)
+        self._append_index({"run": run_id, "event": "begin", "kind": kind, "target": target})
+        return run
+
+    def _finished(self, run: JournalRun, rolled_back: bool) -> None:
+        # An undo or redo changes its target's state only if every op ran;
+        # otherwise the target keeps its history and can be tried again.
+        self._append_index({"run": run.run_id, "event": "end", "rolled_back": rolled_back})
+        if run.kind in ("undo", "redo") and run.target and not rolled_back and not run.failures:
+            self._append_index({"run": run.target, "event": "undone" if run.kind == "undo" else "redone"})
+        self._prune(self.runs())
+
+    def _prune(self, records: Dict[str, RunRecord]) -> None:
+        finished = [r for r in records.values() if r.complete]
+        for record in finished[:-JOURNAL_HISTORY]:
+            try:
+                os.remove(self.run_path(record.run_id))
+            except OSError:
+                pass
+
+    def runs(self) -> Dict[str, RunRecord]:
+        """Run states from the index, oldest first; ops are not loaded."""
+        return self._read_index()[0]
+
+    def _read_index(self) -> Tuple[Dict[str, RunRecord], List[str]]:
+        # Also rebuilds the redo stack: undone runs are pushed, redone ones
+        # popped, and a newly applied rename clears it.
+        records: Dict[str, RunRecord] = {}
+        redo_stack: List[str] = []
+        try:
+            with open(self.index_path, encoding="utf-8") as handle:
+                lines = handle.readlines()
+        except FileNotFoundError:
+            return records, redo_stack
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            run_id = event["run"]
+            if event["event"] == "begin":
+                records[run_id] = RunRecord(run_id, event["kind"], event.get("target"))
+            elif run_id not in records:
+                continue
+            elif event["event"] == "stopped":
+                records[run_id].stopped = True
+            elif event["event"] == "end":
+                records[run_id].complete = True
+                if records[run_id].kind == "rename" and not event.get("rolled_back"):
+                    redo_stack.clear()
+            elif event["event"] == "undone":
+                records[run_id].state = "undone"
+                redo_stack.append(run_id)
+            elif event["event"] == "redone":
+                records[run_id].state = "applied"
+                if run_id in redo_stack:
+                    redo_stack.remove(run_id)
+        records = {run_id: r for run_id, r in records.items() if os.path.exists(self.run_path(run_id))}
+        return records, [run_id for run_id in redo_stack if run_id in records]
+
+    def load(self, run_id: str) -> RunRecord:
+        record = self.runs().get(run_id) or RunRecord(run_id, "rename")
+        with open(self.run_path(run_id), encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                kind = entry["t"]
+                if kind == "intent":
+                    if "id" in entry:
+                        record.sources[len(record.ops)] = tuple(entry["id"])
+                    record.ops.append((entry["src"], entry["dst"], entry["final"]))
+                    record.status.append("intent")
+                elif kind in ("done", "failed"):
+                    record.status[entry["i"]] = kind
+                elif kind == "begin":
+                    record.kind = entry["kind"]
+                    record.target = entry.get("target")
+        return record
+
+    def undo_candidate(self) -> Optional[RunRecord]:
+        renames = [r for r in self.runs().values() if r.kind == "rename" and r.complete]
+        for record in reversed(renames):
+            if record.state == "applied":
+                return record
+        return None
+
+    def redo_candidate(self) -> Optional[RunRecord]:
+        records, redo_stack = self._read_index()
+        return records[redo_stack[-1]] if redo_stack else None
+
+    def incomplete(self) -> List[RunRecord]:
+        # Unfinished runs of this process are still executing, unless stopped.
+        own = f"-{os.getpid()}-"
+        return [r for r in self.runs().values() if not r.complete and (r.stopped or own not in r.run_id)]
+
+    def _standing(self, run_id: str, done: Sequence[JournalOp]) -> List[bool]:
+        # Per op of `done` (the completed ops of run_id): whether it is still
+        # in effect after the undo and redo runs on run_id so far, replayed in
+        # order. A partial undo or redo leaves the state alone, so trying it
+        # again only does the ops the previous attempt didn't.
+        position = {(source, target): index for index, (source, target, _final) in enumerate(done)}
+        standing = [True] * len(done)
+        for other in self.runs().values():
+            if other.target != run_id or other.kind not in ("undo", "redo"):
+                continue
+            for source, target, _final in self.load(other.run_id).done_ops():
+                index = position.get((target, source) if other.kind == "undo" else (source, target))
+                if index is not None:
+                    standing[index] = other.kind == "redo"
+        return standing
+
+    def undo(
+        self, log_fn: LogFn, on_progress: Optional[ProgressFn] = None, cancel_check: Optional[CancelFn] = None
+    ) -> Optional[RunRecord]:
+        record = self.undo_candidate()
+        if record is None:
+            return None
+        done = self.load(record.run_id).done_ops()
+        standing = self._standing(record.run_id, done)
+        # Reverse order restores every rename from the exact path it produced.
+        ops = [
+            (target, source, source)
+            for (source, target, _final), applied in zip(reversed(done), reversed(standing))
+            if applied
+        ]
+        run = self.begin("undo", target=record.run_id)
+        execute_journaled(run, ops, log_fn, "Undo", on_progress, cancel_check)
+        run.close()
+        _check_complete(run, len(ops), record)
+        return record
+
+    def redo(
+        self, log_fn: LogFn, on_progress: Optional[ProgressFn] = None, cancel_check: Optional[CancelFn] = None
+    ) -> Optional[RunRecord]:
+        record = self.redo_candidate()
+        if record is None:
+            return None
+        done = self.load(record.run_id).done_ops()
+        ops = [op for op, applied in zip(done, self._standing(record.run_id, done)) if not applied]
+        run = self.begin("redo", target=record.run_id)
+        execute_journaled(run, ops, log_fn, "Redo", on_progress, cancel_check)
+        run.close()
+        _check_complete(run, len(ops), record)
+        return record
+
+    def recover(
+        self,
+        run_id: str,
+        rollback: bool,
+        log_fn: LogFn,
+        on_progress: Optional[ProgressFn] = None,
+        cancel_check: Optional[CancelFn] = None,
+    ) -> None:
+        """
+        Settle an interrupted or stopped run: roll it back, or replay its
+        remaining intents. A replay can be stopped again between batches.
+        """
+        record = self.load(run_id)
+        run = JournalRun(self, run_id, record.kind, record.target, resume_count=len(record.ops))
+        run.failures = record.status.count("failed")
+        _settle_intents(record, run)
+
+        if not rollback:
+            total = len(record.ops)
+            for index, ((source, target, _final), status) in enumerate(zip(record.ops, record.status)):
+                if index % JOURNAL_BATCH == 0 and cancel_check is not None and cancel_check():
+                    run.stop()
+                    return
+                if status == "intent":
+                    _rename_one(run, index, source, target, log_fn, "Replay")
+                if on_progress is not None:
+                    on_progress(index + 1, total)
+            run.close()
+            return
+
+        run.close(rolled_back=True)
+        # Rolling back is the opposite action, journalled like any other.
+        if record.kind == "rename":
+            kind, target_run = "undo", run_id
+        else:
+            kind, target_run = ("redo" if record.kind == "undo" else "undo"), record.target
+        ops = [(target, source, source) for source, target, _final in reversed(record.done_ops())]
+        reverse = self.begin(kind, target=target_run)
+        execute_journaled(reverse, ops, log_fn, "Rollback", on_progress, cancel_check)
+        reverse.close()
+
+
+def _check_complete(run: JournalRun, total: int, record: RunRecord) -> None:
+    # A stopped run is reported as stopped; its failures show once it is settled.
+    if run.failures and not run.stopped:
+        raise IncompleteRun(
+            f"{run.kind} of {record.run_id}: {run.failures} of {total} rename(s) skipped or failed; "
+            f"the run is still {record.state}"
+        )
+
+
+def _settle_intents(record: RunRecord, run: JournalRun) -> None:
+    """
+    Marks the intents of an interrupted run that did happen as done.
+
+    The crash hid whether they ran; the filesystem knows. A rename ran if its
+    source is gone and its target is there, but a source made by an earlier
+    op only counts as gone once that op is settled. Later ops can hide the
+    evidence: one renaming onto this op's source re-creates it (the planner
+    journals a chain as b->c, a->b), one renaming its target on removes it.
+    Either having run means this op ran first, so settled ops are carried
+    back to the ops they depend on, until nothing changes. A re-created
+    source also counts as gone when it is no longer the file the intent
+    recorded, which settles a finished cycle (a->tmp, b->a, tmp->b).
+    """
+    ops, status = record.ops, record.status
+    count = len(ops)
+    creator: List[Optional[int]] = [None] * count  # earlier op that made the source
+    refill: List[Optional[int]] = [None] * count  # later op renaming onto the source
+    onward: List[Optional[int]] = [None] * count  # later op renaming the target on
+    by_target: Dict[str, int] = {}
+    for index, (source, target, _final) in enumerate(ops):
+        creator[index] = by_target.get(source)
+        by_target[target] = index
+    by_target = {}
+    by_source: Dict[str, int] = {}
+    for index in range(count - 1, -1, -1):
+        source, target, _final = ops[index]
+        refill[index] = by_target.get(source)
+        onward[index] = by_source.get(target)
+        by_target[target] = index
+        by_source[source] = index
+
+    exists: Dict[str, bool] = {}
+
+    def lexists(path: str) -> bool:
+        if path not in exists:
+            exists[path] = os.path.lexists(path)
+        return exists[path]
+
+    def settled(index: Optional[int]) -> bool:
+        return index is not None and status[index] == "done"
+
+    def gone(index: int) -> bool:
+        source = ops[index][0]
+        if not lexists(source):
+            return True
+        recorded = record.sources.get(index)
+        return recorded is not None and _identity(source) != recorded
+
+    changed = True
+    while changed:
+        changed = False
+        for index, (source, target, _final) in enumerate(ops):
+            if status[index] != "intent" or (creator[index] is not None and not settled(creator[index])):
+                continue
+            if gone(index) and (lexists(target) or onward[index] is not None):
+                status[index] = "done"
+                run.done(index)
+                changed = True
+        for index in range(count - 1, -1, -1):
+            if status[index] == "intent" and (settled(refill[index]) or settled(onward[index])):
+                status[index] = "done"
+                run.done(index)
+                changed = True
+
+
+def _same_entry(first: str, second: str) -> bool:
+    # A case-only rename on a case-insensitive filesystem "exists" as itself.
+    try:
+        return os.path.samestat(os.lstat(first), os.lstat(second))
+    except OSError:
+        return False
+
+
+def _rename_one(run: JournalRun, index: int, source: str, target: str, log_fn: LogFn, label: str) -> bool:
+    try:
+        if not os.path.lexists(source):
+            run.failed(index, "missing")
+            log_fn(f"{label} skipped (missing): {source}")
+            return False
+        # Never rename over an existing item; replaying a step that already
+        # ran would otherwise destroy what now sits at its target.
+        if os.path.lexists(target) and not _same_entry(source, target):
+            run.failed(index, "target exists")
+            log_fn(f"{label} skipped (target exists): {source} -> {target}")
+            return False
+        os.rename(source, target)
+    except OSError as exc:
+        run.failed(index, str(exc))
+        log_fn(f"{label} failed: {source} -> {target} ({exc})")
+        return False
+    run.done(index)
+    log_fn(f"{label}: {source} -> {target}")
+    return True
+
+
+def execute_journaled(
+    run: JournalRun,
+    ops: Sequence[JournalOp],
+    log_fn: LogFn,
+    label: str,
+    on_progress: Optional[ProgressFn] = None,
+    cancel_check: Optional[CancelFn] = None,
+) -> List[JournalOp]:
+    # A cancel between batches stops the run with the rest as its checkpoint.
+    completed: List[JournalOp] = []
+    for start in range(0, len(ops), JOURNAL_BATCH):
+        if cancel_check is not None and cancel_check():
+            run.stop(ops[start:])
+            break
+        batch = ops[start:start + JOURNAL_BATCH]
+        first = run.intend(batch)
+        for offset, (source, target, final) in enumerate(batch):
+            if _rename_one(run, first + offset, source, target, log_fn, label):
+                completed.append((source, target, final))
+        if on_progress is not None:
+            on_progress(start + len(batch), len(ops))
+    return completed
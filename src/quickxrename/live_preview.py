@@ -0,0 +1,360 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from .models import PreviewEntry, PreviewRequest, PreviewStats, WatchEvent
+from .pathmap import FolderMapping
+from .pipeline import compile_steps, request_template
+from .renamer import is_invalid_name, walk_filter_for
+
+
+# path -> (stat, digests) of files whose new name has tokens, see LivePreview.measure()
+Measured = Dict[str, Tuple[Optional[os.stat_result], Optional[Dict[str, str]]]]
+
+WAITING = "waiting for the file to be written"
+
+
+class RowChanges(NamedTuple):
+    # Entries to write by table row, and the table's new length; rows past
+    # the old length are appended.
+    rows: Dict[int, PreviewEntry]
+    length: int
+
+
+class LivePreview:
+    """
+    Preview state that follows filesystem events.
+
+    Starting from a finished build_preview result, each created or deleted
+    path only re-evaluates its own rename and the conflict groups of the
+    targets it touches. Adding or removing a folder rename re-resolves the
+    final paths of the remaining candidates, but never re-walks the tree.
+
+    The item count follows the events it sees; contents of a folder that is
+    moved out of the tree leave without events and are not subtracted.
+    take_changes() hands the table only the rows that changed since the
+    last call; a removed row is filled by the table's last row.
+
+    When names depend on a file's contents or metadata (follows_writes), a
+    file that is still being written shows as "pending" and gets its name
+    once the watcher reports it written. The stats and digests tokens need are taken
+    by measure() on the watcher's thread, never here.
+    """
+
+    def __init__(self, request: PreviewRequest, entries: Iterable[PreviewEntry], stats: PreviewStats) -> None:
+        self.request = request
+        self.template, steps = request_template(request)
+        self.rule = compile_steps(request.mode, request.pattern, self.template.replacement, steps)
+        self.walk_filter = walk_filter_for(request)
+        self.items = stats.items
+        self._entries: Dict[str, PreviewEntry] = {}
+        self._candidates: Dict[str, Tuple[str, bool]] = {}
+        self._finals: Dict[str, str] = {}
+        self._targets: Dict[str, Set[str]] = {}
+        self._counts = {"ready": 0, "conflict": 0, "invalid": 0, "pending": 0}
+        self._serial = 0  # {n} of items added later continues after the preview's
+        self._serials: Dict[str, int] = {}  # {n} of the items numbered here
+        self._rows: Dict[str, int] = {}  # old path -> table row
+        self._shown: List[Optional[str]] = []  # table row -> old path
+        self._dirty: Set[str] = set()
+        for entry in entries:
+            self._serial += 1
+            self._set_entry(entry)
+            self._rows[entry.old_path] = len(self._shown)
+            self._shown.append(entry.old_path)
+            if entry.status != "invalid":
+                self._candidates[entry.old_path] = (entry.raw_new_path, entry.item_type == "folder")
+                self._finals[entry.old_path] = entry.final_new_path
+                self._targets.setdefault(entry.final_new_path, set()).add(entry.old_path)
+        self._mapping = self._build_mapping()
+        self._dirty.clear()
+
+    @property
+    def follows_writes(self) -> bool:
+        """Whether new names depend on file contents or metadata, so writes are watched."""
+        return self.template.needs_stat or bool(self.template.hashes)
+
+    @property
+    def pending(self) -> int:
+        return self._counts["pending"]
+
+    def _token_name(self, path: str) -> Optional[str]:
+        # The rule's result for `path` when it still has tokens to fill in.
+        name = os.path.basename(path)
+        new_name = self.rule.apply(name)
+        if new_name is None or new_name == name or not self.template.marked(new_name):
+            return None
+        return None if self.template.collides(path) else new_name
+
+    def measure(self, events: Sequence[WatchEvent], hasher=None) -> Measured:
+        """
+        Stats and digests that apply() needs for `events`. Only the rule and
+        template are read, so the watcher's thread calls this before handing
+        the events over; `hasher` is a hashing.Hasher for the template's
+        digests, kept by the caller across batches.
+        """
+        if not (self.template.needs_stat or self.template.hashes):
+            return {}
+        stats = {}
+        for event in events:
+            if event.kind == "written" or (event.kind == "created" and event.settled):
+                if event.path not in stats and self._token_name(event.path) is not None:
+                    try:
+                        stats[event.path] = os.stat(event.path)
+                    except OSError:
+                        pass
+        digests: Dict[str, Dict[str, str]] = {}
+        if self.template.hashes and stats:
+            own = hasher is None
+            if own:
+                from .hashing import Hasher, default_hash_cache
+
+                hasher = Hasher(self.template.hashes, default_hash_cache())
+            try:
+                digests = hasher.digests(list(stats.items()))
+            finally:
+                if own:
+                    hasher.close()
+        return {path: (stat, digests.get(path)) for path, stat in stats.items()}
+
+    def _build_mapping(self) -> FolderMapping:
+        return FolderMapping((old, new) for old, (new, is_dir) in self._candidates.items() if is_dir)
+
+    def _set_entry(self, entry: PreviewEntry) -> None:
+        previous = self._entries.get(entry.old_path)
+        if previous is not None:
+            self._counts[previous.status] -= 1
+        if previous != entry:
+            self._dirty.add(entry.old_path)
+        self._entries[entry.old_path] = entry
+        self._counts[entry.status] += 1
+
+    def _drop_entry(self, old_path: str) -> None:
+        previous = self._entries.pop(old_path, None)
+        if previous is not None:
+            self._counts[previous.status] -= 1
+            self._dirty.add(old_path)
+
+    def _included(self, is_dir: bool) -> bool:
+        return self.request.include_folders if is_dir else self.request.include_files
+
+    def _in_scope(self, path: str) -> bool:
+        root = self.request.directory.rstrip(os.sep) or os.sep
+        parent = os.path.dirname(path)
+        if self.request.recursive:
+            return parent == root or parent.startswith(root.rstrip(os.sep) + os.sep)
+        return parent == root
+
+    def _add_target(self, old_path: str, final: str) -> None:
+        self._finals[old_path] = final
+        self._targets.setdefault(final, set()).add(old_path)
+
+    def _remove_target(self, old_path: str) -> str | None:
+        final = self._finals.pop(old_path, None)
+        if final is not None:
+            group = self._targets.get(final)
+            if group is not None:
+                group.discard(old_path)
+                if not group:
+                    del self._targets[final]
+        return final
+
+    def _remove(self, old_path: str, affected: Set[str]) -> bool:
+        # Returns True when a folder rename went away.
+        self._drop_entry(old_path)
+        candidate = self._candidates.pop(old_path, None)
+        if candidate is None:
+            return False
+        final = self._remove_target(old_path)
+        if final is not None:
+            affected.add(final)
+        return candidate[1]
+
+    def _add(self, path: str, is_dir: bool, affected: Set[str], settled: bool, measured: Measured) -> bool:
+        # Returns True when a folder rename was added.
+        name = os.path.basename(path)
+        new_name = self.rule.apply(name)
+        if new_name is None or new_name == name:
+            return False
+        if self.template.marked(new_name):
+            if self.template.collides(path):
+                return False
+            serial = self._serials.get(path)
+            if serial is None:
+                self._serial += 1
+                serial = self._serials[path] = self._serial
+            if not settled and self.follows_writes:
+                self._set_pending(path, is_dir)
+                return False
+            stat, digests = measured.get(path, (None, None))
+            if (self.template.needs_stat or self.template.hashes) and stat is None:
+                return False
+            if self.template.hashes and digests is None:
+                return False
+            new_name = self.template.expand(path, new_name, serial, stat, digests)
+            if new_name == name:
+                return False
+        new_path = os.path.join(os.path.dirname(path), new_name)
+        invalid_reason = is_invalid_name(new_name)
+        if invalid_reason:
+            self._set_entry(PreviewEntry(
+                item_type="folder" if is_dir else "file",
+                old_path=path,
+                raw_new_path=new_path,
+                final_new_path=new_path,
+                status="invalid",
+                message=invalid_reason,
+            ))
+            return False
+        self._candidates[path] = (new_path, is_dir)
+        final = self._mapping.resolve_parent(new_path)
+        self._add_target(path, final)
+        affected.add(final)
+        return is_dir
+
+    def _set_pending(self, path: str, is_dir: bool) -> None:
+        self._set_entry(PreviewEntry(
+            item_type="folder" if is_dir else "file",
+            old_path=path,
+            raw_new_path=path,
+            final_new_path=path,
+            status="pending",
+            message=WAITING,
+        ))
+
+    def _remap_all(self, affected: Set[str]) -> None:
+        self._mapping = self._build_mapping()
+        for old_path, (new_path, _is_dir) in self._candidates.items():
+            final = self._mapping.resolve_parent(new_path)
+            if final != self._finals.get(old_path):
+                affected.add(self._remove_target(old_path) or final)
+                self._add_target(old_path, final)
+                affected.add(final)
+
+    def _settle(self, old_path: str) -> None:
+        new_path, is_dir = self._candidates[old_path]
+        final = self._finals[old_path]
+        status = "ready"
+        message = ""
+        if len(self._targets.get(final, ())) > 1:
+            status = "conflict"
+            message = "multiple items target same path"
+        if os.path.exists(new_path) and new_path not in self._candidates:
+            status = "conflict"
+            message = "target already exists"
+        self._set_entry(PreviewEntry(
+            item_type="folder" if is_dir else "file",
+            old_path=old_path,
+            raw_new_path=new_path,
+            final_new_path=final,
+            status=status,
+            message=message,
+        ))
+
+    def apply(self, events: Sequence[WatchEvent], measured: Optional[Measured] = None) -> bool:
+        """
+        Feed watcher events in, with what measure() took for them (measured
+        here when None). Returns False when a full rebuild is required.
+        """
+        if measured is None:
+            measured = self.measure(events)
+        affected: Set[str] = set()
+        touched = []
+        remap = False
+        for event in events:
+            if event.kind == "rescan":
+                return False
+            # Any path that appears or disappears may be another item's target.
+            touched.append(event.path)
+            tracked = self._in_scope(event.path) and self._included(event.is_dir) and (
+                self.walk_filter is None or self.walk_filter.admits(event.path, event.is_dir)
+            )
+            if event.kind == "deleted":
+                if tracked:
+                    self.items = max(0, self.items - 1)
+                gone = [event.path]
+                if event.is_dir:
+                    # A folder moved out of the tree takes its contents without further events.
+                    prefix = event.path + os.sep
+                    gone.extend(p for p in self._entries if p.startswith(prefix))
+                for path in gone:
+                    remap = self._remove(path, affected) or remap
+                    self._serials.pop(path, None)
+            elif event.kind == "created" and tracked:
+                if event.path in self._entries:
+                    remap = self._remove(event.path, affected) or remap
+                else:
+                    self.items += 1
+                remap = self._add(event.path, event.is_dir, affected, event.settled, measured) or remap
+            elif event.kind == "modified" and tracked and self.follows_writes:
+                # Its size, mtime or digest is about to change; wait for the write.
+                if self._token_name(event.path) is not None:
+                    remap = self._remove(event.path, affected) or remap
+                    self._set_pending(event.path, event.is_dir)
+            elif event.kind == "written" and tracked:
+                # The file's name may depend on what was just written.
+                if event.path in self._entries:
+                    remap = self._remove(event.path, affected) or remap
+                remap = self._add(event.path, event.is_dir, affected, True, measured) or remap
+
+        if remap:
+            self._remap_all(affected)
+        # Targets are grouped by final path; one under a renamed folder is
+        # found through where its folder ends up.
+        affected.update(self._mapping.resolve_parent(path) for path in touched)
+        for target in affected:
+            for old_path in list(self._targets.get(target, ())):
+                self._settle(old_path)
+        return True
+
+    def take_changes(self) -> RowChanges:
+        """Table rows to rewrite since the last call, with the new row count."""
+        rows: Dict[int, PreviewEntry] = {}
+        added: List[PreviewEntry] = []
+        holes: List[int] = []
+        for path in self._dirty:
+            row = self._rows.get(path)
+            entry = self._entries.get(path)
+            if row is None:
+                if entry is not None:
+                    added.append(entry)
+            elif entry is None:
+                del self._rows[path]
+                self._shown[row] = None
+                holes.append(row)
+            else:
+                rows[row] = entry
+        self._dirty.clear()
+
+        shown = self._shown
+        for hole in sorted(holes):
+            if added:
+                entry = added.pop()
+            else:
+                # Move the last row up; trailing holes just go away.
+                while shown and shown[-1] is None:
+                    shown.pop()
+                if hole >= len(shown):
+                    continue
+                path = shown.pop()
+                rows.pop(len(shown), None)
+                entry = self._entries[path]
+            shown[hole] = entry.old_path
+            self._rows[entry.old_path] = hole
+            rows[hole] = entry
+        while shown and shown[-1] is None:
+            shown.pop()
+        for entry in added:
+            self._rows[entry.old_path] = len(shown)
+            rows[len(shown)] = entry
+            shown.append(entry.old_path)
+        return RowChanges(rows, len(shown))
+
+    def stats(self) -> PreviewStats:
+        return PreviewStats(
+            items=self.items,
+            ready=self._counts["ready"],
+            conflicts=self._counts["conflict"],
+            invalid=self._counts["invalid"],
+        )
@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import os
+import threading
+from typing import Optional, Sequence
+
+from .journal import default_state_dir
+
+LOG_FILE_MAX_BYTES = 20 * 1024 * 1024  # rotated to .1 when opened above this size
+
+
+def default_log_path() -> str:
+    return os.environ.get("QUICKXRENAME_LOG_FILE") or os.path.join(default_state_dir(), "quickxrename.log")
+
+
+class LogFile:
+    """
+    The full, uncapped log, appended to from the UI and worker threads.
+
+    Writers hand over whole batches of lines, so a busy rename costs one
+    write and flush per batch rather than one per file.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path or default_log_path()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        try:
+            if os.path.getsize(self.path) > LOG_FILE_MAX_BYTES:
+                os.replace(self.path, self.path + ".1")
+        except OSError:
+            pass
+        self._lock = threading.Lock()
+        self._handle = open(self.path, "a", encoding="utf-8")
+
+    def write_lines(self, lines: Sequence[str]) -> None:
+        if not lines:
+            return
+        with self._lock:
+            if self._handle.closed:
+                return
+            self._handle.write("\n".join(lines) + "\n")
+            self._handle.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._handle.close()
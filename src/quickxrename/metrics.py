@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import json
+import time
+from contextlib import nullcontext
+from typing import Dict, Iterable, Iterator, List, Sequence, TypeVar
+
+T = TypeVar("T")
+
+_NO_SPAN = nullcontext()
+
+
+class _Span:
+    # Times one `with` block; time recorded meanwhile under `exclude` is
+    # taken out, so nested stages are not counted twice.
+    __slots__ = ("metrics", "name", "exclude", "start", "excluded")
+
+    def __init__(self, metrics: "Metrics", name: str, exclude: Sequence[str]) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.exclude = exclude
+
+    def __enter__(self) -> "_Span":
+        self.excluded = self.metrics._total(self.exclude)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self.start
+        self.metrics.add(self.name, elapsed - (self.metrics._total(self.exclude) - self.excluded))
+
+
+class Metrics:
+    """
+    Stage timings and counters of one preview or rename run.
+
+    Stages are coarse (walk, rule, mapping, ...): each `with stage(...)`
+    costs two clock reads, and `timed()` attributes the time spent inside an
+    iterator, for stages that are interleaved in one loop. Counters are added
+    once per run, never per item. Code paths take a Metrics and default to
+    NULL_METRICS, whose hooks do nothing, so disabled instrumentation adds no
+    per-item work at all.
+    """
+
+    enabled = True
+
+    def __init__(self) -> None:
+        self.seconds: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {}
+
+    def _total(self, names: Sequence[str]) -> float:
+        return sum(self.seconds.get(name, 0.0) for name in names)
+
+    def add(self, name: str, seconds: float) -> None:
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name: str, value: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def stage(self, name: str, exclude: Sequence[str] = ()):
+        return _Span(self, name, exclude)
+
+    def timed(self, name: str, iterable: Iterable[T], exclude: Sequence[str] = ()) -> Iterator[T]:
+        """Yields from `iterable`, recording the time spent producing the items."""
+        iterator = iter(iterable)
+        clock = time.perf_counter
+        total = 0.0
+        excluded = self._total(exclude)
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    total += clock() - start
+                    return
+                total += clock() - start
+                yield item
+        finally:
+            self.add(name, total - (self._total(exclude) - excluded))
+
+    def merge(self, other: "Metrics") -> None:
+        for name, seconds in other.seconds.items():
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+            self.calls[name] = self.calls.get(name, 0) + other.calls[name]
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    @property
+    def total(self) -> float:
+        return sum(self.seconds.values())
+
+    def as_dict(self) -> dict:
+        return {
+            "stages": {
+                name: {"seconds": round(seconds, 6), "calls": self.calls[name]}
+                for name, seconds in self.seconds.items()
+            },
+            "counters": dict(self.counters),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.as_dict(), indent=2)
+
+    def format_lines(self) -> List[str]:
+        total = self.total
+        lines = []
+        for name, seconds in self.seconds.items():
+            share = seconds / total if total > 0 else 0.0
+            lines.append(f"{name:<12} {seconds * 1000:>10.1f} ms {share:>6.1%}")
+        lines.append(f"{'total':<12} {total * 1000:>10.1f} ms")
+        lines.extend(f"{name:<12} {value:>10}" for name, value in self.counters.items())
+        return lines
+
+
+class NullMetrics(Metrics):
+    """Metrics that record nothing; the default when instrumentation is off."""
+
+    enabled = False
+
+    def add(self, name: str, seconds: float) -> None:
+        pass
+
+    def count(self, name: str, value: int = 1) -> None:
+        pass
+
+    def stage(self, name: str, exclude: Sequence[str] = ()):
+        return _NO_SPAN
+
+    def timed(self, name: str, iterable: Iterable[T], exclude: Sequence[str] = ()) -> Iterable[T]:
+        return iterable
+
+    def merge(self, other: Metrics) -> None:
+        pass
+
+
+NULL_METRICS = NullMetrics()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from typing import Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -27,6 +28,13 @@ class RenameOperation:
     old_path: str
 
 
+@dataclass(frozen=True)
+class RuleStep:
+    kind: str  # a rule mode, a case step or "Trim", see pipeline.STEP_KINDS
+    pattern: str = ""  # for Trim, the characters to strip (empty: whitespace)
+    replacement: str = ""
+
+
 @dataclass(frozen=True)
 class PreviewRequest:
     directory: str
@@ -36,3 +44,21 @@ class PreviewRequest:
     mode: str
     pattern: str
     replacement: str
+    case_insensitive: Optional[bool] = None  # None follows the platform default
+    # Walk filters, see filters.WalkFilter.
+    include: Tuple[str, ...] = ()
+    exclude: Tuple[str, ...] = ()
+    max_depth: Optional[int] = None
+    include_hidden: bool = True
+    use_gitignore: bool = False
+    walk_workers: int = 0  # >1 lists folders on that many threads, see walker.walk_parallel
+    # Steps applied after mode/pattern/replacement, in order, see pipeline.RulePipeline.
+    steps: Tuple[RuleStep, ...] = ()
+
+
+@dataclass(frozen=True)
+class WatchEvent:
+    kind: str  # "created", "modified", "written", "deleted" or "rescan"
+    path: str
+    is_dir: bool
+    settled: bool = True  # False for a file created that is still being written
@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import atexit
+import itertools
+import os
+import sys
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Callable, Deque, Iterable, Iterator, List, Optional, Tuple
+
+from .models import RuleStep
+from .pipeline import compile_steps
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future, ProcessPoolExecutor
+
+PARALLEL_THRESHOLD = 150_000  # names evaluated in-process before a pool is started
+SHARD_SIZE = 20_000
+CANCEL_POLL_INTERVAL = 0.1
+
+EvaluatedItem = Tuple[str, bool, Optional[str]]
+
+_pool: Optional["ProcessPoolExecutor"] = None
+_pool_workers = 0
+_pool_lock = threading.Lock()
+_exit_hooked = False
+
+
+def shared_pool(workers: int) -> "ProcessPoolExecutor":
+    """
+    The process pool of this process, started on first use and kept, so
+    later previews don't pay for spawning and importing the package again.
+    """
+    global _pool, _pool_workers, _exit_hooked
+    with _pool_lock:
+        if _pool is not None and _pool_workers == workers:
+            return _pool
+        # Imported here so headless start-up doesn't pay for multiprocessing.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        # spawn keeps worker start-up safe from the GUI's threads.
+        _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        _pool_workers = workers
+        if not _exit_hooked:
+            atexit.register(shutdown_pool)
+            _exit_hooked = True
+        return _pool
+
+
+def shutdown_pool(pool: Optional["ProcessPoolExecutor"] = None) -> None:
+    """Stops the shared pool (only if it is still `pool`, when given)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or (pool is not None and pool is not _pool):
+            return
+        pool, _pool = _pool, None
+    pool.shutdown(wait=True, cancel_futures=True)
+
+
+def auto_threshold(mode: str, steps: Tuple[RuleStep, ...] = ()) -> int:
+    # Literal and wildcard rules are cheaper than shipping names to another
+    # process, and a single core gains nothing; only regexes get the pool.
+    has_regex = mode == "Regex" or any(step.kind == "Regex" for step in steps)
+    if not has_regex or (os.cpu_count() or 1) < 2:
+        return sys.maxsize
+    return PARALLEL_THRESHOLD
+
+
+def evaluate_shard(
+    mode: str, pattern: str, replacement: str, names: List[str], steps: Tuple[RuleStep, ...] = ()
+) -> List[Tuple[int, str]]:
+    # Runs in a worker process; only changed names travel back.
+    rule = compile_steps(mode, pattern, replacement, steps)
+    changes = []
+    for index, name in enumerate(names):
+        new_name = rule.apply(name)
+        if new_name is not None and new_name != name:
+            changes.append((index, new_name))
+    return changes
+
+
+def _shards(items: Iterator[Tuple[str, bool]], size: int) -> Iterator[List[Tuple[str, bool]]]:
+    shard: List[Tuple[str, bool]] = []
+    for item in items:
+        shard.append(item)
+        if len(shard) >= size:
+            yield shard
+            shard = []
+    if shard:
+        yield shard
+
+
+def iter_evaluated(
+    mode: str,
+    pattern: str,
+    replacement: str,
+    items: Iterable[Tuple[str, bool]],
+    cancel_check: Callable[[], bool],
+    threshold: int = PARALLEL_THRESHOLD,
+    shard_size: int = SHARD_SIZE,
+    workers: Optional[int] = None,
+    steps: Tuple[RuleStep, ...] = (),
+) -> Iterator[EvaluatedItem]:
+    """
+    Yield (path, is_dir, new_name) in walk order.
+
+    The first `threshold` items are evaluated in-process, so small trees never
+    pay for process start-up. The rest are sharded over the shared process
+    pool with a bounded number of shards in flight; new_name is None when
+    unchanged.
+    Stops early, cancelling queued shards, once cancel_check() is true.
+    `steps` run after the rule, see pipeline.RulePipeline.
+    """
+    rule = compile_steps(mode, pattern, replacement, steps)
+    iterator = iter(items)
+    count = 0
+    for path, is_dir in itertools.islice(iterator, threshold):
+        yield path, is_dir, rule.apply(os.path.basename(path))
+        count += 1
+    if count < threshold:
+        return
+
+    from concurrent.futures import FIRST_COMPLETED, BrokenExecutor, wait
+
+    workers = workers or os.cpu_count() or 1
+    pool = shared_pool(workers)
+    pending: Deque[Tuple[Future, List[Tuple[str, bool]]]] = deque()
+    cancelled = False
+
+    def drain() -> Iterator[EvaluatedItem]:
+        nonlocal cancelled
+        future, shard = pending.popleft()
+        while not future.done():
+            if cancel_check():
+                cancelled = True
+                return
+            wait([future], timeout=CANCEL_POLL_INTERVAL, return_when=FIRST_COMPLETED)
+        changes = dict(future.result())
+        for index, (path, is_dir) in enumerate(shard):
+            yield path, is_dir, changes.get(index)
+
+    try:
+        for shard in _shards(iterator, shard_size):
+            if cancel_check():
+                cancelled = True
+                return
+            names = [os.path.basename(path) for path, _ in shard]
+            pending.append((pool.submit(evaluate_shard, mode, pattern, replacement, names, steps), shard))
+            if len(pending) >= workers * 2:
+                yield from drain()
+                if cancelled:
+                    return
+        while pending:
+            yield from drain()
+            if cancelled:
+                return
+    except BrokenExecutor:
+        # A worker died; the next preview starts a new pool.
+        shutdown_pool(pool)
+        raise
+    finally:
+        # The pool stays up; only this run's queued shards are dropped.
+        for future, _shard in pending:
+            future.cancel()
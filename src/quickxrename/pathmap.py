@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+
+class _Node:
+    __slots__ = ("children", "new_name")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, _Node] = {}
+        self.new_name: Optional[str] = None
+
+
+class FolderMapping:
+    """
+    Path-component trie of pending folder renames.
+
+    Every rename keeps its folder in the same parent, so a node only needs the
+    new basename. Resolving a path walks its components once, which makes the
+    lookup cost proportional to path depth instead of the number of folders.
+    """
+
+    def __init__(self, renames: Iterable[Tuple[str, str]] = ()) -> None:
+        self._root = _Node()
+        self._size = 0
+        for old_path, new_path in renames:
+            self.add(old_path, new_path)
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, old_path: str, new_path: str) -> None:
+        node = self._root
+        for part in old_path.split(os.sep):
+            child = node.children.get(part)
+            if child is None:
+                child = _Node()
+                node.children[part] = child
+            node = child
+        if node.new_name is None:
+            self._size += 1
+        node.new_name = os.path.basename(new_path)
+
+    def resolve(self, path: str) -> str:
+        # Returns where `path` ends up once every mapped folder has been renamed.
+        if not self._size:
+            return path
+        parts = path.split(os.sep)
+        node = self._root
+        changed = False
+        for index, part in enumerate(parts):
+            node = node.children.get(part)
+            if node is None:
+                break
+            if node.new_name is not None:
+                parts[index] = node.new_name
+                changed = True
+        return os.sep.join(parts) if changed else path
+
+    def resolve_parent(self, path: str) -> str:
+        # Same as resolve(), but leaves the last component untouched.
+        parent, name = os.path.split(path)
+        return os.path.join(self.resolve(parent), name)
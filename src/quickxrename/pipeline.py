@@ -0,0 +1,185 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import replace
+from functools import lru_cache
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+from .models import PreviewRequest, RuleStep
+from .rules import MODES, RenameRule, RuleError, compile_rule
+from .tokens import TokenTemplate, parse_tokens
+
+CASE_STEPS = ("Lowercase", "Uppercase", "Titlecase")
+STEP_KINDS = (*MODES, *CASE_STEPS, "Trim")
+PRESET_VERSION = 1
+
+_CASES = {"Lowercase": str.lower, "Uppercase": str.upper, "Titlecase": str.title}
+
+StepFunction = Callable[[str], Optional[str]]
+
+
+def _replace_chain(pairs: Tuple[Tuple[str, str], ...]) -> StepFunction:
+    if len(pairs) == 1:
+        (pattern, replacement), = pairs
+
+        def apply_one(name: str) -> str:
+            return name.replace(pattern, replacement)
+
+        return apply_one
+
+    def apply(name: str) -> str:
+        for pattern, replacement in pairs:
+            name = name.replace(pattern, replacement)
+        return name
+
+    return apply
+
+
+def _trim(chars: str) -> StepFunction:
+    # Both ends of the name and of its stem, so "photo .jpg" loses the space too.
+    strip = chars or None
+
+    def apply(name: str) -> str:
+        stem, extension = os.path.splitext(name.strip(strip))
+        return stem.strip(strip) + extension
+
+    return apply
+
+
+class RulePipeline:
+    """
+    Ordered rename steps, evaluated in one pass per name.
+
+    Each step works on what the previous one produced. Case steps change the
+    whole name; Trim strips `pattern` characters (whitespace by default).
+    Steps are compiled once: runs of adjacent Replace steps are fused into
+    one chain of str.replace calls, and steps that cannot change anything
+    (empty pattern, pattern equal to its replacement) are dropped.
+    A Wildcard step the name doesn't match ends the pass, so later steps
+    are skipped and only the changes made before it are kept.
+    """
+
+    def __init__(self, steps: Sequence[RuleStep]) -> None:
+        self.steps = tuple(steps)
+        self._functions: List[StepFunction] = []
+        literals: List[Tuple[str, str]] = []
+        for step in self.steps:
+            if step.kind not in STEP_KINDS:
+                raise RuleError(f"unknown step: {step.kind}")
+            if step.kind == "Replace":
+                if step.pattern and step.pattern != step.replacement:
+                    literals.append((step.pattern, step.replacement))
+                continue
+            if literals:
+                self._functions.append(_replace_chain(tuple(literals)))
+                literals = []
+            if step.kind in MODES:
+                if step.pattern:
+                    self._functions.append(compile_rule(step.kind, step.pattern, step.replacement).apply)
+            elif step.kind == "Trim":
+                self._functions.append(_trim(step.pattern))
+            else:
+                self._functions.append(_CASES[step.kind])
+        if literals:
+            self._functions.append(_replace_chain(tuple(literals)))
+
+    def apply(self, name: str) -> Optional[str]:
+        for function in self._functions:
+            result = function(name)
+            if result is None:
+                break
+            name = result
+        return name
+
+
+Rule = Union[RenameRule, RulePipeline]
+
+
+@lru_cache(maxsize=32)
+def compile_steps(mode: str, pattern: str, replacement: str, steps: Tuple[RuleStep, ...] = ()) -> Rule:
+    # A request without extra steps keeps the plain rule and its fast paths.
+    if not steps:
+        return compile_rule(mode, pattern, replacement)
+    if mode not in MODES:
+        raise RuleError(f"unknown mode: {mode}")
+    return RulePipeline((RuleStep(mode, pattern, replacement), *steps))
+
+
+def request_template(request: PreviewRequest) -> Tuple[TokenTemplate, Tuple[RuleStep, ...]]:
+    """
+    Token template of a request, over the replacements of all its steps,
+    and its steps with their tokens turned into placeholders. Compile the
+    rule with template.replacement and these steps; the tokens are filled
+    in after the last step.
+    """
+    template = parse_tokens(request.replacement, *(step.replacement for step in request.steps))
+    steps = tuple(
+        step if step.replacement == text else replace(step, replacement=text)
+        for step, text in zip(request.steps, template.replacements[1:])
+    )
+    return template, steps
+
+
+def request_steps(request: PreviewRequest) -> Tuple[RuleStep, ...]:
+    """Every step of a request, its own rule first unless that is empty."""
+    main = (RuleStep(request.mode, request.pattern, request.replacement),) if request.pattern else ()
+    return (*main, *request.steps)
+
+
+def split_steps(steps: Sequence[RuleStep]) -> Tuple[str, str, str, Tuple[RuleStep, ...]]:
+    """(mode, pattern, replacement, steps) for a request running `steps`."""
+    if steps and steps[0].kind in MODES:
+        first = steps[0]
+        return first.kind, first.pattern, first.replacement, tuple(steps[1:])
+    return "Replace", "", "", tuple(steps)
+
+
+def preset_data(steps: Sequence[RuleStep]) -> dict:
+    data = []
+    for step in steps:
+        item = {"kind": step.kind}
+        if step.pattern:
+            item["pattern"] = step.pattern
+        if step.replacement:
+            item["replacement"] = step.replacement
+        data.append(item)
+    return {"version": PRESET_VERSION, "steps": data}
+
+
+def steps_from_preset(data: object) -> Tuple[RuleStep, ...]:
+    if not isinstance(data, dict) or not isinstance(data.get("steps"), list):
+        raise RuleError("preset needs a list of steps")
+    version = data.get("version", PRESET_VERSION)
+    if not isinstance(version, int) or version > PRESET_VERSION:
+        raise RuleError(f"unsupported preset version: {version!r}")
+    steps = []
+    for number, item in enumerate(data["steps"], 1):
+        if not isinstance(item, dict) or item.get("kind") not in STEP_KINDS:
+            raise RuleError(f"step {number}: kind must be one of {', '.join(STEP_KINDS)}")
+        pattern = item.get("pattern", "")
+        replacement = item.get("replacement", "")
+        if not isinstance(pattern, str) or not isinstance(replacement, str):
+            raise RuleError(f"step {number}: pattern and replacement must be strings")
+        steps.append(RuleStep(item["kind"], pattern, replacement if item["kind"] in MODES else ""))
+    # Compiling here reports bad regexes and tokens when the preset is loaded.
+    mode, pattern, replacement, rest = split_steps(steps)
+    template = parse_tokens(replacement, *(step.replacement for step in rest))
+    rest = tuple(replace(step, replacement=text) for step, text in zip(rest, template.replacements[1:]))
+    compile_steps(mode, pattern, template.replacement, rest)
+    return tuple(steps)
+
+
+def load_preset(path: str) -> Tuple[RuleStep, ...]:
+    with open(path, "r", encoding="utf-8") as handle:
+        try:
+            data = json.load(handle)
+        except ValueError as exc:
+            raise RuleError(f"invalid preset {path}: {exc}") from exc
+    return steps_from_preset(data)
+
+
+def save_preset(path: str, steps: Sequence[RuleStep]) -> None:
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump(preset_data(steps), handle, indent=2, ensure_ascii=False)
+        handle.write("\n")
@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+import csv
+import json
+import os
+import time
+from typing import IO, Iterator, List, Optional, Set, Tuple
+
+from .existence import ExistenceOracle
+from .metrics import NULL_METRICS, Metrics
+from .models import PreviewEntry, PreviewStats
+from .renamer import (
+    PREVIEW_BATCH_SIZE,
+    PREVIEW_FLUSH_INTERVAL,
+    BatchCallback,
+    ProgressCallback,
+    is_invalid_name,
+    settle_conflicts,
+)
+from .store import PreviewStore
+
+PLAN_FIELDS = ["item_type", "old_path", "new_path"]
+
+# old path, new path, is_dir (None when the plan doesn't say)
+PlanRow = Tuple[str, str, Optional[bool]]
+
+
+def _row(number: int, record: object) -> PlanRow:
+    if not isinstance(record, dict):
+        raise ValueError(f"line {number}: expected an object with old_path and new_path")
+    old_path = record.get("old_path")
+    # Preview output names the target raw_new_path; both are accepted.
+    new_path = record.get("new_path") or record.get("raw_new_path")
+    if not isinstance(old_path, str) or not isinstance(new_path, str) or not old_path or not new_path:
+        raise ValueError(f"line {number}: old_path and new_path are required")
+    item_type = record.get("item_type") or None
+    if item_type not in (None, "file", "folder"):
+        raise ValueError(f"line {number}: item_type must be file or folder")
+    return old_path, new_path, None if item_type is None else item_type == "folder"
+
+
+def iter_plan(stream: IO[str], fmt: str) -> Iterator[PlanRow]:
+    """
+    Rows of a plan, one line at a time. JSON Lines hold one object per line,
+    CSV has a header row; both use PLAN_FIELDS (item_type may be left out),
+    and raw_new_path is read as new_path, so `preview --format jsonl` or
+    `--format csv` output loads as it is. Blank lines are skipped; a
+    malformed one raises ValueError.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield _row(reader.line_num, record)
+        return
+    for number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f"line {number}: {exc}") from exc
+        yield _row(number, record)
+
+
+def plan_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def load_plan(
+    stream: IO[str],
+    fmt: str,
+    cancel_check,
+    on_batch: Optional[BatchCallback] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    case_insensitive: Optional[bool] = None,
+    metrics: Metrics = NULL_METRICS,
+) -> Tuple[PreviewStore, PreviewStats]:
+    """
+    Checks an external old -> new mapping the way build_preview checks its
+    own candidates, and returns the same kind of result for apply_renames.
+
+    Rows are read and checked one at a time, so the file's text is never
+    held in memory: a target with an invalid name or outside the source's
+    folder, a source that doesn't exist or one listed twice is final
+    ("invalid") at once and reported through on_batch with the pending rows.
+    Rows whose new path equals the old one are counted but left out.
+
+    Memory still grows with the number of renames. Every candidate is kept
+    as full old and new paths, with a set of the sources seen, until the
+    conflict pass, which indexes them again by target; at its peak that is
+    around 1.4 KB per row for paths of about 60 characters. Only the
+    returned PreviewStore is compact (tens of bytes per row).
+
+    Paths are made absolute and normalized first. Like a preview, a plan
+    only renames items in place: new_path is the old parent plus a new name,
+    and a folder renamed in the same plan takes it along. Moves between
+    folders are rejected, since the planner, journal and undo all rename
+    the last path component only. Without item_type, the source is stat'ed
+    to tell folders from files.
+    """
+    entries = PreviewStore()
+    oracle = ExistenceOracle(case_insensitive)
+    tentative: List[Tuple[str, str, bool]] = []
+    sources: Set[str] = set()
+    scanned = invalid = 0
+    batch: List[PreviewEntry] = []
+    last_flush = time.perf_counter()
+
+    def flush() -> None:
+        nonlocal batch, last_flush
+        if on_batch is not None and batch:
+            on_batch(batch, scanned)
+        if on_progress is not None:
+            on_progress(scanned, 0)
+        batch = []
+        last_flush = time.perf_counter()
+
+    with metrics.stage("load"):
+        for old_path, new_path, is_dir in iter_plan(stream, fmt):
+            if scanned % PREVIEW_BATCH_SIZE == 0 and cancel_check():
+                return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+            scanned += 1
+            # `a/x`, `./a/x` and the absolute path are one item.
+            old_path = os.path.abspath(old_path)
+            new_path = os.path.abspath(new_path)
+            if new_path == old_path:
+                continue
+            if is_dir is None:
+                is_dir = os.path.isdir(old_path)
+            reason = is_invalid_name(os.path.basename(new_path))
+            if reason is None and os.path.dirname(new_path) != os.path.dirname(old_path):
+                reason = "target is not in the source's folder"
+            if reason is None and old_path in sources:
+                reason = "source listed more than once"
+            if reason is None and not oracle.exists(old_path):
+                reason = "source not found"
+            if reason:
+                entries.add("folder" if is_dir else "file", old_path, new_path, new_path, "invalid", reason)
+                invalid += 1
+            else:
+                sources.add(old_path)
+                tentative.append((old_path, new_path, is_dir))
+            if on_batch is not None:
+                status = "invalid" if reason else "pending"
+                batch.append(PreviewEntry("folder" if is_dir else "file", old_path, new_path, new_path, status, reason or ""))
+            if len(batch) >= PREVIEW_BATCH_SIZE or time.perf_counter() - last_flush >= PREVIEW_FLUSH_INTERVAL:
+                flush()
+    if cancel_check():
+        return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+    flush()
+    sources.clear()
+
+    settled = settle_conflicts(tentative, oracle, entries, cancel_check, on_progress, metrics)
+    if settled is None:
+        return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+    ready, conflicts, folder_mapping = settled
+    metrics.count("items", scanned)
+    metrics.count("candidates", len(tentative) + invalid)
+    metrics.count("folder_renames", len(folder_mapping))
+    metrics.count("listings", oracle.listings_read)
+    return entries, PreviewStats(items=scanned, ready=ready, conflicts=conflicts, invalid=invalid)
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from typing import List, Mapping, Sequence
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+from PySide6.QtGui import QBrush, QColor, QFontMetrics
+
+from .models import PreviewEntry
+from .store import PreviewStore
+
+HEADERS = ["Type", "Old Path", "New Path", "Status"]
+
+STATUS_COLORS = {
+    "ready": "#2d3a24",
+    "conflict": "#3a2022",
+}
+DEFAULT_COLOR = "#1f2533"
+
+
+def status_text(entry: PreviewEntry) -> str:
+    return entry.status if not entry.message else f"{entry.status}: {entry.message}"
+
+
+class PreviewTableModel(QAbstractTableModel):
+    """
+    Read-only table over a PreviewStore.
+
+    Cells are produced on demand in data() from the store's columns, so the
+    view only pays for the rows it actually paints and sorting or filtering
+    never builds whole entries.
+    """
+
+    def __init__(self, parent=None) -> None:
+        super().__init__(parent)
+        self._entries = PreviewStore()
+        self._brushes = {status: QBrush(QColor(color)) for status, color in STATUS_COLORS.items()}
+        self._default_brush = QBrush(QColor(DEFAULT_COLOR))
+
+    def entries(self) -> PreviewStore:
+        return self._entries
+
+    def set_entries(self, entries: Sequence[PreviewEntry]) -> None:
+        self.beginResetModel()
+        self._entries = entries if isinstance(entries, PreviewStore) else PreviewStore(entries)
+        self.endResetModel()
+
+    def append_entries(self, entries: Sequence[PreviewEntry]) -> None:
+        # Used while a preview streams in; the model owns the store it grows.
+        if not entries:
+            return
+        start = len(self._entries)
+        self.beginInsertRows(QModelIndex(), start, start + len(entries) - 1)
+        self._entries.extend(entries)
+        self.endInsertRows()
+
+    def apply_changes(self, rows: Mapping[int, PreviewEntry], length: int) -> None:
+        # Live preview updates: rewrites, appends and trims only the rows given.
+        store = self._entries
+        old_length = len(store)
+        if length > old_length:
+            self.beginInsertRows(QModelIndex(), old_length, length - 1)
+            for row in range(old_length, length):
+                store.append(rows[row])
+            self.endInsertRows()
+        changed = sorted(row for row in rows if row < min(old_length, length))
+        for row in changed:
+            store.set(row, rows[row])
+        if length < old_length:
+            self.beginRemoveRows(QModelIndex(), length, old_length - 1)
+            store.truncate(length)
+            self.endRemoveRows()
+        last_column = len(HEADERS) - 1
+        start = 0
+        for position, row in enumerate(changed):
+            if position + 1 == len(changed) or changed[position + 1] != row + 1:
+                self.dataChanged.emit(self.index(changed[start], 0), self.index(row, last_column))
+                start = position + 1
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:  # noqa: B008
+        return 0 if parent.isValid() else len(self._entries)
+
+    def columnCount(self, parent: QModelIndex = QModelIndex()) -> int:  # noqa: B008
+        return 0 if parent.isValid() else len(HEADERS)
+
+    def data(self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        store = self._entries
+        row = index.row()
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return store.item_type(row)
+            if column == 1:
+                return store.old_path(row)
+            if column == 2:
+                return store.final_new_path(row)
+            message = store.message(row)
+            return store.status(row) if not message else f"{store.status(row)}: {message}"
+        if role == Qt.BackgroundRole:
+            return self._brushes.get(store.status(row), self._default_brush)
+        if role == Qt.UserRole and column == 2:
+            return store.raw_new_path(row)
+        return None
+
+    def headerData(self, section: int, orientation, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return section + 1
+
+
+def make_preview_proxy(model: PreviewTableModel, parent=None) -> QSortFilterProxyModel:
+    # The proxy only keeps a row mapping, never a copy of the entries.
+    proxy = QSortFilterProxyModel(parent)
+    proxy.setSourceModel(model)
+    proxy.setFilterKeyColumn(-1)
+    proxy.setFilterCaseSensitivity(Qt.CaseInsensitive)
+    return proxy
+
+
+def sample_column_widths(
+    entries: Sequence[PreviewEntry],
+    metrics: QFontMetrics,
+    sample_size: int = 200,
+    padding: int = 24,
+    max_width: int = 640,
+) -> List[int]:
+    # Measure an evenly spaced sample instead of every row.
+    step = max(1, len(entries) // sample_size)
+    widths = [metrics.horizontalAdvance(header) for header in HEADERS]
+    for entry in entries[::step]:
+        texts = (entry.item_type, entry.old_path, entry.final_new_path, status_text(entry))
+        for column, text in enumerate(texts):
+            widths[column] = max(widths[column], metrics.horizontalAdvance(text))
+    return [min(width + padding, max_width) for width in widths]
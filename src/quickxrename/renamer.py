@@ -1,11 +1,30 @@
 from __future__ import annotations
 
-import fnmatch
 import os
-import re
-from typing import Iterable, List, Tuple
+import sys
+import time
+from operator import attrgetter
+from typing import Callable, Iterable, List, MutableSequence, Optional, Sequence, Tuple
 
+from .existence import ExistenceOracle
+from .filters import WalkFilter
+from .journal import JournalRun
+from .metrics import NULL_METRICS, Metrics
 from .models import PreviewEntry, PreviewRequest, PreviewStats, RenameOperation
+from .parallel import auto_threshold, iter_evaluated
+from .pathmap import FolderMapping
+from .pipeline import compile_steps, request_template
+from .planner import RenamePlan, RenameStep, execute_plan
+from .rules import RuleError, compile_rule
+from .store import PreviewStore
+from .tokens import expand_tokens
+from .walker import walk_parallel
+
+PREVIEW_BATCH_SIZE = 2000
+PREVIEW_FLUSH_INTERVAL = 0.05  # seconds between partial batches while walking
+
+BatchCallback = Callable[[List[PreviewEntry], int], None]
+ProgressCallback = Callable[[int, int], None]
 
 
 def is_invalid_name(name: str) -> str | None:
@@ -21,170 +40,413 @@ def is_invalid_name(name: str) -> str | None:
 
 
 def compute_new_name(mode: str, pattern: str, replacement: str, name: str) -> str | None:
-    if mode == "Replace":
-        if not pattern:
-            return None
-        return name.replace(pattern, replacement)
-    if mode == "Wildcard":
-        if not pattern:
-            return None
-        if not fnmatch.fnmatch(name, pattern):
-            return None
-        if "*" in replacement:
-            base, _ext = os.path.splitext(name)
-            return replacement.replace("*", base)
-        return replacement
-    if mode == "Regex":
-        if not pattern:
-            return None
-        try:
-            return re.sub(pattern, replacement, name)
-        except re.error:
-            return None
-    return None
+    # One-off evaluation; loops should compile a RenameRule once instead.
+    try:
+        rule = compile_rule(mode, pattern, replacement)
+    except RuleError:
+        return None
+    return rule.apply(name)
+
+
+def build_folder_mapping(entries: Iterable[PreviewEntry]) -> FolderMapping:
+    return FolderMapping((e.old_path, e.raw_new_path) for e in entries if e.item_type == "folder")
 
 
-def apply_folder_mapping(path: str, mappings: List[Tuple[str, str]]) -> str:
-    # Apply deepest folders first for nested renames.
-    updated = path
-    for old_folder, new_folder in mappings:
-        if updated == old_folder or updated.startswith(old_folder + os.sep):
-            updated = new_folder + updated[len(old_folder):]
-    return updated
+def walk_filter_for(request: PreviewRequest) -> Optional[WalkFilter]:
+    walk_filter = WalkFilter.from_request(request)
+    return walk_filter if walk_filter.active else None
 
 
-def iter_items(directory: str, recursive: bool, include_files: bool, include_folders: bool) -> Iterable[Tuple[str, bool]]:
-    if recursive:
+_entry_name = attrgetter("name")
+
+
+def iter_items(
+    directory: str,
+    recursive: bool,
+    include_files: bool,
+    include_folders: bool,
+    walk_filter: Optional[WalkFilter] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    workers: int = 0,
+) -> Iterable[Tuple[str, bool]]:
+    # The filter prunes `dirs` in place, so excluded folders are never listed.
+    # cancel_check runs once per directory, so a walk that yields nothing
+    # (everything filtered out) still stops or pauses promptly.
+    # With workers > 1 the listings are read on that many threads, same order.
+    # Each folder's subfolders come first, then its files, both sorted by
+    # name (code point order, as TreeIndex's ORDER BY name), so tokens such
+    # as {n} number a tree the same way however it is read.
+    if recursive and workers > 1:
+        for _root, _mtime_ns, shown, files in walk_parallel(directory, walk_filter, cancel_check, workers):
+            if include_folders:
+                for entry in shown:
+                    yield entry.path, True
+            if include_files:
+                for entry in files:
+                    yield entry.path, False
+    elif recursive:
         for root, dirs, files in os.walk(directory):
+            if cancel_check is not None and cancel_check():
+                return
+            dirs.sort()
+            files.sort()
+            shown = dirs
+            if walk_filter is not None:
+                dirs[:], shown, files = walk_filter.filter_names(root, dirs, files)
             if include_folders:
-                for d in dirs:
+                for d in shown:
                     yield os.path.join(root, d), True
             if include_files:
                 for f in files:
                     yield os.path.join(root, f), False
     else:
-        for entry in os.scandir(directory):
-            if entry.is_dir() and include_folders:
+        scope = walk_filter.scope(directory) if walk_filter is not None else None
+        with os.scandir(directory) as it:
+            listing = sorted(it, key=_entry_name)
+        files = []
+        for entry in listing:
+            is_dir = entry.is_dir()
+            if scope is not None and not (
+                walk_filter.keep(scope, entry.name, is_dir) and walk_filter.report(scope, entry.name)
+            ):
+                continue
+            if is_dir and include_folders:
                 yield entry.path, True
             if entry.is_file() and include_files:
-                yield entry.path, False
+                files.append(entry.path)
+        for path in files:
+            yield path, False
 
 
-def build_preview(request: PreviewRequest, cancel_check) -> Tuple[List[PreviewEntry], PreviewStats]:
-    entries: List[PreviewEntry] = []
-    stats = PreviewStats(items=0, ready=0, conflicts=0, invalid=0)
+def build_preview(
+    request: PreviewRequest,
+    cancel_check,
+    on_batch: Optional[BatchCallback] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    items: Optional[Iterable[Tuple[str, bool]]] = None,
+    parallel: Optional[bool] = None,
+    metrics: Metrics = NULL_METRICS,
+    prefiltered: bool = False,
+    on_bytes: Optional[ProgressCallback] = None,
+    matched: Optional[MutableSequence[int]] = None,
+) -> Tuple[PreviewStore, PreviewStats]:
+    # Items are consumed lazily from the walk. Renamed candidates are reported
+    # through on_batch as "pending" entries (invalid ones are already final),
+    # then a last pass over the candidates settles conflicts.
+    # parallel=None moves regex evaluation to a process pool once the walk
+    # passes PARALLEL_THRESHOLD items; True/False force it on or off.
+    # Walk and rule evaluation interleave, so their time is measured inside
+    # the iterators; "collect" is the rest of that loop.
+    # prefiltered=True says `items` only holds names the rule may change (as
+    # from TreeIndex.preview_items), so stats.items counts just those.
+    # With hash tokens, on_bytes(done, total) follows the bytes hashed.
+    # `matched` receives the position in `items` of every name the rule
+    # matched (see incremental.MatchSet), changed or not where that shows.
+    entries = PreviewStore()
+    invalid = 0
 
     if not os.path.isdir(request.directory):
-        return entries, stats
+        return entries, PreviewStats(items=0, ready=0, conflicts=0, invalid=0)
 
-    items = list(iter_items(request.directory, request.recursive, request.include_files, request.include_folders))
-    stats = PreviewStats(items=len(items), ready=0, conflicts=0, invalid=0)
+    # Metadata tokens stand in the rule as placeholders and are filled in
+    # after it matched; a replacement without tokens skips that step.
+    template, steps = request_template(request)
+    compile_steps(request.mode, request.pattern, template.replacement, steps)
+
+    walk_filter = walk_filter_for(request)
+    if items is None:
+        items = iter_items(
+            request.directory,
+            request.recursive,
+            request.include_files,
+            request.include_folders,
+            walk_filter,
+            cancel_check,
+            request.walk_workers,
+        )
+    if parallel is None:
+        threshold = auto_threshold(request.mode, steps)
+    else:
+        threshold = 0 if parallel else sys.maxsize
+    items = metrics.timed("walk", items)
+    evaluated = iter_evaluated(
+        request.mode, request.pattern, template.replacement, items, cancel_check, threshold, steps=steps
+    )
+    evaluated = metrics.timed("rule", evaluated, exclude=("walk",))
+    if template.active:
+        expanded = expand_tokens(evaluated, template, cancel_check=cancel_check, on_bytes=on_bytes)
+        evaluated = metrics.timed("tokens", expanded, exclude=("walk", "rule"))
+
+    scanned = 0
+    batch: List[PreviewEntry] = []
+    last_flush = time.perf_counter()
+
+    def flush() -> None:
+        nonlocal batch, last_flush
+        if on_batch is not None and batch:
+            on_batch(batch, scanned)
+        if on_progress is not None:
+            on_progress(scanned, 0)
+        batch = []
+        last_flush = time.perf_counter()
+
+    oracle = ExistenceOracle(request.case_insensitive)
+    # An unfiltered recursive walk over both kinds sees every name in a folder,
+    # and all of a folder's items arrive together. Listings of folders holding
+    # a rename candidate are kept for the conflict pass; the rest are dropped.
+    seed_listings = (
+        request.recursive and request.include_files and request.include_folders and walk_filter is None
+        and not prefiltered
+    )
+    current_parent: Optional[str] = None
+    current_names: List[str] = []
+    current_has_candidate = False
 
     tentative: List[Tuple[str, str, bool]] = []
-    for path, is_dir in items:
-        if cancel_check():
-            return [], stats
-        name = os.path.basename(path)
-        new_name = compute_new_name(request.mode, request.pattern, request.replacement, name)
-        if new_name is None or new_name == name:
-            continue
-        invalid_reason = is_invalid_name(new_name)
-        if invalid_reason:
-            entries.append(PreviewEntry(
-                item_type="folder" if is_dir else "file",
-                old_path=path,
-                raw_new_path=os.path.join(os.path.dirname(path), new_name),
-                final_new_path=os.path.join(os.path.dirname(path), new_name),
-                status="invalid",
-                message=invalid_reason,
-            ))
-            stats = PreviewStats(stats.items, stats.ready, stats.conflicts, stats.invalid + 1)
-            continue
-        tentative.append((path, os.path.join(os.path.dirname(path), new_name), is_dir))
-
-    folder_mappings = [(old_path, new_path) for old_path, new_path, is_dir in tentative if is_dir]
-    folder_mappings.sort(key=lambda x: len(x[0]), reverse=True)
+    # A Wildcard rule gives None for names it doesn't match, so a match that
+    # keeps the name is still known; the other rules only show changes.
+    keeps_matches = request.mode == "Wildcard" and not request.steps
+    with metrics.stage("collect", exclude=("walk", "rule", "tokens")):
+        for path, is_dir, new_name in evaluated:
+            if cancel_check():
+                return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+            scanned += 1
+            parent, name = os.path.split(path)
+            if seed_listings:
+                if parent != current_parent:
+                    if current_has_candidate:
+                        oracle.add_listing(current_parent, current_names)
+                    current_parent = parent
+                    current_names = []
+                    current_has_candidate = False
+                current_names.append(name)
+            if matched is not None and new_name is not None and (keeps_matches or new_name != name):
+                matched.append(scanned - 1)
+            if new_name is not None and new_name != name:
+                current_has_candidate = True
+                new_path = os.path.join(parent, new_name)
+                invalid_reason = is_invalid_name(new_name)
+                if invalid_reason:
+                    entry = PreviewEntry(
+                        item_type="folder" if is_dir else "file",
+                        old_path=path,
+                        raw_new_path=new_path,
+                        final_new_path=new_path,
+                        status="invalid",
+                        message=invalid_reason,
+                    )
+                    entries.append(entry)
+                    invalid += 1
+                else:
+                    tentative.append((path, new_path, is_dir))
+                    entry = PreviewEntry(
+                        item_type="folder" if is_dir else "file",
+                        old_path=path,
+                        raw_new_path=new_path,
+                        final_new_path=new_path,
+                        status="pending",
+                        message="",
+                    )
+                if on_batch is not None:
+                    batch.append(entry)
+            if len(batch) >= PREVIEW_BATCH_SIZE or time.perf_counter() - last_flush >= PREVIEW_FLUSH_INTERVAL:
+                flush()
+    if cancel_check():
+        return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+    flush()
+    if current_has_candidate:
+        oracle.add_listing(current_parent, current_names)
+    current_names = []
+
+    settled = settle_conflicts(tentative, oracle, entries, cancel_check, on_progress, metrics)
+    if settled is None:
+        return PreviewStore(), PreviewStats(scanned, 0, 0, invalid)
+    ready, conflicts, folder_mapping = settled
+    metrics.count("items", scanned)
+    metrics.count("candidates", len(tentative) + invalid)
+    metrics.count("folder_renames", len(folder_mapping))
+    metrics.count("listings", oracle.listings_read)
+    return entries, PreviewStats(items=scanned, ready=ready, conflicts=conflicts, invalid=invalid)
 
+
+def settle_conflicts(
+    tentative: Sequence[Tuple[str, str, bool]],
+    oracle: ExistenceOracle,
+    entries: PreviewStore,
+    cancel_check,
+    on_progress: Optional[ProgressCallback] = None,
+    metrics: Metrics = NULL_METRICS,
+) -> Optional[Tuple[int, int, FolderMapping]]:
+    # Adds the (old_path, new_path, is_dir) candidates to `entries` as ready
+    # or conflicting: two of them ending up at the same path, or a target that
+    # exists and is not renamed away itself. Returns (ready, conflicts, folder
+    # mapping), or None once cancel_check() is true.
+    ready = conflicts = 0
     source_paths = {p for p, _, _ in tentative}
     target_paths: dict[str, list[Tuple[str, bool]]] = {}
+    final_paths: List[str] = []
 
-    for old_path, new_path, is_dir in tentative:
-        final_new_path = apply_folder_mapping(new_path, folder_mappings)
-        target_paths.setdefault(final_new_path, []).append((old_path, is_dir))
-
-    for old_path, new_path, is_dir in tentative:
-        if cancel_check():
-            return [], stats
-        final_new_path = apply_folder_mapping(new_path, folder_mappings)
-        conflict = False
-        message = ""
-
-        if len(target_paths.get(final_new_path, [])) > 1:
-            conflict = True
-            message = "multiple items target same path"
-
-        if os.path.exists(final_new_path) and final_new_path not in source_paths:
-            conflict = True
-            message = "target already exists"
-
-        if conflict:
-            entries.append(PreviewEntry(
-                item_type="folder" if is_dir else "file",
-                old_path=old_path,
-                raw_new_path=new_path,
-                final_new_path=final_new_path,
-                status="conflict",
-                message=message,
-            ))
-            stats = PreviewStats(stats.items, stats.ready, stats.conflicts + 1, stats.invalid)
-        else:
-            entries.append(PreviewEntry(
-                item_type="folder" if is_dir else "file",
-                old_path=old_path,
-                raw_new_path=new_path,
-                final_new_path=final_new_path,
-                status="ready",
-                message="",
-            ))
-            stats = PreviewStats(stats.items, stats.ready + 1, stats.conflicts, stats.invalid)
-
-    return entries, stats
-
-
-def apply_renames(entries: Iterable[PreviewEntry], log_fn) -> List[RenameOperation]:
-    entries = list(entries)
-    folder_renames = [(e.old_path, e.raw_new_path) for e in entries if e.item_type == "folder"]
-    folder_renames.sort(key=lambda x: len(x[0]), reverse=True)
+    with metrics.stage("mapping"):
+        folder_mapping = FolderMapping((old_path, new_path) for old_path, new_path, is_dir in tentative if is_dir)
+        for old_path, new_path, is_dir in tentative:
+            final_new_path = folder_mapping.resolve_parent(new_path)
+            final_paths.append(final_new_path)
+            target_paths.setdefault(final_new_path, []).append((old_path, is_dir))
 
-    operations: List[RenameOperation] = []
+    total = len(tentative)
+    with metrics.stage("conflict"):
+        for done, ((old_path, new_path, is_dir), final_new_path) in enumerate(zip(tentative, final_paths)):
+            if cancel_check():
+                return None
+            if on_progress is not None and done % PREVIEW_BATCH_SIZE == 0:
+                on_progress(done, total)
+            conflict = False
+            message = ""
 
-    for entry in [e for e in entries if e.item_type == "file"]:
-        try:
-            os.rename(entry.old_path, entry.raw_new_path)
-            final_path = apply_folder_mapping(entry.raw_new_path, folder_renames)
-            operations.append(RenameOperation(new_path=final_path, old_path=entry.old_path))
-            log_fn(f"Renamed file: {entry.old_path} -> {final_path}")
-        except OSError as exc:
-            log_fn(f"Failed to rename file: {entry.old_path} -> {entry.raw_new_path} ({exc})")
-
-    for entry in [e for e in entries if e.item_type == "folder"]:
-        try:
-            os.rename(entry.old_path, entry.raw_new_path)
-            operations.append(RenameOperation(new_path=entry.final_new_path, old_path=entry.old_path))
-            log_fn(f"Renamed folder: {entry.old_path} -> {entry.final_new_path}")
-        except OSError as exc:
-            log_fn(f"Failed to rename folder: {entry.old_path} -> {entry.raw_new_path} ({exc})")
+            if len(target_paths.get(final_new_path, [])) > 1:
+                conflict = True
+                message = "multiple items target same path"
 
+            # A renamed parent takes its contents along, so the target is looked
+            # up where it is now, next to the item, not under the new folder name.
+            if oracle.exists(new_path) and new_path not in source_paths:
+                conflict = True
+                message = "target already exists"
+
+            item_type = "folder" if is_dir else "file"
+            if conflict:
+                entries.add(item_type, old_path, new_path, final_new_path, "conflict", message)
+                conflicts += 1
+            else:
+                entries.add(item_type, old_path, new_path, final_new_path, "ready")
+                ready += 1
+
+    if on_progress is not None:
+        on_progress(total, total)
+    return ready, conflicts, folder_mapping
+
+
+def apply_renames(
+    entries: Iterable[PreviewEntry],
+    log_fn,
+    folder_mapping: FolderMapping | None = None,
+    journal: JournalRun | None = None,
+    workers: int = 0,
+    metrics: Metrics = NULL_METRICS,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+) -> List[RenameOperation]:
+    # Renames run through a RenamePlan: contents before their folder, chains
+    # and swaps in a safe order; with workers > 1, independent chains run on
+    # that many threads (see execute_plan).
+    # With a journal, each batch of steps is recorded (one fsync) before it
+    # runs, so an interrupted run can be rolled back or finished later.
+    # cancel_check is polled between batches; a stopped run records the
+    # steps it never reached, so it can be resumed like an interrupted one.
+    with metrics.stage("plan"):
+        if not isinstance(entries, Sequence):
+            entries = list(entries)
+        if folder_mapping is None:
+            folder_mapping = build_folder_mapping(entries)
+
+        steps = []
+        for entry in entries:
+            if entry.item_type == "file":
+                final_path = folder_mapping.resolve_parent(entry.raw_new_path)
+            else:
+                final_path = entry.final_new_path
+            steps.append(RenameStep(entry.old_path, entry.raw_new_path, final_path, entry))
+        plan = RenamePlan(steps)
+
+    def record(batch: List[RenameStep]) -> None:
+        with metrics.stage("journal"):
+            first = journal.intend([(step.source, step.target, step.final) for step in batch])
+        for offset, step in enumerate(batch):
+            step.record = first + offset
+
+    stopped = False
+
+    def stop_check() -> bool:
+        nonlocal stopped
+        stopped = cancel_check()
+        return stopped
+
+    operations: List[RenameOperation] = []
+    failed = done = 0
+    total = len(plan)
+    started = time.perf_counter()
+    with metrics.stage("rename", exclude=("journal",)):
+        results = execute_plan(
+            plan, record if journal is not None else None, workers, cancel_check=stop_check if cancel_check else None
+        )
+        for step, error in results:
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total)
+            entry = step.payload
+            if error is not None:
+                failed += 1
+                if journal is not None:
+                    journal.failed(step.record, str(error))
+                log_fn(f"Failed to rename {entry.item_type}: {entry.old_path} -> {entry.raw_new_path} ({error})")
+                continue
+            if journal is not None:
+                journal.done(step.record)
+            if step.temporary:
+                continue
+            operations.append(RenameOperation(new_path=step.final, old_path=entry.old_path))
+            log_fn(f"Renamed {entry.item_type}: {entry.old_path} -> {step.final}")
+
+    if stopped:
+        log_fn(f"Stopped after {done} of {total} rename step(s)")
+        if journal is not None:
+            journal.stop([(step.source, step.target, step.final) for step in plan.steps() if step.record < 0])
+    _log_throughput(log_fn, "Renamed", len(operations), plan, time.perf_counter() - started)
+    metrics.count("steps", len(plan))
+    metrics.count("renamed", len(operations))
+    metrics.count("failed", failed)
+    metrics.count("cycles", plan.cycles)
     return operations
 
 
-def undo_renames(operations: Iterable[RenameOperation], log_fn) -> None:
+def _log_throughput(log_fn, verb: str, count: int, plan: RenamePlan, elapsed: float) -> None:
+    if not len(plan):
+        return
+    rate = len(plan) / elapsed if elapsed > 0 else float("inf")
+    cycles = f", {plan.cycles} cycle(s) broken" if plan.cycles else ""
+    log_fn(f"{verb} {count} item(s) in {elapsed:.2f}s ({rate:.0f} ops/s{cycles})")
+
+
+def undo_renames(
+    operations: Iterable[RenameOperation],
+    log_fn,
+    workers: int = 0,
+    on_progress: Optional[ProgressCallback] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+) -> int:
+    # Items are renamed back in place (basename only) with the same planner,
+    # so contents go before their folder and swaps don't overwrite each other.
+    # Returns how many operations were skipped or failed.
+    steps = []
     for op in operations:
-        try:
-            if os.path.exists(op.new_path):
-                os.rename(op.new_path, op.old_path)
-                log_fn(f"Undo: {op.new_path} -> {op.old_path}")
-            else:
-                log_fn(f"Undo skipped (missing): {op.new_path}")
-        except OSError as exc:
-            log_fn(f"Undo failed: {op.new_path} -> {op.old_path} ({exc})")
+        target = os.path.join(os.path.dirname(op.new_path), os.path.basename(op.old_path))
+        steps.append(RenameStep(op.new_path, target, op.old_path, op))
+    plan = RenamePlan(steps)
+
+    count = failures = 0
+    started = time.perf_counter()
+    for done, (step, error) in enumerate(execute_plan(plan, None, workers, cancel_check=cancel_check), 1):
+        if on_progress is not None:
+            on_progress(done, len(plan))
+        op = step.payload
+        if error is not None and not step.temporary:
+            failures += 1
+        if isinstance(error, FileNotFoundError) and not step.temporary and step.source == op.new_path:
+            log_fn(f"Undo skipped (missing): {op.new_path}")
+        elif error is not None:
+            log_fn(f"Undo failed: {op.new_path} -> {op.old_path} ({error})")
+        elif not step.temporary:
+            count += 1
+            log_fn(f"Undo: {op.new_path} -> {op.old_path}")
+    _log_throughput(log_fn, "Undid", count, plan, time.perf_counter() - started)
+    return failures
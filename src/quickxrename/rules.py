@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import fnmatch
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+from .models import PreviewRequest
+
+MODES = ("Replace", "Wildcard", "Regex")
+
+MEMO_PATTERNS = 8  # patterns whose match results are kept
+MEMO_LIMIT = 1_000_000  # names remembered across all patterns
+
+_NO_MATCH = None
+_NO_SPANS: Tuple[int, ...] = ()
+
+
+class RuleError(ValueError):
+    pass
+
+
+class _MatchMemo:
+    """
+    Per-(mode, pattern) record of what matched in each name, kept as plain
+    ints: the stem length for Wildcard, flat (start, end) pairs for Regex.
+    """
+
+    __slots__ = ("results", "evicted")
+
+    def __init__(self) -> None:
+        self.results: Dict[str, object] = {}
+        self.evicted = False
+
+    def remember(self, name: str, result: object) -> None:
+        global _remembered
+        # Counted without a lock; a few names either way don't matter.
+        if _remembered < MEMO_LIMIT and not self.evicted:
+            self.results[name] = result
+            _remembered += 1
+
+
+_memos: "OrderedDict[Tuple[str, str], _MatchMemo]" = OrderedDict()
+_memos_lock = threading.Lock()
+_remembered = 0  # names in all memos together
+
+
+def _evict_oldest() -> None:
+    global _remembered
+    _key, memo = _memos.popitem(last=False)
+    memo.evicted = True
+    _remembered -= len(memo.results)
+    # Cached rules may still hold the memo; its results go now regardless.
+    memo.results = {}
+
+
+def _memo_for(mode: str, pattern: str) -> _MatchMemo:
+    key = (mode, pattern)
+    with _memos_lock:
+        memo = _memos.get(key)
+        if memo is None:
+            # Older patterns give way until the new one has at least half
+            # of MEMO_LIMIT to fill.
+            while _memos and (len(_memos) >= MEMO_PATTERNS or _remembered > MEMO_LIMIT // 2):
+                _evict_oldest()
+            memo = _MatchMemo()
+            _memos[key] = memo
+        else:
+            _memos.move_to_end(key)
+        return memo
+
+
+def reset_memos() -> None:
+    # Forgets every remembered match, e.g. so a benchmark measures cold runs.
+    with _memos_lock:
+        while _memos:
+            _evict_oldest()
+    compile_rule.cache_clear()
+
+
+class RenameRule:
+    """
+    A rename rule compiled once per preview.
+
+    The mode dispatch, regex compilation and replacement checks happen here,
+    so apply() only does the per-name work. Wildcard and Regex results are
+    memoized per (mode, pattern): when only the replacement changes, names
+    are rebuilt from the remembered matches instead of being matched again.
+    """
+
+    def __init__(self, mode: str, pattern: str, replacement: str) -> None:
+        if mode not in MODES:
+            raise RuleError(f"unknown mode: {mode}")
+        self.mode = mode
+        self.pattern = pattern
+        self.replacement = replacement
+        self._regex: Optional[re.Pattern] = None
+        self._literal_replacement = "\\" not in replacement
+        self._memo: Optional[_MatchMemo] = None
+
+        if not pattern:
+            self.apply = self._apply_nothing
+        elif mode == "Replace":
+            self.apply = self._apply_replace
+        elif mode == "Wildcard":
+            self._regex = re.compile(fnmatch.translate(os.path.normcase(pattern)))
+            self._memo = _memo_for(mode, pattern)
+            self.apply = self._apply_wildcard
+        else:
+            try:
+                self._regex = re.compile(pattern)
+            except re.error as exc:
+                raise RuleError(f"invalid regex: {exc}") from exc
+            try:
+                # Parses the template as well, so bad group references fail here.
+                self._regex.sub(replacement, "")
+            except (re.error, IndexError) as exc:
+                raise RuleError(f"invalid replacement: {exc}") from exc
+            self._memo = _memo_for(mode, pattern)
+            self.apply = self._apply_regex
+
+    @classmethod
+    def from_request(cls, request: PreviewRequest) -> "RenameRule":
+        return cls(request.mode, request.pattern, request.replacement)
+
+    @staticmethod
+    def _apply_nothing(name: str) -> Optional[str]:
+        return None
+
+    def _apply_replace(self, name: str) -> Optional[str]:
+        return name.replace(self.pattern, self.replacement)
+
+    def _apply_wildcard(self, name: str) -> Optional[str]:
+        results = self._memo.results
+        if name in results:
+            stem = results[name]
+        else:
+            if self._regex.match(os.path.normcase(name)) is None:
+                stem = _NO_MATCH
+            else:
+                stem = len(os.path.splitext(name)[0])
+            self._memo.remember(name, stem)
+        if stem is _NO_MATCH:
+            return None
+        if "*" in self.replacement:
+            return self.replacement.replace("*", name[:stem])
+        return self.replacement
+
+    def _apply_regex(self, name: str) -> Optional[str]:
+        results = self._memo.results
+        spans = results.get(name)
+        if spans is None:
+            spans = _NO_SPANS
+            for match in self._regex.finditer(name):
+                spans += match.span()
+            self._memo.remember(name, spans)
+        if not spans:
+            return name
+        if not self._literal_replacement:
+            # Templates with escapes or group references go through re itself.
+            return self._regex.sub(self.replacement, name)
+        pieces = []
+        position = 0
+        for index in range(0, len(spans), 2):
+            pieces.append(name[position:spans[index]])
+            pieces.append(self.replacement)
+            position = spans[index + 1]
+        pieces.append(name[position:])
+        return "".join(pieces)
+
+
+@lru_cache(maxsize=32)
+def compile_rule(mode: str, pattern: str, replacement: str) -> RenameRule:
+    return RenameRule(mode, pattern, replacement)
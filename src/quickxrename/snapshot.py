@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import itertools
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from operator import attrgetter
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from .filters import FilterKey, WalkFilter
+from .walker import walk_parallel
+
+SnapshotKey = Tuple[str, bool, bool, bool, Optional[FilterKey]]
+
+_FILE = 0
+_FOLDER = 1
+
+
+class DirectorySnapshot:
+    """
+    Compact listing of one scanned root.
+
+    Parent directories are stored once and referenced by index; names and
+    kinds sit in flat arrays. Full paths are only rebuilt while iterating.
+    Other files the listing depends on (.gitignore) are revalidated with the
+    directories.
+    """
+
+    __slots__ = ("dirs", "dir_mtimes", "parents", "names", "kinds", "checked_at", "files", "cancelled")
+
+    def __init__(self) -> None:
+        self.dirs: List[str] = []
+        self.dir_mtimes: List[int] = []
+        self.parents = array("I")
+        self.names: List[str] = []
+        self.kinds = bytearray()
+        self.checked_at = time.monotonic()
+        self.files: List[Tuple[str, int]] = []
+        self.cancelled = False  # the scan stopped early; never cached
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add_dir(self, path: str, mtime_ns: int) -> int:
+        self.dirs.append(path)
+        self.dir_mtimes.append(mtime_ns)
+        return len(self.dirs) - 1
+
+    def add_item(self, parent: int, name: str, is_dir: bool) -> None:
+        self.parents.append(parent)
+        self.names.append(name)
+        self.kinds.append(_FOLDER if is_dir else _FILE)
+
+    def items(self, rows: Optional[Iterable[int]] = None) -> Iterator[Tuple[str, bool]]:
+        # `rows` picks items by position, in the order given.
+        dirs = self.dirs
+        join = os.path.join
+        if rows is not None:
+            parents, names, kinds = self.parents, self.names, self.kinds
+            for row in rows:
+                yield join(dirs[parents[row]], names[row]), kinds[row] == _FOLDER
+            return
+        for parent, name, kind in zip(self.parents, self.names, self.kinds):
+            yield join(dirs[parent], name), kind == _FOLDER
+
+    def is_current(self) -> bool:
+        for path, mtime_ns in itertools.chain(zip(self.dirs, self.dir_mtimes), self.files):
+            try:
+                if os.stat(path).st_mtime_ns != mtime_ns:
+                    return False
+            except OSError:
+                return False
+        self.checked_at = time.monotonic()
+        return True
+
+
+def _scan(
+    directory: str,
+    recursive: bool,
+    include_files: bool,
+    include_folders: bool,
+    snapshot: DirectorySnapshot,
+    walk_filter: Optional[WalkFilter] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    workers: int = 0,
+) -> Iterator[Tuple[str, bool]]:
+    # Same order as renamer.iter_items (sorted by name, folders before files
+    # in each folder). The directory is stat'ed before it is
+    # listed so a change racing the listing still invalidates the snapshot.
+    if recursive and workers > 1:
+        def stop_check() -> bool:
+            snapshot.cancelled = cancel_check()
+            return snapshot.cancelled
+
+        walk = walk_parallel(
+            directory, walk_filter, stop_check if cancel_check is not None else None, workers, stat_dirs=True
+        )
+        for root, mtime_ns, shown, files in walk:
+            parent = snapshot.add_dir(root, mtime_ns)
+            if include_folders:
+                for entry in shown:
+                    snapshot.add_item(parent, entry.name, True)
+                    yield entry.path, True
+            if include_files:
+                for entry in files:
+                    snapshot.add_item(parent, entry.name, False)
+                    yield entry.path, False
+        return
+    stack = [directory]
+    while stack:
+        if cancel_check is not None and cancel_check():
+            snapshot.cancelled = True
+            return
+        root = stack.pop()
+        try:
+            mtime_ns = os.stat(root).st_mtime_ns
+            with os.scandir(root) as it:
+                listing = sorted(it, key=_entry_name)
+        except OSError:
+            continue
+        parent = snapshot.add_dir(root, mtime_ns)
+        if not recursive:
+            scope = walk_filter.scope(root) if walk_filter is not None else None
+            kept = []
+            for entry in listing:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if scope is not None and not (
+                    walk_filter.keep(scope, entry.name, is_dir) and walk_filter.report(scope, entry.name)
+                ):
+                    continue
+                if is_dir and include_folders:
+                    snapshot.add_item(parent, entry.name, True)
+                    yield entry.path, True
+                elif not is_dir and include_files and entry.is_file():
+                    kept.append(entry)
+            for entry in kept:
+                snapshot.add_item(parent, entry.name, False)
+                yield entry.path, False
+            continue
+        dirs = []
+        files = []
+        for entry in listing:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if is_dir:
+                dirs.append(entry)
+            else:
+                files.append(entry)
+        shown = dirs
+        if walk_filter is not None:
+            dirs, shown, files = walk_filter.filter_names(root, dirs, files, _entry_name)
+        if include_folders:
+            for entry in shown:
+                snapshot.add_item(parent, entry.name, True)
+                yield entry.path, True
+        if include_files:
+            for entry in files:
+                snapshot.add_item(parent, entry.name, False)
+                yield entry.path, False
+        stack.extend(entry.path for entry in reversed(dirs) if not entry.is_symlink())
+
+
+_entry_name = attrgetter("name")
+
+
+class SnapshotCache:
+    """
+    LRU of directory snapshots keyed by (directory, recursive, include_files,
+    include_folders, walk filter).
+
+    A cached snapshot is served only while every directory mtime still
+    matches; the check is skipped if it already passed within the last
+    `revalidate_after` seconds, so bursts of keystrokes stay in memory.
+    """
+
+    def __init__(self, max_roots: int = 4, max_items: int = 2_000_000, revalidate_after: float = 2.0) -> None:
+        self.max_roots = max_roots
+        self.max_items = max_items
+        self.revalidate_after = revalidate_after
+        self._snapshots: "OrderedDict[SnapshotKey, DirectorySnapshot]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(
+        directory: str, recursive: bool, include_files: bool, include_folders: bool, walk_filter: Optional[WalkFilter]
+    ) -> SnapshotKey:
+        return (directory, recursive, include_files, include_folders, walk_filter.key if walk_filter else None)
+
+    def current(
+        self,
+        directory: str,
+        recursive: bool,
+        include_files: bool,
+        include_folders: bool,
+        walk_filter: Optional[WalkFilter] = None,
+    ) -> Optional[DirectorySnapshot]:
+        """The cached snapshot items() would serve now, or None; never scans."""
+        return self._lookup(self._key(directory, recursive, include_files, include_folders, walk_filter))
+
+    def _lookup(self, key: SnapshotKey) -> Optional[DirectorySnapshot]:
+        with self._lock:
+            snapshot = self._snapshots.get(key)
+            if snapshot is not None:
+                self._snapshots.move_to_end(key)
+        if snapshot is None:
+            return None
+        if time.monotonic() - snapshot.checked_at < self.revalidate_after or snapshot.is_current():
+            return snapshot
+        self.invalidate(key[0])
+        return None
+
+    def _store(self, key: SnapshotKey, snapshot: DirectorySnapshot) -> None:
+        with self._lock:
+            self._snapshots[key] = snapshot
+            self._snapshots.move_to_end(key)
+            total = sum(len(s) for s in self._snapshots.values())
+            while len(self._snapshots) > 1 and (len(self._snapshots) > self.max_roots or total > self.max_items):
+                _key, evicted = self._snapshots.popitem(last=False)
+                total -= len(evicted)
+
+    def invalidate(self, directory: Optional[str] = None) -> None:
+        with self._lock:
+            if directory is None:
+                self._snapshots.clear()
+                return
+            for key in [k for k in self._snapshots if k[0] == directory]:
+                del self._snapshots[key]
+
+    def items(
+        self,
+        directory: str,
+        recursive: bool,
+        include_files: bool,
+        include_folders: bool,
+        refresh: bool = False,
+        walk_filter: Optional[WalkFilter] = None,
+        cancel_check: Optional[Callable[[], bool]] = None,
+        workers: int = 0,
+        on_snapshot: Optional[Callable[[DirectorySnapshot], None]] = None,
+    ) -> Iterator[Tuple[str, bool]]:
+        # on_snapshot(snapshot) gets the snapshot the items came from, once
+        # they all have, unless the scan was cancelled.
+        key = self._key(directory, recursive, include_files, include_folders, walk_filter)
+        snapshot = None if refresh else self._lookup(key)
+        if snapshot is not None:
+            yield from snapshot.items()
+            if on_snapshot is not None:
+                on_snapshot(snapshot)
+            return
+
+        snapshot = DirectorySnapshot()
+        walk = _scan(
+            directory, recursive, include_files, include_folders, snapshot, walk_filter, cancel_check, workers
+        )
+        for item in walk:
+            yield item
+        if walk_filter is not None:
+            snapshot.files.extend(walk_filter.loaded)
+        # Only complete walks are cached.
+        if not snapshot.cancelled and len(snapshot) <= self.max_items:
+            self._store(key, snapshot)
+        if not snapshot.cancelled and on_snapshot is not None:
+            on_snapshot(snapshot)
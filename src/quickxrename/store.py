@@ -0,0 +1,307 @@
+from __future__ import annotations
+
+import os
+from array import array
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Tuple, Union, overload
+
+from .models import PreviewEntry
+
+ITEM_TYPES = ("file", "folder")
+STATUSES = ("ready", "conflict", "invalid", "pending")
+
+NAME_BLOCK = 1024  # names joined into one string per block
+
+
+class PackedStrings:
+    """
+    List of strings stored as a few large ones.
+
+    Every NAME_BLOCK strings are joined into a single block with end offsets
+    in an array, so each name costs its characters plus four bytes instead
+    of a full str object. Reading one back slices it out of its block.
+    Overwritten strings are kept aside, and the list can be cut short.
+    """
+
+    __slots__ = ("_blocks", "_ends", "_pending", "_used", "_overrides")
+
+    def __init__(self) -> None:
+        self._blocks: List[str] = []
+        self._ends = array("I")
+        self._pending: List[str] = []
+        self._used = 0  # characters in the pending block so far
+        self._overrides: Dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._ends)
+
+    def append(self, value: str) -> None:
+        self._used += len(value)
+        self._ends.append(self._used)
+        self._pending.append(value)
+        if len(self._pending) == NAME_BLOCK:
+            self._blocks.append("".join(self._pending))
+            self._pending = []
+            self._used = 0
+
+    def __setitem__(self, index: int, value: str) -> None:
+        if not 0 <= index < len(self._ends):
+            raise IndexError("string index out of range")
+        self._overrides[index] = value
+
+    def truncate(self, length: int) -> None:
+        """Drops every string from `length` on."""
+        while len(self._ends) > length:
+            if not self._pending:
+                # Reopen the last full block to take strings off its end.
+                block = self._blocks.pop()
+                start = 0
+                for end in self._ends[-NAME_BLOCK:]:
+                    self._pending.append(block[start:end])
+                    start = end
+                self._used = len(block)
+            self._used -= len(self._pending.pop())
+            self._ends.pop()
+        for index in [i for i in self._overrides if i >= length]:
+            del self._overrides[index]
+
+    def __getitem__(self, index: int) -> str:
+        if index in self._overrides:
+            return self._overrides[index]
+        block, offset = divmod(index, NAME_BLOCK)
+        if block == len(self._blocks):
+            return self._pending[offset]
+        start = self._ends[index - 1] if offset else 0
+        return self._blocks[block][start:self._ends[index]]
+
+    def __iter__(self) -> Iterator[str]:
+        if self._overrides:
+            overrides = self._overrides
+            for index, value in enumerate(self._iter_packed()):
+                yield overrides.get(index, value)
+            return
+        yield from self._iter_packed()
+
+    def _iter_packed(self) -> Iterator[str]:
+        ends = self._ends
+        for number, block in enumerate(self._blocks):
+            start = 0
+            for end in ends[number * NAME_BLOCK:(number + 1) * NAME_BLOCK]:
+                yield block[start:end]
+                start = end
+        yield from self._pending
+
+
+class PreviewStore(Sequence):
+    """
+    Columnar preview result.
+
+    Directory prefixes are interned once; per row there are two packed names
+    (old and new), prefix indices for the old and final locations, and one
+    byte each for type and status. PreviewEntry objects and full paths are
+    built only when a row is read, so iterating, indexing and slicing behave
+    like the list of entries this replaces. The per-column accessors let the
+    table model read single cells without building whole entries.
+
+    raw_new_path is the old prefix plus the new name; final_new_path differs
+    only in its prefix. Rows that don't fit that shape (an invalid name with
+    a separator in it) keep their paths in a small side table.
+    """
+
+    def __init__(self, entries: Iterable[PreviewEntry] = ()) -> None:
+        self._prefixes: List[str] = []
+        self._prefix_index: Dict[str, int] = {}
+        self._messages: List[str] = [""]
+        self._message_index: Dict[str, int] = {"": 0}
+        self._old_names = PackedStrings()
+        self._new_names = PackedStrings()
+        self._old_prefix = array("I")
+        self._final_prefix = array("I")
+        self._kinds = bytearray()
+        self._statuses = bytearray()
+        self._message_ids = array("H")
+        self._irregular: Dict[int, Tuple[str, str]] = {}  # row -> (raw_new_path, final_new_path)
+        self.extend(entries)
+
+    def _intern(self, prefix: str) -> int:
+        index = self._prefix_index.get(prefix)
+        if index is None:
+            index = len(self._prefixes)
+            self._prefixes.append(prefix)
+            self._prefix_index[prefix] = index
+        return index
+
+    def _columns(
+        self, row: int, old_path: str, raw_new_path: str, final_new_path: str, message: str
+    ) -> Tuple[str, str, int, int, int]:
+        # (old name, new name, old prefix, final prefix, message id) of a row;
+        # paths that don't fit go to the side table.
+        old_name = os.path.basename(old_path)
+        prefix = old_path[:len(old_path) - len(old_name)]
+        old_prefix = self._intern(prefix)
+        new_name = raw_new_path[len(prefix):]
+        final_prefix = old_prefix
+        if (
+            raw_new_path.startswith(prefix)
+            and os.path.basename(raw_new_path) == new_name
+            and final_new_path.endswith(new_name)
+        ):
+            if final_new_path != raw_new_path:
+                final_prefix = self._intern(final_new_path[:len(final_new_path) - len(new_name)])
+        else:
+            self._irregular[row] = (raw_new_path, final_new_path)
+        message_id = self._message_index.get(message)
+        if message_id is None:
+            message_id = len(self._messages)
+            self._messages.append(message)
+            self._message_index[message] = message_id
+        return old_name, new_name, old_prefix, final_prefix, message_id
+
+    def add(
+        self,
+        item_type: str,
+        old_path: str,
+        raw_new_path: str,
+        final_new_path: str,
+        status: str,
+        message: str = "",
+    ) -> None:
+        old_name, new_name, old_prefix, final_prefix, message_id = self._columns(
+            len(self._kinds), old_path, raw_new_path, final_new_path, message
+        )
+        self._old_names.append(old_name)
+        self._new_names.append(new_name)
+        self._old_prefix.append(old_prefix)
+        self._final_prefix.append(final_prefix)
+        self._kinds.append(ITEM_TYPES.index(item_type))
+        self._statuses.append(STATUSES.index(status))
+        self._message_ids.append(message_id)
+
+    def set(self, row: int, entry: PreviewEntry) -> None:
+        """Overwrites one row in place, as the live preview does."""
+        if not 0 <= row < len(self):
+            raise IndexError("preview row out of range")
+        self._irregular.pop(row, None)
+        old_name, new_name, old_prefix, final_prefix, message_id = self._columns(
+            row, entry.old_path, entry.raw_new_path, entry.final_new_path, entry.message
+        )
+        if self._old_names[row] != old_name:
+            self._old_names[row] = old_name
+        if self._new_names[row] != new_name:
+            self._new_names[row] = new_name
+        self._old_prefix[row] = old_prefix
+        self._final_prefix[row] = final_prefix
+        self._kinds[row] = ITEM_TYPES.index(entry.item_type)
+        self._statuses[row] = STATUSES.index(entry.status)
+        self._message_ids[row] = message_id
+
+    def truncate(self, length: int) -> None:
+        """Drops every row from `length` on."""
+        self._old_names.truncate(length)
+        self._new_names.truncate(length)
+        del self._old_prefix[length:]
+        del self._final_prefix[length:]
+        del self._kinds[length:]
+        del self._statuses[length:]
+        del self._message_ids[length:]
+        for row in [r for r in self._irregular if r >= length]:
+            del self._irregular[row]
+
+    def append(self, entry: PreviewEntry) -> None:
+        self.add(entry.item_type, entry.old_path, entry.raw_new_path, entry.final_new_path, entry.status, entry.message)
+
+    def extend(self, entries: Iterable[PreviewEntry]) -> None:
+        for entry in entries:
+            self.append(entry)
+
+    def __len__(self) -> int:
+        return len(self._kinds)
+
+    def item_type(self, row: int) -> str:
+        return ITEM_TYPES[self._kinds[row]]
+
+    def status(self, row: int) -> str:
+        return STATUSES[self._statuses[row]]
+
+    def message(self, row: int) -> str:
+        return self._messages[self._message_ids[row]]
+
+    def old_path(self, row: int) -> str:
+        return self._prefixes[self._old_prefix[row]] + self._old_names[row]
+
+    def raw_new_path(self, row: int) -> str:
+        if row in self._irregular:
+            return self._irregular[row][0]
+        return self._prefixes[self._old_prefix[row]] + self._new_names[row]
+
+    def final_new_path(self, row: int) -> str:
+        if row in self._irregular:
+            return self._irregular[row][1]
+        return self._prefixes[self._final_prefix[row]] + self._new_names[row]
+
+    def entry(self, row: int) -> PreviewEntry:
+        return PreviewEntry(
+            item_type=self.item_type(row),
+            old_path=self.old_path(row),
+            raw_new_path=self.raw_new_path(row),
+            final_new_path=self.final_new_path(row),
+            status=self.status(row),
+            message=self.message(row),
+        )
+
+    @overload
+    def __getitem__(self, index: int) -> PreviewEntry: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[PreviewEntry]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[PreviewEntry, List[PreviewEntry]]:
+        if isinstance(index, slice):
+            return [self.entry(row) for row in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("preview row out of range")
+        return self.entry(index)
+
+    def __iter__(self) -> Iterator[PreviewEntry]:
+        # Walks the columns side by side instead of indexing row by row.
+        prefixes = self._prefixes
+        messages = self._messages
+        irregular = self._irregular
+        columns = zip(
+            self._old_names, self._new_names, self._old_prefix, self._final_prefix,
+            self._kinds, self._statuses, self._message_ids,
+        )
+        for row, (old_name, new_name, old_prefix, final_prefix, kind, status, message_id) in enumerate(columns):
+            prefix = prefixes[old_prefix]
+            if row in irregular:
+                raw_new_path, final_new_path = irregular[row]
+            else:
+                raw_new_path = prefix + new_name
+                final_new_path = raw_new_path if final_prefix == old_prefix else prefixes[final_prefix] + new_name
+            yield PreviewEntry(
+                ITEM_TYPES[kind], prefix + old_name, raw_new_path, final_new_path, STATUSES[status], messages[message_id]
+            )
+
+    def rows_with_status(self, status: str) -> Iterator[int]:
+        code = STATUSES.index(status)
+        statuses = self._statuses
+        start = statuses.find(code)
+        while start >= 0:
+            yield start
+            start = statuses.find(code, start + 1)
+
+    def select(self, status: str) -> "PreviewStore":
+        """A new store with only the rows in `status`, in order."""
+        selected = PreviewStore()
+        for row in self.rows_with_status(status):
+            selected.add(
+                self.item_type(row),
+                self.old_path(row),
+                self.raw_new_path(row),
+                self.final_new_path(row),
+                status,
+                self.message(row),
+            )
+        return selected
@@ -11,7 +11,7 @@ QPushButton { background: #1f2432; border: 1px solid #2f3a50; border-radius: 8px
 QPushButton:hover { background: #283146; }
 QPushButton:pressed { background: #222b3f; }
 QPushButton:disabled { color: #7e8798; background: #1a1f2c; border: 1px solid #222a3a; }
-QTableWidget { background: #101522; border: 1px solid #2b3446; gridline-color: #1f2533; }
+QTableView { background: #101522; border: 1px solid #2b3446; gridline-color: #1f2533; }
 QHeaderView::section { background: #161b29; color: #a7b0c0; padding: 8px; border: 1px solid #232a3a; }
 QTextEdit { min-height: 120px; }
 QProgressBar { background: #141926; border: 1px solid #2b3446; border-radius: 8px; text-align: center; }
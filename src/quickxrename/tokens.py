@@ -0,0 +1,259 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .rules import RuleError
+
+if TYPE_CHECKING:
+    from .hashing import HashCache
+
+HASH_TOKENS = ("sha256", "blake2b")  # same names as hashing.HASH_ALGORITHMS
+TOKENS = ("mtime", "size", "n", "parent", *HASH_TOKENS)
+STAT_TOKENS = frozenset({"mtime", "size", *HASH_TOKENS})
+DEFAULT_SPECS = {"mtime": "%Y%m%d"}
+
+STAT_BATCH = 512  # candidates whose metadata is fetched together
+STAT_BUFFER = 8192  # items held back at most while a batch fills up
+STAT_WORKERS = 8
+SCANDIR_MIN = 16  # candidates in one folder that make a listing cheaper than stats (Windows)
+
+# Each token in a replacement stands in the compiled rule as one private-use
+# character, so rules, memos and worker processes never see the braces. An
+# item whose own name holds such a character is left unchanged by token rules.
+_SENTINEL_BASE = 0xE000
+_MAX_TOKENS = 256
+_SENTINELS = re.compile("[\ue000-\ue0ff]")
+_FIELD = re.compile(r"\{\{|\}\}|\{(" + "|".join(TOKENS) + r")(?::([^{}]*))?\}")
+
+EvaluatedItem = Tuple[str, bool, Optional[str]]
+
+
+class TokenTemplate:
+    """
+    A replacement with metadata tokens: {mtime:%Y%m%d}, {size}, {n:04},
+    {parent}, and content hashes {sha256:12} or {blake2b} (the spec is the
+    number of hex digits kept).
+
+    `replacement` is what the rule is compiled with; expand() fills in the
+    values once the rule has matched. `needs_stat` tells whether any token
+    reads the file's metadata, so rules without such tokens never stat, and
+    `hashes` which digests to compute.
+    {{ and }} are literal braces; other braces are kept as they are.
+    Tokens stand in the rule's output as characters U+E000-U+E0FF; a name
+    that already contains one (see collides()) is not renamed, since its own
+    characters could not be told apart from the tokens.
+    """
+
+    def __init__(self, source: str, *more: str) -> None:
+        self.source = source
+        self.fields: List[Tuple[str, str]] = []
+        # Replacements of later pipeline steps share the field numbering.
+        self.replacements = tuple(self._parse(text) for text in (source, *more))
+        self.replacement = self.replacements[0]
+        self.needs_stat = any(token in STAT_TOKENS for token, _spec in self.fields)
+        self.hashes = tuple(sorted({token for token, _spec in self.fields if token in HASH_TOKENS}))
+
+    def _parse(self, source: str) -> str:
+        pieces = []
+        position = 0
+        for match in _FIELD.finditer(source):
+            pieces.append(source[position:match.start()])
+            position = match.end()
+            text = match.group(0)
+            if text in ("{{", "}}"):
+                pieces.append(text[0])
+                continue
+            if len(self.fields) >= _MAX_TOKENS:
+                raise RuleError(f"too many tokens (at most {_MAX_TOKENS})")
+            token, spec = match.group(1), match.group(2)
+            spec = DEFAULT_SPECS.get(token, "") if spec is None else spec
+            _check_spec(token, spec)
+            pieces.append(chr(_SENTINEL_BASE + len(self.fields)))
+            self.fields.append((token, spec))
+        pieces.append(source[position:])
+        return "".join(pieces)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.fields)
+
+    @staticmethod
+    def marked(new_name: Optional[str]) -> bool:
+        return new_name is not None and _SENTINELS.search(new_name) is not None
+
+    @staticmethod
+    def collides(path: str) -> bool:
+        return _SENTINELS.search(os.path.basename(path)) is not None
+
+    def expand(
+        self,
+        path: str,
+        new_name: str,
+        serial: int,
+        stat: Optional[os.stat_result] = None,
+        digests: Optional[Dict[str, str]] = None,
+    ) -> str:
+        values = {}
+        for index, (token, spec) in enumerate(self.fields):
+            if token in HASH_TOKENS:
+                value = digests[token][:int(spec)] if spec else digests[token]
+            elif token == "n":
+                value = format(serial, spec)
+            elif token == "parent":
+                value = format(os.path.basename(os.path.dirname(path)), spec)
+            elif token == "size":
+                value = format(stat.st_size, spec)
+            else:
+                value = time.strftime(spec, time.localtime(stat.st_mtime))
+            values[_SENTINEL_BASE + index] = value
+        return new_name.translate(values)
+
+
+def _check_spec(token: str, spec: str) -> None:
+    if token in HASH_TOKENS:
+        if spec and not (spec.isdigit() and int(spec) > 0):
+            raise RuleError(f"invalid length for {{{token}}}: {spec!r}")
+        return
+    try:
+        if token in ("n", "size"):
+            format(1, spec)
+        elif token == "parent":
+            format("", spec)
+        else:
+            time.strftime(spec)
+    except ValueError as exc:
+        raise RuleError(f"invalid format for {{{token}}}: {exc}") from exc
+
+
+@lru_cache(maxsize=32)
+def parse_tokens(replacement: str, *more: str) -> TokenTemplate:
+    return TokenTemplate(replacement, *more)
+
+
+def _stat_all(paths: Sequence[str]) -> List[Optional[os.stat_result]]:
+    results = []
+    for path in paths:
+        try:
+            results.append(os.stat(path))
+        except OSError:
+            results.append(None)
+    return results
+
+
+def fetch_stats(
+    paths: Sequence[str], pool: Optional[ThreadPoolExecutor] = None
+) -> Dict[str, Optional[os.stat_result]]:
+    """
+    stat() for many paths at once; None for paths that are gone.
+
+    On Windows a folder listing carries every entry's stat, so folders with
+    many candidates are listed once instead. Elsewhere DirEntry has no stat
+    data to reuse and the stats are split over the pool's threads.
+    """
+    stats: Dict[str, Optional[os.stat_result]] = {}
+    remaining = list(paths)
+    if os.name == "nt":
+        by_parent: Dict[str, List[str]] = {}
+        for path in remaining:
+            by_parent.setdefault(os.path.dirname(path), []).append(path)
+        remaining = []
+        for parent, group in by_parent.items():
+            if len(group) < SCANDIR_MIN:
+                remaining.extend(group)
+                continue
+            wanted = set(group)
+            try:
+                with os.scandir(parent) as it:
+                    for entry in it:
+                        if entry.path in wanted and not entry.is_symlink():
+                            stats[entry.path] = entry.stat()
+            except OSError:
+                pass
+            remaining.extend(path for path in group if path not in stats)
+    if pool is None or len(remaining) < 2 * STAT_WORKERS:
+        stats.update(zip(remaining, _stat_all(remaining)))
+        return stats
+    size = -(-len(remaining) // STAT_WORKERS)
+    chunks = [remaining[start:start + size] for start in range(0, len(remaining), size)]
+    for chunk, results in zip(chunks, pool.map(_stat_all, chunks)):
+        stats.update(zip(chunk, results))
+    return stats
+
+
+def expand_tokens(
+    evaluated: Iterable[EvaluatedItem],
+    template: TokenTemplate,
+    batch_size: int = STAT_BATCH,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    on_bytes: Optional[Callable[[int, int], None]] = None,
+    hash_cache: Optional["HashCache"] = None,
+) -> Iterator[EvaluatedItem]:
+    """
+    Fill in the tokens of evaluated items, keeping walk order.
+
+    {n} numbers the renamed items from 1 in walk order. Only items the rule
+    renamed are looked at; with stat tokens they are held back in batches
+    of `batch_size` and stat'ed together, and with hash tokens each batch
+    is hashed on a Hasher, which reports on_bytes(done, total). An item that
+    vanished meanwhile, a folder or unreadable file under a hash token, and
+    what a cancel leaves unhashed come out unchanged (new_name None).
+    """
+    pool = ThreadPoolExecutor(max_workers=STAT_WORKERS) if template.needs_stat else None
+    hasher = None
+    if template.hashes:
+        # hashlib and sqlite3 are only loaded for hash tokens.
+        from .hashing import Hasher, default_hash_cache
+
+        hasher = Hasher(template.hashes, hash_cache or default_hash_cache(), cancel_check, on_bytes)
+    serial = 0
+
+    def release(buffer: List[EvaluatedItem], candidates: List[str]) -> Iterator[EvaluatedItem]:
+        nonlocal serial
+        stats = fetch_stats(candidates, pool)
+        digests: Dict[str, Dict[str, str]] = {}
+        if hasher is not None:
+            digests = hasher.digests([(path, stats[path]) for path in candidates if stats.get(path) is not None])
+        for path, is_dir, new_name in buffer:
+            if template.marked(new_name):
+                if template.collides(path):
+                    yield path, is_dir, None
+                    continue
+                stat = stats.get(path)
+                if stat is None or (hasher is not None and path not in digests):
+                    yield path, is_dir, None
+                    continue
+                serial += 1
+                new_name = template.expand(path, new_name, serial, stat, digests.get(path))
+            yield path, is_dir, new_name
+
+    if pool is None:
+        for path, is_dir, new_name in evaluated:
+            if template.marked(new_name):
+                if template.collides(path):
+                    yield path, is_dir, None
+                    continue
+                serial += 1
+                new_name = template.expand(path, new_name, serial)
+            yield path, is_dir, new_name
+        return
+
+    try:
+        buffer: List[EvaluatedItem] = []
+        candidates: List[str] = []
+        for item in evaluated:
+            buffer.append(item)
+            if template.marked(item[2]) and not template.collides(item[0]):
+                candidates.append(item[0])
+            if len(candidates) >= batch_size or len(buffer) >= STAT_BUFFER:
+                yield from release(buffer, candidates)
+                buffer, candidates = [], []
+        yield from release(buffer, candidates)
+    finally:
+        pool.shutdown(wait=False)
+        if hasher is not None:
+            hasher.close()
@@ -1,29 +1,71 @@
 from __future__ import annotations
 
-from typing import List
+import sqlite3
+from typing import List, Sequence, Tuple
 
 from PySide6.QtCore import QTimer, Qt, QThreadPool
-from PySide6.QtGui import QColor
+from PySide6.QtGui import QFontDatabase
 from PySide6.QtWidgets import (
+    QAbstractItemView,
     QFileDialog,
     QGroupBox,
     QHBoxLayout,
+    QHeaderView,
     QLabel,
     QLineEdit,
     QMainWindow,
+    QMenu,
+    QMessageBox,
+    QPlainTextEdit,
     QPushButton,
     QCheckBox,
     QComboBox,
-    QTableWidget,
-    QTableWidgetItem,
-    QTextEdit,
+    QTableView,
+    QToolButton,
     QVBoxLayout,
     QWidget,
     QProgressBar,
+    QSpinBox,
 )
 
-from .models import PreviewEntry, PreviewRequest, PreviewStats, RenameOperation
-from .workers import PreviewTask, RenameTask, UndoTask
+from .control import TaskControl
+from .filters import split_globs
+from .incremental import MatchSet
+from .index import TreeIndex
+from .journal import RenameJournal
+from .live_preview import LivePreview
+from .logfile import LogFile
+from .metrics import NULL_METRICS, Metrics
+from .models import PreviewEntry, PreviewRequest, PreviewStats, RenameOperation, RuleStep
+from .pipeline import CASE_STEPS, load_preset, save_preset, split_steps
+from .planner import default_rename_workers
+from .preview_model import PreviewTableModel, make_preview_proxy, sample_column_widths
+from .renamer import walk_filter_for
+from .rules import RuleError
+from .snapshot import SnapshotCache
+from .store import PreviewStore
+from .walker import default_walk_workers
+from .workers import JournalTask, PreviewTask, RenameTask, UndoTask, WatchTask
+
+LOG_VIEW_LINES = 5000  # lines kept in the log view; the log file has everything
+
+
+def _format_bytes(count: float) -> str:
+    if count < 1024:
+        return f"{count:.0f} B"
+    for unit in ("KB", "MB", "GB", "TB"):
+        count /= 1024
+        if count < 1024 or unit == "TB":
+            break
+    return f"{count:.1f} {unit}"
+
+
+def _describe_step(step: RuleStep) -> str:
+    if step.kind in CASE_STEPS:
+        return step.kind
+    if step.kind == "Trim":
+        return f"Trim {step.pattern!r}" if step.pattern else "Trim"
+    return f"{step.kind}: {step.pattern!r} -> {step.replacement!r}"
 
 
 class MainWindow(QMainWindow):
@@ -34,8 +76,33 @@ class MainWindow(QMainWindow):
 
         self.thread_pool = QThreadPool.globalInstance()
         self.last_operations: List[RenameOperation] = []
-        self._preview_entries: List[PreviewEntry] = []
+        self._preview_entries = PreviewStore()
+        self._preview_request: PreviewRequest | None = None
         self._preview_token = 0
+        self._streamed_token = 0
+        self.snapshot_cache = SnapshotCache()
+        # Rows the last preview matched; a refined pattern re-evaluates just those.
+        self._match_set: MatchSet | None = None
+        self.tree_index: TreeIndex | None = None  # opened when "Index" is first checked
+        self._live: LivePreview | None = None
+        self.rule_steps: Tuple[RuleStep, ...] = ()  # preset steps run after the pattern row
+        self._watch_token = 0
+        # Pause/Stop act on the running task; a preview started meanwhile does
+        # not take them over, and a new preview cancels the previous one.
+        self._control: TaskControl | None = None
+        self._preview_control: TaskControl | None = None
+        # Only filled while the performance panel is open.
+        self._ui_metrics: Metrics = NULL_METRICS
+        self._preview_metrics: Metrics | None = None
+        try:
+            self.journal: RenameJournal | None = RenameJournal()
+        except OSError:
+            # Without a writable journal, undo falls back to the last batch in memory.
+            self.journal = None
+        try:
+            self.log_file: LogFile | None = LogFile()
+        except OSError:
+            self.log_file = None
 
         self._debounce = QTimer(self)
         self._debounce.setSingleShot(True)
@@ -43,6 +110,8 @@ class MainWindow(QMainWindow):
         self._debounce.timeout.connect(self.refresh_preview)
 
         self._build_ui()
+        self._update_history_buttons()
+        QTimer.singleShot(0, self.check_interrupted_runs)
 
     def _build_ui(self) -> None:
         root = QWidget()
@@ -64,12 +133,46 @@ class MainWindow(QMainWindow):
         self.files_check.setChecked(True)
         self.folders_check = QCheckBox("Folders")
         self.folders_check.setChecked(True)
+        self.live_check = QCheckBox("Live")
+        self.live_check.setToolTip("Keep the preview current while files change")
+        self.live_check.toggled.connect(self.toggle_live)
+        self.index_check = QCheckBox("Index")
+        self.index_check.setToolTip(
+            "Keep an on-disk index of scanned folders: reopening a huge folder only re-reads what changed"
+        )
+        self.index_check.toggled.connect(self.toggle_index)
         options_row.addWidget(self.recursive_check)
         options_row.addWidget(self.files_check)
         options_row.addWidget(self.folders_check)
+        options_row.addWidget(self.live_check)
+        options_row.addWidget(self.index_check)
         options_row.addStretch(1)
         layout.addLayout(options_row)
 
+        filter_group = QGroupBox("Filters")
+        filter_layout = QHBoxLayout(filter_group)
+        self.include_input = QLineEdit()
+        self.include_input.setPlaceholderText("e.g. *.jpg, *.png")
+        self.exclude_input = QLineEdit()
+        self.exclude_input.setPlaceholderText("e.g. node_modules, build, *.tmp")
+        self.depth_spin = QSpinBox()
+        self.depth_spin.setRange(0, 999)
+        self.depth_spin.setSpecialValueText("Any")
+        self.depth_spin.setToolTip("Deepest level listed; 1 is the selected folder's own items")
+        self.hidden_check = QCheckBox("Hidden")
+        self.hidden_check.setChecked(True)
+        self.gitignore_check = QCheckBox(".gitignore")
+        self.gitignore_check.setToolTip("Skip what git ignores, and .git itself")
+        filter_layout.addWidget(QLabel("Include"))
+        filter_layout.addWidget(self.include_input)
+        filter_layout.addWidget(QLabel("Exclude"))
+        filter_layout.addWidget(self.exclude_input)
+        filter_layout.addWidget(QLabel("Depth"))
+        filter_layout.addWidget(self.depth_spin)
+        filter_layout.addWidget(self.hidden_check)
+        filter_layout.addWidget(self.gitignore_check)
+        layout.addWidget(filter_group)
+
         pattern_group = QGroupBox("Pattern")
         pattern_layout = QHBoxLayout(pattern_group)
         self.mode_combo = QComboBox()
@@ -78,36 +181,79 @@ class MainWindow(QMainWindow):
         self.pattern_input.setPlaceholderText("Pattern")
         self.replacement_input = QLineEdit()
         self.replacement_input.setPlaceholderText("Replacement")
+        self.replacement_input.setToolTip(
+            "Tokens: {n:04} sequence number, {mtime:%Y%m%d} modification date, {size} in bytes, "
+            "{parent} folder name, {sha256:12} or {blake2b} content hash; {{ and }} for literal braces"
+        )
         pattern_layout.addWidget(QLabel("Mode"))
         pattern_layout.addWidget(self.mode_combo)
         pattern_layout.addWidget(QLabel("Find"))
         pattern_layout.addWidget(self.pattern_input)
         pattern_layout.addWidget(QLabel("Replace"))
         pattern_layout.addWidget(self.replacement_input)
+        self.steps_label = QLabel("")
+        self.preset_btn = QToolButton()
+        self.preset_btn.setText("Preset")
+        self.preset_btn.setPopupMode(QToolButton.InstantPopup)
+        preset_menu = QMenu(self.preset_btn)
+        preset_menu.addAction("Load...", self.open_preset)
+        preset_menu.addAction("Save...", self.save_preset_as)
+        self.clear_steps_action = preset_menu.addAction("Clear Steps", self.clear_steps)
+        self.clear_steps_action.setEnabled(False)
+        self.preset_btn.setMenu(preset_menu)
+        pattern_layout.addWidget(self.steps_label)
+        pattern_layout.addWidget(self.preset_btn)
         layout.addWidget(pattern_group)
 
         action_row = QHBoxLayout()
         self.refresh_btn = QPushButton("Refresh Preview")
-        self.refresh_btn.clicked.connect(self.refresh_preview)
+        self.refresh_btn.clicked.connect(lambda: self.refresh_preview(refresh=True))
         self.rename_btn = QPushButton("Rename")
         self.rename_btn.clicked.connect(self.perform_rename)
         self.undo_btn = QPushButton("Undo Last")
         self.undo_btn.clicked.connect(self.undo_last)
+        self.redo_btn = QPushButton("Redo")
+        self.redo_btn.clicked.connect(self.redo_last)
+        self.pause_btn = QPushButton("Pause")
+        self.pause_btn.setCheckable(True)
+        self.pause_btn.toggled.connect(self.toggle_pause)
+        self.stop_btn = QPushButton("Stop")
+        self.stop_btn.setToolTip("Stop between batches; a stopped rename can be resumed or rolled back")
+        self.stop_btn.clicked.connect(self.stop_task)
         self.rename_btn.setEnabled(False)
         self.undo_btn.setEnabled(False)
+        self.redo_btn.setEnabled(False)
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
         action_row.addWidget(self.refresh_btn)
         action_row.addWidget(self.rename_btn)
         action_row.addWidget(self.undo_btn)
+        action_row.addWidget(self.redo_btn)
         action_row.addStretch(1)
+        action_row.addWidget(self.pause_btn)
+        action_row.addWidget(self.stop_btn)
         layout.addLayout(action_row)
 
         self.status_label = QLabel("Items: 0 | Ready: 0 | Conflicts: 0 | Invalid: 0")
         layout.addWidget(self.status_label)
 
-        self.table = QTableWidget(0, 4)
-        self.table.setHorizontalHeaderLabels(["Type", "Old Path", "New Path", "Status"])
+        self.filter_input = QLineEdit()
+        self.filter_input.setPlaceholderText("Filter preview")
+        layout.addWidget(self.filter_input)
+
+        self.preview_model = PreviewTableModel(self)
+        self.preview_proxy = make_preview_proxy(self.preview_model, self)
+        self.filter_input.textChanged.connect(self.preview_proxy.setFilterFixedString)
+
+        self.table = QTableView()
+        self.table.setModel(self.preview_proxy)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setWordWrap(False)
         self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setSortingEnabled(False)
+        self.table.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(self.table.fontMetrics().height() + 10)
+        self.table.setSortingEnabled(True)
         layout.addWidget(self.table, stretch=1)
 
         self.progress = QProgressBar()
@@ -115,9 +261,30 @@ class MainWindow(QMainWindow):
         self.progress.setValue(0)
         layout.addWidget(self.progress)
 
-        self.log_output = QTextEdit()
+        self.perf_group = QGroupBox("Performance")
+        self.perf_group.setCheckable(True)
+        self.perf_group.setChecked(False)
+        self.perf_group.setToolTip("Time each stage of the next preview or rename")
+        perf_layout = QVBoxLayout(self.perf_group)
+        self.perf_view = QPlainTextEdit()
+        self.perf_view.setReadOnly(True)
+        self.perf_view.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.perf_view.setMaximumHeight(170)
+        self.perf_view.setPlaceholderText("Stage timings of the next preview or rename appear here")
+        self.perf_view.setVisible(False)
+        perf_layout.addWidget(self.perf_view)
+        self.perf_group.toggled.connect(self.perf_view.setVisible)
+        layout.addWidget(self.perf_group)
+
+        # Plain text with a block cap: old lines drop off the top instead of
+        # the document growing with every rename.
+        self.log_output = QPlainTextEdit()
         self.log_output.setReadOnly(True)
-        self.log_output.setPlaceholderText("Applied changes will appear here")
+        self.log_output.setMaximumBlockCount(LOG_VIEW_LINES)
+        placeholder = "Applied changes will appear here"
+        if self.log_file is not None:
+            placeholder += f" (full log: {self.log_file.path})"
+        self.log_output.setPlaceholderText(placeholder)
         layout.addWidget(self.log_output)
 
         self.setCentralWidget(root)
@@ -130,30 +297,121 @@ class MainWindow(QMainWindow):
             self.mode_combo,
             self.pattern_input,
             self.replacement_input,
+            self.include_input,
+            self.exclude_input,
+            self.depth_spin,
+            self.hidden_check,
+            self.gitignore_check,
         ]:
             if isinstance(widget, QLineEdit):
                 widget.textChanged.connect(self.schedule_preview)
             elif isinstance(widget, QCheckBox):
                 widget.toggled.connect(self.schedule_preview)
+            elif isinstance(widget, QSpinBox):
+                widget.valueChanged.connect(self.schedule_preview)
             else:
                 widget.currentIndexChanged.connect(self.schedule_preview)
 
     def log(self, message: str) -> None:
-        self.log_output.append(message)
+        if self.log_file is not None:
+            self.log_file.write_lines([message])
+        self.show_log(message)
+
+    def show_log(self, lines: str) -> None:
+        # Workers send batches of lines and write the log file themselves.
+        self.log_output.appendPlainText(lines)
+
+    def on_task_progress(self, done: int, total: int) -> None:
+        if total:
+            self.progress.setRange(0, total)
+            self.progress.setValue(done)
+
+    def _begin_task(self, control: TaskControl | None = None) -> TaskControl:
+        control = control or TaskControl()
+        self._control = control
+        self.pause_btn.setChecked(False)
+        self.pause_btn.setEnabled(True)
+        self.stop_btn.setEnabled(True)
+        return control
+
+    def _end_task(self, control: TaskControl) -> None:
+        if self._control is not control:
+            return
+        self._control = None
+        self.pause_btn.setChecked(False)
+        self.pause_btn.setEnabled(False)
+        self.stop_btn.setEnabled(False)
+
+    def toggle_pause(self, paused: bool) -> None:
+        self.pause_btn.setText("Resume" if paused else "Pause")
+        if self._control is None:
+            return
+        if paused:
+            self._control.pause()
+        else:
+            self._control.resume()
+
+    def stop_task(self) -> None:
+        if self._control is not None:
+            self._control.cancel()
+            self.pause_btn.setEnabled(False)
+            self.stop_btn.setEnabled(False)
 
     def pick_directory(self) -> None:
         directory = QFileDialog.getExistingDirectory(self, "Select Directory", "")
         if directory:
             self.dir_input.setText(directory)
 
+    def open_preset(self) -> None:
+        path, _ = QFileDialog.getOpenFileName(self, "Load Preset", "", "Presets (*.json)")
+        if not path:
+            return
+        try:
+            steps = load_preset(path)
+        except (RuleError, OSError) as exc:
+            QMessageBox.warning(self, "Preset", f"Cannot load the preset: {exc}")
+            return
+        mode, pattern, replacement, self.rule_steps = split_steps(steps)
+        self.mode_combo.setCurrentText(mode)
+        self.pattern_input.setText(pattern)
+        self.replacement_input.setText(replacement)
+        self._show_steps()
+        self.schedule_preview()
+
+    def save_preset_as(self) -> None:
+        path, _ = QFileDialog.getSaveFileName(self, "Save Preset", "", "Presets (*.json)")
+        if not path:
+            return
+        pattern = self.pattern_input.text()
+        main = (RuleStep(self.mode_combo.currentText(), pattern, self.replacement_input.text()),) if pattern else ()
+        try:
+            save_preset(path, (*main, *self.rule_steps))
+        except OSError as exc:
+            QMessageBox.warning(self, "Preset", f"Cannot save the preset: {exc}")
+            return
+        self.log(f"Saved preset {path}")
+
+    def clear_steps(self) -> None:
+        self.rule_steps = ()
+        self._show_steps()
+        self.schedule_preview()
+
+    def _show_steps(self) -> None:
+        count = len(self.rule_steps)
+        self.steps_label.setText(f"+{count} step{'s' if count != 1 else ''}" if count else "")
+        self.steps_label.setToolTip("\n".join(_describe_step(step) for step in self.rule_steps))
+        self.clear_steps_action.setEnabled(bool(count))
+
     def schedule_preview(self) -> None:
         self._debounce.start()
 
-    def refresh_preview(self) -> None:
+    def refresh_preview(self, refresh: bool = False) -> None:
+        # refresh=True drops the cached listing and walks the directory again.
+        self.stop_watching()
         directory = self.dir_input.text().strip()
         if not directory:
-            self._preview_entries = []
-            self.table.setRowCount(0)
+            self.preview_model.set_entries(PreviewStore())
+            self._preview_entries = self.preview_model.entries()
             self.rename_btn.setEnabled(False)
             return
 
@@ -168,100 +426,293 @@ class MainWindow(QMainWindow):
             mode=self.mode_combo.currentText(),
             pattern=self.pattern_input.text(),
             replacement=self.replacement_input.text(),
+            include=split_globs(self.include_input.text()),
+            exclude=split_globs(self.exclude_input.text()),
+            max_depth=self.depth_spin.value() or None,
+            include_hidden=self.hidden_check.isChecked(),
+            use_gitignore=self.gitignore_check.isChecked(),
+            walk_workers=default_walk_workers(),
+            steps=self.rule_steps,
         )
 
-        self.progress.setValue(10)
+        self.progress.setRange(0, 0)
         self.rename_btn.setEnabled(False)
-
-        task = PreviewTask(request, cancel_flag=lambda: token != self._preview_token)
-        task.signals.result.connect(self.on_preview_ready)
-        task.signals.error.connect(self.on_worker_error)
-        task.signals.finished.connect(lambda: self.progress.setValue(100))
+        self._streamed_token = 0
+        self._live = None
+        self._watch_token = 0
+
+        self._preview_request = request
+        self._ui_metrics = self._new_metrics()
+        self._preview_metrics = None
+        previous = self._preview_control
+        if previous is not None:
+            previous.cancel()  # wakes a paused preview so it can exit
+        control = self._preview_control = TaskControl()
+        if self._control is None or self._control is previous:
+            self._begin_task(control)
+        task = PreviewTask(
+            request,
+            cancel_flag=lambda: token != self._preview_token,
+            snapshot_cache=self.snapshot_cache,
+            refresh=refresh,
+            metrics=self._new_metrics(),
+            control=control,
+            tree_index=self.tree_index if self.index_check.isChecked() else None,
+            matches=None if refresh else self._match_set,
+        )
+        task.signals.metrics.connect(lambda metrics: self.on_preview_metrics(token, metrics))
+        task.signals.chunk.connect(lambda batch: self.on_preview_chunk(token, batch))
+        task.signals.progress.connect(lambda done, total: self.on_preview_progress(token, done, total))
+        task.signals.bytes.connect(lambda done, total: self.on_preview_bytes(token, done, total))
+        task.signals.result.connect(lambda result: self.on_preview_ready(token, result))
+        task.signals.error.connect(lambda message: self.on_preview_error(token, message))
+        task.signals.finished.connect(lambda: self.on_preview_finished(token, control))
         self.thread_pool.start(task)
 
-    def on_preview_ready(self, result) -> None:
-        entries, stats = result
-        self._preview_entries = entries
-        self.table.setRowCount(0)
-
-        ready = 0
-        for entry in entries:
-            row = self.table.rowCount()
-            self.table.insertRow(row)
-
-            type_item = QTableWidgetItem(entry.item_type)
-            old_item = QTableWidgetItem(entry.old_path)
-            new_item = QTableWidgetItem(entry.final_new_path)
-            new_item.setData(Qt.UserRole, entry.raw_new_path)
-            status_item = QTableWidgetItem(entry.status if not entry.message else f"{entry.status}: {entry.message}")
-
-            if entry.status == "ready":
-                color = QColor("#2d3a24")
-                ready += 1
-            elif entry.status == "conflict":
-                color = QColor("#3a2022")
+    def on_preview_chunk(self, token: int, batch: List[PreviewEntry]) -> None:
+        if token != self._preview_token:
+            return
+        with self._ui_metrics.stage("stream"):
+            if self._streamed_token != token:
+                # First rows of a new preview replace the previous table.
+                self._streamed_token = token
+                self.preview_model.set_entries(PreviewStore(batch))
+                self._preview_entries = self.preview_model.entries()
+                self._resize_columns()
             else:
-                color = QColor("#1f2533")
+                self.preview_model.append_entries(batch)
 
-            for item in [type_item, old_item, new_item, status_item]:
-                item.setBackground(color)
+    def on_preview_progress(self, token: int, done: int, total: int) -> None:
+        if token != self._preview_token:
+            return
+        if total:
+            self.progress.setRange(0, total)
+            self.progress.setValue(done)
+        else:
+            self.status_label.setText(f"Scanning... {done} items")
+
+    def on_preview_bytes(self, token: int, done: int, total: int) -> None:
+        # Hash tokens: progress follows bytes read, which dwarfs the walk.
+        if token != self._preview_token or not total:
+            return
+        self.progress.setRange(0, 1000)
+        self.progress.setValue(done * 1000 // total)
+        self.status_label.setText(f"Hashing... {_format_bytes(done)} of {_format_bytes(total)}")
 
-            self.table.setItem(row, 0, type_item)
-            self.table.setItem(row, 1, old_item)
-            self.table.setItem(row, 2, new_item)
-            self.table.setItem(row, 3, status_item)
+    def on_preview_finished(self, token: int, control: TaskControl) -> None:
+        self._end_task(control)
+        if token != self._preview_token:
+            return
+        if control.cancelled:
+            self.status_label.setText("Preview stopped")
+        self.progress.setRange(0, 100)
+        self.progress.setValue(100)
+
+    def on_preview_error(self, token: int, message: str) -> None:
+        if token != self._preview_token:
+            return
+        # Typically an invalid regex while typing: show it instead of a stale table.
+        self.preview_model.set_entries(PreviewStore())
+        self._preview_entries = self.preview_model.entries()
+        self.rename_btn.setEnabled(False)
+        self.status_label.setText(f"Preview failed: {message}")
+
+    def on_preview_ready(self, token: int, result) -> None:
+        if token != self._preview_token:
+            return
+        entries, stats, self._match_set = result
+        with self._ui_metrics.stage("populate"):
+            self.preview_model.set_entries(entries)
+            self._preview_entries = self.preview_model.entries()
+            self._resize_columns()
 
-        self.table.resizeColumnsToContents()
         self._update_status(stats)
-        self.rename_btn.setEnabled(ready > 0 and stats.conflicts == 0)
-        self.progress.setValue(100)
+        self.rename_btn.setEnabled(stats.ready > 0 and stats.conflicts == 0)
+        if self.live_check.isChecked():
+            self.start_watching(entries, stats)
+        if self._preview_metrics is not None:
+            self._preview_metrics.merge(self._ui_metrics)
+            self.show_metrics("Preview", self._preview_metrics)
+
+    def on_preview_metrics(self, token: int, metrics: Metrics) -> None:
+        if token == self._preview_token:
+            self._preview_metrics = metrics
+
+    def _new_metrics(self) -> Metrics:
+        return Metrics() if self.perf_group.isChecked() else NULL_METRICS
+
+    def show_metrics(self, title: str, metrics: Metrics) -> None:
+        self.perf_view.setPlainText("\n".join([title, *metrics.format_lines()]))
+
+    def toggle_index(self, enabled: bool) -> None:
+        if enabled and self.tree_index is None:
+            try:
+                self.tree_index = TreeIndex()
+            except (OSError, sqlite3.Error) as exc:
+                self.log(f"Error: cannot open the index: {exc}")
+                self.index_check.setChecked(False)
+                return
+        self.schedule_preview()
+
+    def toggle_live(self, enabled: bool) -> None:
+        if enabled:
+            self.refresh_preview()
+        else:
+            self.stop_watching()
+
+    def start_watching(self, entries: Sequence[PreviewEntry], stats: PreviewStats) -> None:
+        self.stop_watching()
+        request = self._preview_request
+        self._live = LivePreview(request, entries, stats)
+        token = self._watch_token
+
+        task = WatchTask(
+            request.directory,
+            request.recursive,
+            stop_flag=lambda: token != self._watch_token,
+            walk_filter=walk_filter_for(request),
+            live=self._live,
+        )
+        task.signals.chunk.connect(lambda batch: self.on_watch_events(token, batch))
+        task.signals.error.connect(self.on_worker_error)
+        self.thread_pool.start(task)
+
+    def stop_watching(self) -> None:
+        self._watch_token += 1
+        self._live = None
+
+    def on_watch_events(self, token: int, batch) -> None:
+        if token != self._watch_token or self._live is None:
+            return
+        events, measured = batch
+        if not self._live.apply(events, measured):
+            self.refresh_preview(refresh=True)
+            return
+        stats = self._live.stats()
+        self.preview_model.apply_changes(*self._live.take_changes())
+        self._update_status(stats)
+        # Files still being written get their names later; wait for them.
+        self.rename_btn.setEnabled(stats.ready > 0 and stats.conflicts == 0 and not self._live.pending)
+
+    def _resize_columns(self) -> None:
+        widths = sample_column_widths(self._preview_entries, self.table.fontMetrics())
+        header = self.table.horizontalHeader()
+        for column, width in enumerate(widths[:-1]):
+            header.resizeSection(column, width)
 
     def _update_status(self, stats: PreviewStats) -> None:
         self.status_label.setText(
             f"Items: {stats.items} | Ready: {stats.ready} | Conflicts: {stats.conflicts} | Invalid: {stats.invalid}"
         )
 
-    def _collect_ready_entries(self) -> List[PreviewEntry]:
-        return [entry for entry in self._preview_entries if entry.status == "ready"]
+    def _collect_ready_entries(self) -> PreviewStore:
+        return self.preview_model.entries().select("ready")
 
     def perform_rename(self) -> None:
         entries = self._collect_ready_entries()
         if not entries:
             return
 
+        self.stop_watching()
         self.rename_btn.setEnabled(False)
-        self.progress.setValue(10)
+        self.progress.setRange(0, 100)
+        self.progress.setValue(0)
 
-        task = RenameTask(entries)
-        task.signals.log.connect(self.log)
-        task.signals.result.connect(self.on_rename_done)
+        control = self._begin_task()
+        task = RenameTask(
+            entries,
+            self.journal,
+            metrics=self._new_metrics(),
+            log_file=self.log_file,
+            control=control,
+            workers=default_rename_workers(),
+        )
+        task.signals.log.connect(self.show_log)
+        task.signals.progress.connect(self.on_task_progress)
+        task.signals.metrics.connect(lambda metrics: self.show_metrics("Rename", metrics))
+        task.signals.result.connect(lambda operations: self.on_rename_done(operations, control))
         task.signals.error.connect(self.on_worker_error)
-        task.signals.finished.connect(lambda: self.progress.setValue(100))
+        task.signals.finished.connect(lambda: self._end_task(control))
+        task.signals.finished.connect(lambda: self.progress.setValue(self.progress.maximum()))
         self.thread_pool.start(task)
 
-    def on_rename_done(self, operations: List[RenameOperation]) -> None:
+    def on_rename_done(self, operations: List[RenameOperation], control: TaskControl) -> None:
         if operations:
             self.last_operations = operations
-            self.undo_btn.setEnabled(True)
-        self.refresh_preview()
-
-    def undo_last(self) -> None:
-        if not self.last_operations:
+        self._update_history_buttons()
+        self.refresh_preview(refresh=True)
+        if control.cancelled:
+            self.check_interrupted_runs()
+
+    def _update_history_buttons(self) -> None:
+        if self.journal is None:
+            self.undo_btn.setEnabled(bool(self.last_operations))
+            self.redo_btn.setEnabled(False)
             return
+        self.undo_btn.setEnabled(self.journal.undo_candidate() is not None)
+        self.redo_btn.setEnabled(self.journal.redo_candidate() is not None)
 
+    def _start_history_task(self, task) -> None:
+        self.stop_watching()
         self.undo_btn.setEnabled(False)
-        self.progress.setValue(10)
+        self.redo_btn.setEnabled(False)
+        self.progress.setRange(0, 100)
+        self.progress.setValue(0)
 
-        task = UndoTask(self.last_operations)
-        task.signals.log.connect(self.log)
+        control = task.control = self._begin_task()
+        task.signals.log.connect(self.show_log)
+        task.signals.progress.connect(self.on_task_progress)
         task.signals.error.connect(self.on_worker_error)
-        task.signals.finished.connect(self.on_undo_done)
+        task.signals.finished.connect(lambda: self.on_undo_done(control))
         self.thread_pool.start(task)
 
-    def on_undo_done(self) -> None:
-        self.last_operations = []
-        self.progress.setValue(100)
-        self.refresh_preview()
+    def undo_last(self) -> None:
+        if self.journal is not None:
+            self._start_history_task(JournalTask(self.journal, "undo", log_file=self.log_file))
+        elif self.last_operations:
+            self._start_history_task(UndoTask(self.last_operations, self.log_file, workers=default_rename_workers()))
+
+    def redo_last(self) -> None:
+        if self.journal is not None:
+            self._start_history_task(JournalTask(self.journal, "redo", log_file=self.log_file))
+
+    def on_undo_done(self, control: TaskControl) -> None:
+        self._end_task(control)
+        if not control.cancelled:
+            # A stopped in-memory undo keeps its list; undoing again skips what is done.
+            self.last_operations = []
+        self.progress.setValue(self.progress.maximum())
+        self._update_history_buttons()
+        self.refresh_preview(refresh=True)
+        if control.cancelled:
+            self.check_interrupted_runs()
+
+    def check_interrupted_runs(self) -> None:
+        if self.journal is None:
+            return
+        for record in self.journal.incomplete():
+            loaded = self.journal.load(record.run_id)
+            how = "stopped" if record.stopped else "interrupted"
+            box = QMessageBox(self)
+            box.setIcon(QMessageBox.Warning)
+            box.setWindowTitle(f"{how.capitalize()} rename")
+            box.setText(
+                f"A {loaded.kind} run ({record.run_id}) was {how} after "
+                f"{len(loaded.done_ops())} of {len(loaded.ops)} renames."
+            )
+            box.setInformativeText("Roll it back, or complete the remaining renames?")
+            rollback = box.addButton("Roll Back", QMessageBox.DestructiveRole)
+            replay = box.addButton("Resume" if record.stopped else "Complete", QMessageBox.AcceptRole)
+            box.addButton("Later", QMessageBox.RejectRole)
+            box.exec()
+            clicked = box.clickedButton()
+            # One recovery at a time; any others are offered again on next start.
+            if clicked is rollback:
+                self._start_history_task(JournalTask(self.journal, "rollback", record.run_id, self.log_file))
+                return
+            if clicked is replay:
+                self._start_history_task(JournalTask(self.journal, "replay", record.run_id, self.log_file))
+                return
 
     def on_worker_error(self, message: str) -> None:
         if message:
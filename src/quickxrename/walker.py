@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from operator import attrgetter
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from .filters import WalkFilter
+
+WALK_WORKERS = 16  # listings in flight; network shares gain the most
+PREFETCH = 4  # listings queued ahead of the walk, per worker
+
+# (mtime_ns, folders, other entries) of one listed folder
+Listing = Tuple[int, List[os.DirEntry], List[os.DirEntry]]
+
+_entry_name = attrgetter("name")
+
+
+def default_walk_workers() -> int:
+    """Threads of the parallel walker from QUICKXRENAME_WALK_WORKERS; 0 walks serially."""
+    try:
+        return max(0, int(os.environ.get("QUICKXRENAME_WALK_WORKERS", "0")))
+    except ValueError:
+        return 0
+
+
+def _list(path: str, stat_first: bool) -> Optional[Listing]:
+    # Runs on a worker thread. is_dir() comes from the listing itself (no
+    # stat) except on filesystems that leave the entry type unknown. Entries
+    # are sorted by name, as every walk of a tree is.
+    try:
+        mtime_ns = os.stat(path).st_mtime_ns if stat_first else 0
+        with os.scandir(path) as it:
+            entries = sorted(it, key=_entry_name)
+    except OSError:
+        return None
+    dirs = []
+    files = []
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        (dirs if is_dir else files).append(entry)
+    return mtime_ns, dirs, files
+
+
+def walk_parallel(
+    directory: str,
+    walk_filter: Optional[WalkFilter] = None,
+    cancel_check: Optional[Callable[[], bool]] = None,
+    workers: int = WALK_WORKERS,
+    stat_dirs: bool = False,
+) -> Iterator[Tuple[str, int, List[os.DirEntry], List[os.DirEntry]]]:
+    """
+    (folder, mtime_ns, shown folders, files) for every folder under
+    `directory`, top-down like os.walk and sorted by name like every walk
+    here (see renamer.iter_items), with listings read on `workers` threads.
+
+    The walk itself stays depth-first on the calling thread; the folders it
+    will visit next (up to workers * PREFETCH) are listed ahead of it, so
+    the order never depends on which listing finishes first. Symlinked
+    folders are reported but not descended into, and unreadable folders are
+    skipped. mtime_ns is only read (before the listing) with `stat_dirs`.
+    cancel_check runs once per folder; queued listings are dropped on exit.
+    """
+    window = max(1, workers) * PREFETCH
+    pool = ThreadPoolExecutor(max_workers=max(1, workers))
+    pending: Dict[str, Future] = {}
+    stack = [directory]
+    try:
+        while stack:
+            if cancel_check is not None and cancel_check():
+                return
+            for path in reversed(stack[-window:]):
+                if len(pending) >= window:
+                    break
+                if path not in pending:
+                    pending[path] = pool.submit(_list, path, stat_dirs)
+            root = stack.pop()
+            future = pending.pop(root, None)
+            listing = future.result() if future is not None else _list(root, stat_dirs)
+            if listing is None:
+                continue
+            mtime_ns, dirs, files = listing
+            shown = dirs
+            if walk_filter is not None:
+                dirs, shown, files = walk_filter.filter_names(root, dirs, files, _entry_name)
+            yield root, mtime_ns, shown, files
+            stack.extend(entry.path for entry in reversed(dirs) if not entry.is_symlink())
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
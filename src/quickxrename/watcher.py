@@ -0,0 +1,317 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import os
+import select
+import stat as stat_module
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .filters import WalkFilter
+from .models import WatchEvent
+
+_IN_MODIFY = 0x00000002
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_DELETE_SELF = 0x00000400
+_IN_MOVE_SELF = 0x00000800
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    _IN_CREATE | _IN_DELETE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR
+)
+_CONTENTS_MASK = _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+def _load_libc():
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    return libc
+
+
+def _is_under(path: str, folder: str) -> bool:
+    return path == folder or path.startswith(folder + os.sep)
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    # (size, mtime) of a regular file, None for anything else.
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime_ns) if stat_module.S_ISREG(st.st_mode) else None
+
+
+class InotifyWatcher:
+    """Linux watcher: one inotify watch per directory under the root."""
+
+    def __init__(
+        self,
+        directory: str,
+        recursive: bool,
+        libc,
+        walk_filter: Optional[WalkFilter] = None,
+        contents: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.recursive = recursive
+        self.walk_filter = walk_filter
+        self.contents = contents
+        self._mask = _WATCH_MASK | (_CONTENTS_MASK if contents else 0)
+        self._libc = libc
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths: Dict[int, str] = {}
+        try:
+            self._add_watch(directory, strict=True)
+            if recursive:
+                for root, dirs, _files in os.walk(directory):
+                    if walk_filter is not None:
+                        dirs[:] = walk_filter.filter_names(root, dirs, [])[0]
+                    for d in dirs:
+                        self._add_watch(os.path.join(root, d), strict=True)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, path: str, strict: bool = False) -> None:
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            # Running out of watches (ENOSPC) at startup means polling is the better choice.
+            if strict:
+                raise OSError(errno, f"inotify_add_watch failed for {path}")
+            return
+        self._paths[wd] = path
+
+    def _forget(self, folder: str) -> None:
+        for wd in [wd for wd, path in self._paths.items() if _is_under(path, folder)]:
+            self._libc.inotify_rm_watch(self._fd, wd)
+            del self._paths[wd]
+
+    def _watch_tree(self, folder: str, events: List[WatchEvent]) -> None:
+        # Entries created before the new watch existed never produce events,
+        # so report whatever is already inside the folder.
+        self._add_watch(folder)
+        for root, dirs, files in os.walk(folder):
+            if self.walk_filter is not None:
+                dirs[:] = self.walk_filter.filter_names(root, dirs, [])[0]
+            for d in dirs:
+                path = os.path.join(root, d)
+                self._add_watch(path)
+                events.append(WatchEvent("created", path, True))
+            for f in files:
+                events.append(WatchEvent("created", os.path.join(root, f), False))
+
+    def read_events(self, timeout: float) -> List[WatchEvent]:
+        if self._fd < 0:
+            return []
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events: List[WatchEvent] = []
+        modified = set()  # a write comes in many IN_MODIFY events; one is enough
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            raw_name = data[offset + _EVENT_HEADER.size:offset + _EVENT_HEADER.size + length]
+            offset += _EVENT_HEADER.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                events.append(WatchEvent("rescan", self.directory, True))
+                continue
+            parent = self._paths.get(wd)
+            if parent is None:
+                continue
+            if mask & _IN_IGNORED:
+                del self._paths[wd]
+                continue
+            if mask & (_IN_DELETE_SELF | _IN_MOVE_SELF):
+                if parent == self.directory:
+                    events.append(WatchEvent("rescan", self.directory, True))
+                continue
+
+            is_dir = bool(mask & _IN_ISDIR)
+            path = os.path.join(parent, os.fsdecode(raw_name.rstrip(b"\0")))
+            if mask & (_IN_CREATE | _IN_MOVED_TO):
+                # A regular file that was just created is usually still being
+                # written; with `contents` its IN_CLOSE_WRITE follows.
+                settled = not (self.contents and mask & _IN_CREATE) or is_dir or _file_signature(path) is None
+                events.append(WatchEvent("created", path, is_dir, settled))
+                if is_dir and self.recursive and (self.walk_filter is None or self.walk_filter.enters(path)):
+                    self._watch_tree(path, events)
+            elif mask & (_IN_DELETE | _IN_MOVED_FROM):
+                events.append(WatchEvent("deleted", path, is_dir))
+                if is_dir:
+                    self._forget(path)
+            elif mask & (_IN_CLOSE_WRITE | _IN_ATTRIB):
+                # Also a touch or chmod: the metadata changed without a write.
+                events.append(WatchEvent("written", path, is_dir))
+                modified.discard(path)
+            elif mask & _IN_MODIFY and path not in modified:
+                modified.add(path)
+                events.append(WatchEvent("modified", path, False))
+        return events
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+            self._paths.clear()
+
+
+class PollingWatcher:
+    """
+    Portable fallback: re-lists only directories whose mtime changed.
+
+    With `contents`, a file that appears is reported as written once its
+    size and mtime stop changing from one poll to the next; writes to files
+    that were already there are not seen.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        recursive: bool,
+        interval: float = 1.0,
+        walk_filter: Optional[WalkFilter] = None,
+        contents: bool = False,
+    ) -> None:
+        self.directory = directory
+        self.recursive = recursive
+        self.walk_filter = walk_filter
+        self.interval = interval
+        self.contents = contents
+        self._listings: Dict[str, Tuple[int, Dict[str, bool]]] = {}
+        self._settling: Dict[str, Tuple[int, int]] = {}  # new file -> its (size, mtime) at the last poll
+        self._next_poll = time.monotonic() + interval
+        self._scan(directory, None)
+
+    def _list(self, folder: str) -> Optional[Tuple[int, Dict[str, bool]]]:
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+            with os.scandir(folder) as it:
+                names = {entry.name: entry.is_dir(follow_symlinks=False) for entry in it}
+        except OSError:
+            return None
+        return mtime_ns, names
+
+    def _scan(self, folder: str, events: Optional[List[WatchEvent]]) -> None:
+        stack = [folder]
+        while stack:
+            current = stack.pop()
+            listing = self._list(current)
+            if listing is None:
+                continue
+            self._listings[current] = listing
+            for name, is_dir in listing[1].items():
+                path = os.path.join(current, name)
+                if events is not None:
+                    self._created(path, is_dir, events)
+                if is_dir and self.recursive and (self.walk_filter is None or self.walk_filter.enters(path)):
+                    stack.append(path)
+
+    def _created(self, path: str, is_dir: bool, events: List[WatchEvent]) -> None:
+        signature = None if is_dir or not self.contents else _file_signature(path)
+        if signature is not None:
+            self._settling[path] = signature
+        events.append(WatchEvent("created", path, is_dir, signature is None))
+
+    def _settle(self, events: List[WatchEvent]) -> None:
+        for path, signature in list(self._settling.items()):
+            current = _file_signature(path)
+            if current is None or current == signature:
+                del self._settling[path]
+                if current is not None:
+                    events.append(WatchEvent("written", path, False))
+            else:
+                self._settling[path] = current
+
+    def _forget(self, folder: str) -> None:
+        for path in [p for p in self._listings if _is_under(p, folder)]:
+            del self._listings[path]
+
+    def read_events(self, timeout: float) -> List[WatchEvent]:
+        remaining = self._next_poll - time.monotonic()
+        if remaining > 0:
+            time.sleep(min(timeout, remaining))
+            if time.monotonic() < self._next_poll:
+                return []
+        self._next_poll = time.monotonic() + self.interval
+
+        events: List[WatchEvent] = []
+        self._settle(events)
+        for folder in list(self._listings):
+            previous = self._listings.get(folder)
+            if previous is None:
+                continue
+            try:
+                mtime_ns = os.stat(folder).st_mtime_ns
+            except OSError:
+                if folder == self.directory:
+                    events.append(WatchEvent("rescan", folder, True))
+                continue
+            if mtime_ns == previous[0]:
+                continue
+            listing = self._list(folder)
+            if listing is None:
+                continue
+            self._listings[folder] = listing
+            old_names, new_names = previous[1], listing[1]
+            for name, is_dir in old_names.items():
+                if new_names.get(name) != is_dir:
+                    path = os.path.join(folder, name)
+                    events.append(WatchEvent("deleted", path, is_dir))
+                    if is_dir:
+                        self._forget(path)
+            for name, is_dir in new_names.items():
+                if old_names.get(name) != is_dir:
+                    path = os.path.join(folder, name)
+                    self._created(path, is_dir, events)
+                    if is_dir and self.recursive and (self.walk_filter is None or self.walk_filter.enters(path)):
+                        self._scan(path, events)
+        return events
+
+    def close(self) -> None:
+        self._listings.clear()
+
+
+def create_watcher(
+    directory: str, recursive: bool, walk_filter: Optional[WalkFilter] = None, contents: bool = False
+):
+    # Folders the filter prunes are not watched; events for filtered-out
+    # items inside watched folders are still reported. With `contents`, a
+    # new file is "created" unsettled and reported "written" once its writer
+    # is done, and a file being rewritten is reported "modified" first (not
+    # by the polling fallback), for previews whose names depend on a file's
+    # contents or metadata.
+    libc = _load_libc()
+    if libc is not None:
+        try:
+            return InotifyWatcher(directory, recursive, libc, walk_filter, contents)
+        except OSError:
+            pass
+    return PollingWatcher(directory, recursive, walk_filter=walk_filter, contents=contents)
@@ -1,70 +1,374 @@
 from __future__ import annotations
 
-from typing import Callable
+import dataclasses
+import time
+from array import array
+from typing import Callable, List, Optional, Tuple
 
 from PySide6.QtCore import QObject, QRunnable, Signal
 
+from .control import TaskControl
+from .filters import WalkFilter
+from .incremental import MatchSet
+from .index import TreeIndex
+from .journal import RenameJournal
+from .live_preview import LivePreview
+from .logfile import LogFile
+from .metrics import NULL_METRICS, Metrics
 from .models import PreviewEntry, PreviewRequest, PreviewStats, RenameOperation
-from .renamer import apply_renames, build_preview
+from .renamer import apply_renames, build_preview, walk_filter_for
+from .snapshot import DirectorySnapshot, SnapshotCache
+from .watcher import create_watcher
+
+LOG_FLUSH_INTERVAL = 0.05  # seconds between log/progress signals from one task
+LOG_BATCH_LINES = 2000  # lines that force a flush before the interval is up
 
 
 class WorkerSignals(QObject):
     progress = Signal(int, int)
+    chunk = Signal(object)
     result = Signal(object)
     log = Signal(str)
     error = Signal(str)
+    metrics = Signal(object)  # Metrics of the run, before result; only when instrumented
+    bytes = Signal(object, object)  # (done, total) bytes hashed; may exceed a C int
     finished = Signal()
 
 
+class BatchedLog:
+    """
+    Coalesces a task's per-item log lines and progress.
+
+    log() and progress() are called for every rename but only buffer; at
+    most once per LOG_FLUSH_INTERVAL the lines go out as one multi-line
+    `log` signal (and to the log file, from the worker thread) and the
+    latest count as one `progress` signal. Call flush() when the task ends.
+    """
+
+    def __init__(
+        self,
+        signals: WorkerSignals,
+        log_file: Optional[LogFile] = None,
+        interval: float = LOG_FLUSH_INTERVAL,
+    ) -> None:
+        self.signals = signals
+        self.log_file = log_file
+        self.interval = interval
+        self._lines: List[str] = []
+        self._progress: Optional[Tuple[int, int]] = None
+        self._next_flush = time.monotonic() + interval
+
+    def log(self, message: str) -> None:
+        self._lines.append(message)
+        if len(self._lines) >= LOG_BATCH_LINES or time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def progress(self, done: int, total: int) -> None:
+        self._progress = (done, total)
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        lines, self._lines = self._lines, []
+        if lines:
+            if self.log_file is not None:
+                self.log_file.write_lines(lines)
+            self.signals.log.emit("\n".join(lines))
+        if self._progress is not None:
+            self.signals.progress.emit(*self._progress)
+            self._progress = None
+        self._next_flush = time.monotonic() + self.interval
+
+
 class PreviewTask(QRunnable):
-    def __init__(self, request: PreviewRequest, cancel_flag: Callable[[], bool]):
+    def __init__(
+        self,
+        request: PreviewRequest,
+        cancel_flag: Callable[[], bool],
+        snapshot_cache: Optional[SnapshotCache] = None,
+        refresh: bool = False,
+        metrics: Metrics = NULL_METRICS,
+        control: Optional[TaskControl] = None,
+        tree_index: Optional[TreeIndex] = None,
+        matches: Optional[MatchSet] = None,
+    ):
         super().__init__()
         self.request = request
         self.cancel_flag = cancel_flag
+        self.snapshot_cache = snapshot_cache
+        self.refresh = refresh
+        self.metrics = metrics
+        self.control = control
+        self.tree_index = tree_index
+        # The previous preview's matches; a refined pattern only re-evaluates those.
+        self.matches = matches
         self.signals = WorkerSignals()
 
     def run(self) -> None:
         def cancel_check() -> bool:
-            return self.cancel_flag()
+            return self.cancel_flag() or (self.control is not None and self.control.check())
 
         try:
-            entries, stats = build_preview(self.request, cancel_check)
-            self.signals.result.emit((entries, stats))
+            request = self.request
+            items = None
+            snapshots: List[DirectorySnapshot] = []
+            reused: Optional[MatchSet] = None
+            # The on-disk index, when enabled, replaces the in-memory snapshots.
+            if self.tree_index is not None:
+                items = self.tree_index.preview_items(
+                    request, walk_filter_for(request), force=self.refresh, cancel_check=cancel_check
+                )
+            elif self.snapshot_cache is not None:
+                walk_filter = walk_filter_for(request)
+                previous = self.matches
+                if (
+                    previous is not None
+                    and not self.refresh
+                    and previous.serves(request)
+                    and self.snapshot_cache.current(
+                        request.directory, request.recursive, request.include_files, request.include_folders, walk_filter
+                    ) is previous.snapshot
+                ):
+                    reused = previous
+                    items = previous.snapshot.items(previous.rows)
+                    self.metrics.count("rows_reevaluated", len(previous.rows))
+                else:
+                    with self.metrics.stage("snapshot"):
+                        items = self.snapshot_cache.items(
+                            request.directory,
+                            request.recursive,
+                            request.include_files,
+                            request.include_folders,
+                            refresh=self.refresh,
+                            walk_filter=walk_filter,
+                            cancel_check=cancel_check,
+                            workers=request.walk_workers,
+                            on_snapshot=snapshots.append,
+                        )
+            matched = array("I")
+            entries, stats = build_preview(
+                request,
+                cancel_check,
+                on_batch=lambda batch, _scanned: self.signals.chunk.emit(batch),
+                on_progress=self.signals.progress.emit,
+                items=items,
+                metrics=self.metrics,
+                # A subset of the tree must not seed folder listings for the conflict check.
+                prefiltered=self.tree_index is not None or reused is not None,
+                on_bytes=self.signals.bytes.emit,
+                matched=matched,
+            )
+            if self.tree_index is not None:
+                self.metrics.count("dirs_listed", self.tree_index.last_refresh.listed)
+                self.metrics.count("dirs_reused", self.tree_index.last_refresh.reused)
+            if cancel_check():
+                return
+            matches = None
+            if reused is not None:
+                stats = dataclasses.replace(stats, items=len(reused.snapshot))
+                rows = reused.rows
+                matches = MatchSet(request, reused.snapshot, array("I", (rows[position] for position in matched)))
+            elif snapshots:
+                matches = MatchSet(request, snapshots[0], matched)
+            if self.metrics.enabled:
+                self.signals.metrics.emit(self.metrics)
+            self.signals.result.emit((entries, stats, matches))
         except Exception as exc:  # noqa: BLE001
             self.signals.error.emit(str(exc))
         finally:
             self.signals.finished.emit()
 
 
+def _cancel_check(control: Optional[TaskControl]) -> Optional[Callable[[], bool]]:
+    return control.check if control is not None else None
+
+
 class RenameTask(QRunnable):
-    def __init__(self, entries: list[PreviewEntry]):
+    """Applies the entries; a stopped journalled run stays open as a resumable checkpoint."""
+
+    def __init__(
+        self,
+        entries: list[PreviewEntry],
+        journal: Optional[RenameJournal] = None,
+        metrics: Metrics = NULL_METRICS,
+        log_file: Optional[LogFile] = None,
+        control: Optional[TaskControl] = None,
+        workers: int = 0,
+    ):
         super().__init__()
         self.entries = entries
+        self.journal = journal
+        self.metrics = metrics
+        self.log_file = log_file
+        self.control = control
+        self.workers = workers
         self.signals = WorkerSignals()
 
     def run(self) -> None:
+        out = BatchedLog(self.signals, self.log_file)
+        cancel_check = _cancel_check(self.control)
         try:
-            operations = apply_renames(self.entries, self.signals.log.emit)
+            if self.journal is None:
+                operations = apply_renames(
+                    self.entries,
+                    out.log,
+                    workers=self.workers,
+                    metrics=self.metrics,
+                    on_progress=out.progress,
+                    cancel_check=cancel_check,
+                )
+            else:
+                run = self.journal.begin("rename")
+                operations = apply_renames(
+                    self.entries,
+                    out.log,
+                    journal=run,
+                    workers=self.workers,
+                    metrics=self.metrics,
+                    on_progress=out.progress,
+                    cancel_check=cancel_check,
+                )
+                # Left open on an unexpected error so the run shows up as interrupted.
+                run.close()
+            out.flush()
+            if self.metrics.enabled:
+                self.signals.metrics.emit(self.metrics)
             self.signals.result.emit(operations)
         except Exception as exc:  # noqa: BLE001
+            out.flush()
             self.signals.error.emit(str(exc))
         finally:
             self.signals.finished.emit()
 
 
 class UndoTask(QRunnable):
-    def __init__(self, operations: list[RenameOperation]):
+    def __init__(
+        self,
+        operations: list[RenameOperation],
+        log_file: Optional[LogFile] = None,
+        control: Optional[TaskControl] = None,
+        workers: int = 0,
+    ):
         super().__init__()
         self.operations = operations
+        self.log_file = log_file
+        self.control = control
+        self.workers = workers
         self.signals = WorkerSignals()
 
     def run(self) -> None:
         from .renamer import undo_renames
 
+        out = BatchedLog(self.signals, self.log_file)
+        try:
+            undo_renames(
+                self.operations,
+                out.log,
+                self.workers,
+                on_progress=out.progress,
+                cancel_check=_cancel_check(self.control),
+            )
+            out.flush()
+            self.signals.result.emit(True)
+        except Exception as exc:  # noqa: BLE001
+            out.flush()
+            self.signals.error.emit(str(exc))
+        finally:
+            self.signals.finished.emit()
+
+
+class JournalTask(QRunnable):
+    """Runs a journal action: "undo", "redo", "rollback" or "replay" (the last two need run_id)."""
+
+    def __init__(
+        self,
+        journal: RenameJournal,
+        action: str,
+        run_id: Optional[str] = None,
+        log_file: Optional[LogFile] = None,
+        control: Optional[TaskControl] = None,
+    ):
+        super().__init__()
+        self.journal = journal
+        self.action = action
+        self.run_id = run_id
+        self.log_file = log_file
+        self.control = control
+        self.signals = WorkerSignals()
+
+    def run(self) -> None:
+        out = BatchedLog(self.signals, self.log_file)
+        cancel_check = _cancel_check(self.control)
         try:
-            undo_renames(self.operations, self.signals.log.emit)
+            if self.action == "undo":
+                self.journal.undo(out.log, out.progress, cancel_check)
+            elif self.action == "redo":
+                self.journal.redo(out.log, out.progress, cancel_check)
+            else:
+                self.journal.recover(self.run_id, self.action == "rollback", out.log, out.progress, cancel_check)
+            out.flush()
             self.signals.result.emit(True)
+        except Exception as exc:  # noqa: BLE001
+            out.flush()
+            self.signals.error.emit(str(exc))
+        finally:
+            self.signals.finished.emit()
+
+
+class WatchTask(QRunnable):
+    """
+    Emits (events, measured) batches from a filesystem watcher.
+
+    `live` is the LivePreview the events are for: its measure() runs here,
+    so stats and content hashes for tokens are taken off the GUI thread,
+    with one Hasher kept for the whole watch.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        recursive: bool,
+        stop_flag: Callable[[], bool],
+        interval: float = 0.25,
+        walk_filter: Optional[WalkFilter] = None,
+        live: Optional[LivePreview] = None,
+    ):
+        super().__init__()
+        self.directory = directory
+        self.recursive = recursive
+        self.walk_filter = walk_filter
+        self.stop_flag = stop_flag
+        self.interval = interval
+        self.live = live
+        self.signals = WorkerSignals()
+
+    def run(self) -> None:
+        watcher = None
+        hasher = None
+        live = self.live
+        try:
+            contents = live is not None and live.follows_writes
+            watcher = create_watcher(self.directory, self.recursive, self.walk_filter, contents)
+            if live is not None and live.template.hashes:
+                from .hashing import Hasher, default_hash_cache
+
+                hasher = Hasher(live.template.hashes, default_hash_cache(), cancel_check=self.stop_flag)
+            # Events are coalesced so the UI sees at most one batch per interval.
+            pending = []
+            deadline = time.monotonic() + self.interval
+            while not self.stop_flag():
+                pending.extend(watcher.read_events(max(0.0, deadline - time.monotonic())))
+                if time.monotonic() >= deadline:
+                    if pending and not self.stop_flag():
+                        measured = live.measure(pending, hasher) if live is not None else {}
+                        self.signals.chunk.emit((pending, measured))
+                    pending = []
+                    deadline = time.monotonic() + self.interval
         except Exception as exc:  # noqa: BLE001
             self.signals.error.emit(str(exc))
         finally:
+            if hasher is not None:
+                hasher.close()
+            if watcher is not None:
+                watcher.close()
             self.signals.finished.emit()
@@ -0,0 +1,78 @@
+import fnmatch
+import itertools
+from array import array
+
+import pytest
+
+from quickxrename.incremental import MatchSet, narrows
+from quickxrename.models import PreviewRequest
+
+
+@pytest.mark.parametrize(
+    "mode, old, new, expected",
+    [
+        ("Replace", "IMG", "IMG_2024", True),
+        ("Replace", "IMG", "_IMG", True),
+        ("Replace", "IMG", "IM", False),
+        ("Replace", "", "IMG", False),
+        ("Wildcard", "IMG*", "IMG_*", True),
+        ("Wildcard", "*.jpg", "IMG*.jpg", True),
+        ("Wildcard", "*.jp", "*.jpg", False),
+        ("Wildcard", "IMG*", "IMG*?", False),
+        ("Wildcard", "IMG*", "IMG[0-9]*", False),
+        ("Wildcard", "[*]", "[*x]", False),
+        ("Wildcard", "[!*]*", "[!*]x*", True),
+        ("Wildcard", "a*", "a*", True),
+        ("Regex", "IMG", "IMG_", False),
+        ("Regex", "IMG", "IMG", True),
+    ],
+)
+def test_narrows(mode, old, new, expected):
+    assert narrows(mode, old, new) is expected
+
+
+def test_wildcard_narrows_never_admits_a_new_name():
+    names = ["".join(chars) for size in range(4) for chars in itertools.product("ab*]", repeat=size)]
+    patterns = ["*", "a*", "*a", "a*b", "[*]*", "[]a]*", "[!a]*", "[a*"]
+    for old in patterns:
+        for extra in ("a", "b", "ab"):
+            for split in range(len(old) + 1):
+                new = old[:split] + extra + old[split:]
+                if not narrows("Wildcard", old, new):
+                    continue
+                for name in names:
+                    if fnmatch.fnmatchcase(name, new):
+                        assert fnmatch.fnmatchcase(name, old), (old, new, name)
+
+
+def _request(**changes):
+    fields = dict(directory="/tmp", recursive=True, include_files=True, include_folders=False)
+    fields.update(mode="Replace", pattern="IMG", replacement="photo")
+    fields.update(changes)
+    return PreviewRequest(**fields)
+
+
+def _matches(request):
+    return MatchSet(request, None, array("I"))
+
+
+def test_serves_a_refined_pattern_or_a_new_replacement():
+    matches = _matches(_request())
+    assert matches.serves(_request(pattern="IMG_"))
+    assert matches.serves(_request(replacement="pic"))
+    assert matches.serves(_request(pattern="IMG_", replacement="pic"))
+    assert not matches.serves(_request(pattern="IM"))
+
+
+def test_serves_only_when_nothing_else_changed():
+    matches = _matches(_request())
+    assert not matches.serves(_request(pattern="IMG_", recursive=False))
+    assert not matches.serves(_request(pattern="IMG_", exclude=("*.tmp",)))
+    assert not matches.serves(_request(mode="Regex"))
+
+
+def test_serves_not_when_the_old_rule_could_leave_matches_unlisted():
+    # Matches that kept their name weren't shown, so they weren't remembered.
+    assert not _matches(_request(replacement="IMG")).serves(_request(pattern="IMG_"))
+    # Token results depend on more than the match, e.g. the numbering.
+    assert not _matches(_request(replacement="{n}")).serves(_request(pattern="IMG_", replacement="{n}"))
@@ -0,0 +1,142 @@
+import os
+
+import pytest
+
+from quickxrename.journal import IncompleteRun, RenameJournal, execute_journaled
+
+
+def _write(path, text):
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(text)
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as handle:
+        return handle.read()
+
+
+def _contents(folder):
+    return {name: _read(os.path.join(folder, name)) for name in sorted(os.listdir(folder))}
+
+
+def _crash(journal, ops, ran):
+    # The intents are on disk and the first `ran` renames happened, but no
+    # completion record or end event was written.
+    run = journal.begin("rename")
+    run.intend(ops)
+    for source, target, _final in ops[:ran]:
+        os.rename(source, target)
+    run._handle.close()
+    return run.run_id
+
+
+def _apply(journal, ops):
+    run = journal.begin("rename")
+    execute_journaled(run, ops, [].append, "Rename")
+    run.close()
+    return run.run_id
+
+
+@pytest.fixture
+def tree(tmp_path):
+    folder = tmp_path / "files"
+    folder.mkdir()
+    return str(folder)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return RenameJournal(str(tmp_path / "journal"))
+
+
+def _chain(folder):
+    # b -> c, then a -> b: the planner's order for a chain.
+    _write(os.path.join(folder, "a"), "A")
+    _write(os.path.join(folder, "b"), "B")
+    p = lambda name: os.path.join(folder, name)  # noqa: E731
+    return [(p("b"), p("c"), p("c")), (p("a"), p("b"), p("b"))], {"b": "A", "c": "B"}
+
+
+def _swap(folder):
+    # a and b trade names through a temporary one.
+    _write(os.path.join(folder, "a"), "A")
+    _write(os.path.join(folder, "b"), "B")
+    p = lambda name: os.path.join(folder, name)  # noqa: E731
+    return [(p("a"), p("tmp"), p("b")), (p("b"), p("a"), p("a")), (p("tmp"), p("b"), p("b"))], {"a": "B", "b": "A"}
+
+
+@pytest.mark.parametrize("make", [_chain, _swap])
+def test_replay_settles_whatever_ran_before_the_crash(journal, tree, make):
+    ops, expected = make(tree)
+    for ran in range(len(ops) + 1):
+        original = _contents(tree)
+        run_id = _crash(journal, ops, ran)
+        log = []
+        journal.recover(run_id, rollback=False, log_fn=log.append)
+        assert _contents(tree) == expected, ran
+        assert not [line for line in log if "skipped" in line or "failed" in line]
+        record = journal.load(run_id)
+        assert record.complete and record.status == ["done"] * len(ops)
+        # Put the tree back for the next crash point.
+        journal.recover(run_id, rollback=True, log_fn=[].append)
+        assert _contents(tree) == original
+
+
+@pytest.mark.parametrize("make", [_chain, _swap])
+def test_rollback_restores_the_tree_from_any_crash_point(journal, tree, make):
+    ops, _expected = make(tree)
+    original = _contents(tree)
+    for ran in range(len(ops) + 1):
+        run_id = _crash(journal, ops, ran)
+        journal.recover(run_id, rollback=True, log_fn=[].append)
+        assert _contents(tree) == original, ran
+
+
+def test_undo_and_redo_move_the_run_between_states(journal, tree):
+    ops, expected = _chain(tree)
+    original = _contents(tree)
+    run_id = _apply(journal, ops)
+    assert journal.undo_candidate().run_id == run_id
+    assert journal.redo_candidate() is None
+
+    journal.undo([].append)
+    assert journal.runs()[run_id].state == "undone"
+    assert _contents(tree) == original
+    assert journal.undo_candidate() is None
+    assert journal.redo_candidate().run_id == run_id
+
+    journal.redo([].append)
+    assert journal.runs()[run_id].state == "applied"
+    assert _contents(tree) == expected
+    assert journal.redo_candidate() is None
+
+
+def test_a_new_rename_clears_redo(journal, tree):
+    ops, _expected = _chain(tree)
+    _apply(journal, ops)
+    journal.undo([].append)
+    _write(os.path.join(tree, "d"), "D")
+    _apply(journal, [(os.path.join(tree, "d"), os.path.join(tree, "e"), os.path.join(tree, "e"))])
+    assert journal.redo_candidate() is None
+
+
+def test_partial_undo_keeps_the_run_applied_and_a_retry_finishes_it(journal, tree):
+    p = lambda name: os.path.join(tree, name)  # noqa: E731
+    _write(p("x"), "X")
+    _write(p("y"), "Y")
+    run_id = _apply(journal, [(p("x"), p("x2"), p("x2")), (p("y"), p("y2"), p("y2"))])
+    os.rename(p("x2"), p("moved"))
+
+    with pytest.raises(IncompleteRun):
+        journal.undo([].append)
+    assert journal.runs()[run_id].state == "applied"
+    assert journal.redo_candidate() is None
+    assert _contents(tree) == {"moved": "X", "y": "Y"}
+
+    # The retry only does the rename that didn't happen.
+    os.rename(p("moved"), p("x2"))
+    log = []
+    journal.undo(log.append)
+    assert log == [f"Undo: {p('x2')} -> {p('x')}"]
+    assert journal.runs()[run_id].state == "undone"
+    assert _contents(tree) == {"x": "X", "y": "Y"}
@@ -0,0 +1,88 @@
+import os
+
+import pytest
+
+from quickxrename.planner import BlockedRename, RenamePlan, RenameStep, execute_plan
+
+
+def _step(folder, source, target):
+    return RenameStep(os.path.join(folder, source), os.path.join(folder, target), os.path.join(folder, target))
+
+
+def _names(chain, folder):
+    return [(os.path.relpath(s.source, folder), os.path.relpath(s.target, folder)) for s in chain]
+
+
+def _files(folder, **contents):
+    for name, text in contents.items():
+        with open(os.path.join(folder, name), "w", encoding="utf-8") as handle:
+            handle.write(text)
+
+
+def _contents(folder):
+    result = {}
+    for name in sorted(os.listdir(folder)):
+        with open(os.path.join(folder, name), encoding="utf-8") as handle:
+            result[name] = handle.read()
+    return result
+
+
+def test_chain_runs_the_step_that_frees_a_target_first(tmp_path):
+    folder = str(tmp_path)
+    plan = RenamePlan([_step(folder, "a", "b"), _step(folder, "b", "c"), _step(folder, "c", "d")], False)
+    assert plan.cycles == 0
+    assert [_names(chain, folder) for chain in plan.levels[0]] == [[("c", "d"), ("b", "c"), ("a", "b")]]
+
+
+def test_independent_renames_are_separate_chains(tmp_path):
+    folder = str(tmp_path)
+    plan = RenamePlan([_step(folder, "a", "x"), _step(folder, "b", "y")], False)
+    assert [_names(chain, folder) for chain in plan.levels[0]] == [[("a", "x")], [("b", "y")]]
+
+
+def test_cycle_is_broken_through_a_temporary_name(tmp_path):
+    folder = str(tmp_path)
+    plan = RenamePlan([_step(folder, "a", "b"), _step(folder, "b", "c"), _step(folder, "c", "a")], False)
+    assert plan.cycles == 1
+    (chain,) = plan.levels[0]
+    aside = chain[0].target
+    assert chain[0].temporary and chain[0].source == os.path.join(folder, "a")
+    assert os.path.basename(aside).startswith(".quickxrename-")
+    assert _names(chain[1:-1], folder) == [("c", "a"), ("b", "c")]
+    assert (chain[-1].source, chain[-1].target) == (aside, os.path.join(folder, "b"))
+    assert len(plan) == 4
+
+
+def test_deeper_sources_are_renamed_first(tmp_path):
+    folder = str(tmp_path)
+    inner = _step(folder, os.path.join("d", "x"), os.path.join("d", "y"))
+    plan = RenamePlan([_step(folder, "d", "e"), inner], False)
+    assert [step.source for step in plan.steps()] == [inner.source, os.path.join(folder, "d")]
+
+
+@pytest.mark.parametrize("workers", [0, 4])
+def test_execute_plan_swaps_and_shifts(tmp_path, workers):
+    folder = str(tmp_path)
+    _files(folder, a="A", b="B", c="C", d="D")
+    steps = [_step(folder, "a", "b"), _step(folder, "b", "a"), _step(folder, "c", "d"), _step(folder, "d", "e")]
+    results = list(execute_plan(RenamePlan(steps, False), workers=workers))
+    assert [error for _step_, error in results] == [None] * 5
+    assert _contents(folder) == {"a": "B", "b": "A", "d": "C", "e": "D"}
+
+
+def test_failed_step_blocks_the_rest_of_its_chain(tmp_path):
+    folder = str(tmp_path)
+    _files(folder, a="A", x="X")
+    steps = [_step(folder, "a", "b"), _step(folder, "b", "c"), _step(folder, "x", "y")]
+    errors = {os.path.basename(step.source): error for step, error in execute_plan(RenamePlan(steps, False))}
+    assert isinstance(errors["b"], FileNotFoundError)
+    assert isinstance(errors["a"], BlockedRename)
+    assert errors["x"] is None
+    assert _contents(folder) == {"a": "A", "y": "X"}
+
+
+def test_cancelled_plan_runs_nothing(tmp_path):
+    folder = str(tmp_path)
+    _files(folder, a="A")
+    assert list(execute_plan(RenamePlan([_step(folder, "a", "b")], False), cancel_check=lambda: True)) == []
+    assert _contents(folder) == {"a": "A"}
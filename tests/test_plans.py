@@ -0,0 +1,100 @@
+import io
+import json
+import os
+
+import pytest
+
+from quickxrename.plans import iter_plan, load_plan
+
+
+def _jsonl(*rows):
+    return io.StringIO("".join(json.dumps(row) + "\n" for row in rows))
+
+
+def _load(stream, fmt="jsonl"):
+    entries, stats = load_plan(stream, fmt, lambda: False, case_insensitive=False)
+    return {os.path.basename(entry.old_path): entry for entry in entries}, stats
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    (tmp_path / "a").mkdir()
+    for name in ("x", "y", "z"):
+        (tmp_path / "a" / name).write_text(name)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_relative_paths_are_made_absolute_and_unchanged_rows_left_out(tree):
+    entries, stats = _load(_jsonl(
+        {"old_path": "a/x", "new_path": "./a/x2"},
+        {"old_path": "a/y", "new_path": "a/./y"},
+    ))
+    assert stats.items == 2 and stats.ready == 1
+    entry = entries["x"]
+    assert entry.status == "ready"
+    assert (entry.old_path, entry.final_new_path) == (str(tree / "a" / "x"), str(tree / "a" / "x2"))
+    assert entry.item_type == "file"
+    assert "y" not in entries
+
+
+def test_folder_of_a_row_is_stat_ed_when_item_type_is_missing(tree):
+    entries, _stats = _load(_jsonl({"old_path": "a", "new_path": "b"}))
+    assert entries["a"].item_type == "folder"
+
+
+def test_target_in_another_folder_is_invalid(tree):
+    entries, stats = _load(_jsonl({"old_path": "a/x", "new_path": "x"}))
+    assert stats.invalid == 1 and stats.ready == 0
+    assert (entries["x"].status, entries["x"].message) == ("invalid", "target is not in the source's folder")
+
+
+def test_repeated_and_missing_sources_are_invalid(tree):
+    entries = list(load_plan(_jsonl(
+        {"old_path": "a/x", "new_path": "a/x2"},
+        {"old_path": "./a/x", "new_path": "a/x3"},
+        {"old_path": "a/gone", "new_path": "a/here"},
+    ), "jsonl", lambda: False, case_insensitive=False)[0])
+    messages = {os.path.basename(entry.raw_new_path): (entry.status, entry.message) for entry in entries}
+    assert messages == {
+        "x2": ("ready", ""),
+        "x3": ("invalid", "source listed more than once"),
+        "here": ("invalid", "source not found"),
+    }
+
+
+def test_conflicting_targets_are_flagged(tree):
+    entries, stats = _load(_jsonl(
+        {"old_path": "a/x", "new_path": "a/same"},
+        {"old_path": "a/y", "new_path": "a/same"},
+        {"old_path": "a/z", "new_path": "a/x"},
+    ))
+    assert stats.conflicts == 2
+    assert entries["x"].status == entries["y"].status == "conflict"
+    # x is renamed away in the same plan, so its name is free for z.
+    assert entries["z"].status == "ready"
+
+
+def test_csv_plans_and_preview_output_load(tree):
+    stream = io.StringIO("item_type,old_path,raw_new_path\nfile,a/x,a/x2\n")
+    entries, stats = _load(stream, "csv")
+    assert stats.ready == 1 and entries["x"].final_new_path == str(tree / "a" / "x2")
+
+
+@pytest.mark.parametrize(
+    "line, message",
+    [
+        ("[1, 2]", "line 1: expected an object with old_path and new_path"),
+        ('{"old_path": "a/x"}', "line 1: old_path and new_path are required"),
+        ('{"old_path": "a/x", "new_path": "a/y", "item_type": "link"}', "line 1: item_type must be file or folder"),
+        ("{", "line 1: "),
+    ],
+)
+def test_malformed_rows_raise_value_error(line, message):
+    with pytest.raises(ValueError, match="^" + message):
+        list(iter_plan(io.StringIO(line + "\n"), "jsonl"))
+
+
+def test_cancel_returns_an_empty_result(tree):
+    entries, stats = load_plan(_jsonl({"old_path": "a/x", "new_path": "a/x2"}), "jsonl", lambda: True)
+    assert len(entries) == 0 and stats.ready == 0